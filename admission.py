@@ -0,0 +1,327 @@
+# admission.py
+# Admission control and priority load shedding.
+# During a cohort launch /api/start traffic spikes; without a limit every request piles
+# up behind the slow LLM calls, the worker threads run out and everything times out,
+# including /api/finish from candidates who have already interviewed for 30 minutes.
+#
+# LLM work now needs a slot from a shared pool (ADMISSION_SLOTS). Every kind of work is a
+# "lane" with its own bounded queue, slot limit, latency budget and priority:
+#   finish (the Critic job)     priority 0: in-progress interviews come first
+#   answer (scoring an answer)  priority 1
+#   start  (/api/start, /stream)priority 2: new sessions are shed first
+#   batch  (/api/start/batch)   priority 3
+# A free slot goes to the highest-priority waiter, and the start/batch lanes can never
+# take the whole pool, so an interview that is finishing always finds a slot quickly.
+# Requests are rejected EARLY, with a Retry-After from the current wait estimate:
+#   429  the lane's queue is full (too many requests of this kind are already waiting)
+#   503  the estimated wait is over the lane's budget, or the request waited out its budget
+# Background jobs (finish, answer, batch) are never shed once accepted, they only wait their turn.
+import os
+import math
+import asyncio
+import time
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from instrumentation import get_logger, registry
+from job_queue import DEFAULT_MAX_WORKERS as JOB_QUEUE_WORKERS
+
+logger = get_logger("admission")
+
+# --- 1. Config ---
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_SLOTS = int(os.environ.get("ADMISSION_SLOTS", "8"))
+# Smoothing of the per-lane service time behind the wait estimates
+SERVICE_TIME_SMOOTHING = float(os.environ.get("ADMISSION_SERVICE_TIME_SMOOTHING", "0.2"))
+
+
+def _lane_env(lane: str, name: str, default: str) -> float:
+    return float(os.environ.get(f"ADMISSION_{lane.upper()}_{name}", default))
+
+
+ADMISSION_WAIT = registry.histogram("mvita_admission_wait_seconds", "Time requests waited for an admission slot")
+ADMISSION_SHED = registry.counter("mvita_admission_shed_total", "Requests rejected by admission control, by lane and reason")
+
+
+class AdmissionRejected(Exception):
+    """The request was shed; 'status' (429/503) and 'retry_after' (seconds) go into the HTTP response."""
+
+    def __init__(self, lane: str, reason: str, status: int, retry_after: int):
+        super().__init__(f"{lane} is overloaded ({reason}), retry in {retry_after}s")
+        self.lane, self.reason, self.status, self.retry_after = lane, reason, status, retry_after
+
+
+# --- 2. Lanes ---
+class Lane:
+    """
+    One kind of work. 'max_slots' caps its share of the pool, 'max_queue' its waiting line,
+    'budget_seconds' how long a request may wait for a slot, 'expected_seconds' seeds the
+    service time estimate until real timings come in.
+    """
+
+    def __init__(self, name: str, priority: int, max_slots: int, max_queue: int,
+                 budget_seconds: float, expected_seconds: float):
+        self.name, self.priority = name, priority
+        self.max_slots, self.max_queue = max_slots, max_queue
+        self.budget_seconds = budget_seconds
+        self.service_seconds = expected_seconds
+        self.in_flight = 0
+        self.counters = {"admitted": 0, "shed_queue_full": 0, "shed_wait_budget": 0, "shed_timeout": 0}
+
+
+def default_lanes() -> List[Lane]:
+    return [
+        # Critic jobs are the only finish work, so more slots than job workers could never be used
+        Lane("finish", 0, int(_lane_env("finish", "SLOTS", str(min(ADMISSION_SLOTS, JOB_QUEUE_WORKERS)))), int(_lane_env("finish", "QUEUE", "64")),
+             _lane_env("finish", "BUDGET_SECONDS", "60"), _lane_env("finish", "EXPECTED_SECONDS", "15")),
+        Lane("answer", 1, int(_lane_env("answer", "SLOTS", "2")), int(_lane_env("answer", "QUEUE", "256")),
+             _lane_env("answer", "BUDGET_SECONDS", "60"), _lane_env("answer", "EXPECTED_SECONDS", "3")),
+        # Starts wait in a worker thread: keep SLOTS + QUEUE below the server's threads
+        # (GUNICORN_THREADS) so /api/finish and the polls are never locked out
+        Lane("start", 2, int(_lane_env("start", "SLOTS", "4")), int(_lane_env("start", "QUEUE", "2")),
+             _lane_env("start", "BUDGET_SECONDS", "10"), _lane_env("start", "EXPECTED_SECONDS", "8")),
+        # Every LLM call of a cohort takes its own batch slot (the cohort's other calls wait in
+        # the queue, which is why it is long); the cohorts themselves queue in the batch JobQueue
+        Lane("batch", 3, int(_lane_env("batch", "SLOTS", "2")), int(_lane_env("batch", "QUEUE", "64")),
+             _lane_env("batch", "BUDGET_SECONDS", "600"), _lane_env("batch", "EXPECTED_SECONDS", "8")),
+    ]
+
+
+class _Waiter:
+    def __init__(self, lane: Lane, seq: int, on_grant: Optional[Callable[[], None]] = None):
+        self.lane, self.seq = lane, seq
+        self.granted = threading.Event()
+        self.on_grant = on_grant  # called (under the controller lock) when the slot is handed over
+
+
+# --- 3. The controller ---
+class Ticket:
+    """A granted slot. release() is idempotent, so it can be tied to the end of a streamed response."""
+
+    def __init__(self, controller: "AdmissionController", lane: Optional[Lane]):
+        self._controller, self._lane = controller, lane
+        self._started = time.perf_counter()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        if self._lane is not None:
+            self._controller._release(self._lane, time.perf_counter() - self._started)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, slots: int = ADMISSION_SLOTS, lanes: Optional[List[Lane]] = None, enabled: bool = ADMISSION_ENABLED):
+        self.slots = slots
+        self.enabled = enabled
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in (lanes if lanes is not None else default_lanes())}
+        self._in_flight = 0
+        self._waiters: List[_Waiter] = []  # kept sorted by (priority, arrival)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    # A. Public API
+    def acquire(self, lane_name: str, shed: bool = True, ahead: int = 0) -> Ticket:
+        """
+        Waits for a slot in the lane and returns its Ticket. With shed=True the request is
+        rejected early (AdmissionRejected) when the lane is full or the wait would be over budget.
+        'ahead' counts work queued elsewhere that will reach this lane first (e.g. queued Critic jobs).
+        """
+        if not self.enabled:
+            return Ticket(self, None)
+        lane = self.lanes[lane_name]
+        started = time.perf_counter()
+        with self._lock:
+            if shed:
+                self._check_locked(lane, ahead)
+            waiter = _Waiter(lane, next(self._seq))
+            self._waiters.append(waiter)
+            self._waiters.sort(key=lambda w: (w.lane.priority, w.seq))
+            self._dispatch_locked()
+        if not waiter.granted.wait(lane.budget_seconds if shed else None):
+            with self._lock:
+                if not waiter.granted.is_set():
+                    self._waiters.remove(waiter)
+                    raise self._shed_locked(lane, "timeout", 503, self._estimate_locked(lane))
+        ADMISSION_WAIT.observe(time.perf_counter() - started, lane=lane.name)
+        return Ticket(self, lane)
+
+    async def aacquire(self, lane_name: str, shed: bool = True, ahead: int = 0) -> Ticket:
+        """
+        acquire() for coroutines (asgi_server.py): the wait is a future on the event loop,
+        so a waiting request holds no thread. Same lanes, priorities and shedding.
+        """
+        if not self.enabled:
+            return Ticket(self, None)
+        lane = self.lanes[lane_name]
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def on_grant() -> None:
+            # Runs in whichever thread freed the slot; the future belongs to our loop
+            try:
+                loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+            except RuntimeError:
+                pass  # the loop is closed; the Ticket is released below or never used
+
+        with self._lock:
+            if shed:
+                self._check_locked(lane, ahead)
+            waiter = _Waiter(lane, next(self._seq), on_grant)
+            self._waiters.append(waiter)
+            self._waiters.sort(key=lambda w: (w.lane.priority, w.seq))
+            self._dispatch_locked()
+        try:
+            await asyncio.wait_for(granted, lane.budget_seconds if shed else None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if not waiter.granted.is_set():
+                    self._waiters.remove(waiter)
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    raise self._shed_locked(lane, "timeout", 503, self._estimate_locked(lane)) from None
+            if isinstance(e, asyncio.CancelledError):
+                Ticket(self, lane).release()  # granted just as we were cancelled: hand the slot on
+                raise
+        ADMISSION_WAIT.observe(time.perf_counter() - started, lane=lane.name)
+        return Ticket(self, lane)
+
+    def check(self, lane_name: str, ahead: int = 0) -> None:
+        """Rejects (AdmissionRejected) without taking a slot, e.g. before queueing a background job."""
+        if self.enabled:
+            with self._lock:
+                self._check_locked(self.lanes[lane_name], ahead)
+
+    def estimate_wait(self, lane_name: str, ahead: int = 0) -> float:
+        with self._lock:
+            return self._estimate_locked(self.lanes[lane_name], ahead)
+
+    def retry_after(self, lane_name: str, ahead: int = 0) -> int:
+        """Seconds for a Retry-After header: the current wait estimate, at least 1."""
+        return max(1, math.ceil(self.estimate_wait(lane_name, ahead)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slots": self.slots,
+                "in_flight": self._in_flight,
+                "lanes": {
+                    name: {
+                        **lane.counters,
+                        "priority": lane.priority,
+                        "in_flight": lane.in_flight,
+                        "queued": sum(1 for w in self._waiters if w.lane is lane),
+                        "max_slots": lane.max_slots,
+                        "max_queue": lane.max_queue,
+                        "budget_seconds": lane.budget_seconds,
+                        "service_seconds": round(lane.service_seconds, 3),
+                        "estimated_wait_seconds": round(self._estimate_locked(lane), 3),
+                    }
+                    for name, lane in self.lanes.items()
+                },
+            }
+
+    def depths(self, field: str) -> List:
+        """Labelled gauge values ("queued" or "in_flight") per lane, for registry.gauge_callback()."""
+        lanes = self.stats()["lanes"]
+        return [({"lane": name}, lane[field]) for name, lane in lanes.items()]
+
+    # B. Internals
+    def _check_locked(self, lane: Lane, ahead: int) -> None:
+        queued = sum(1 for w in self._waiters if w.lane is lane)
+        if queued >= lane.max_queue:
+            raise self._shed_locked(lane, "queue_full", 429, self._estimate_locked(lane, ahead))
+        wait = self._estimate_locked(lane, ahead)
+        if wait > lane.budget_seconds:
+            raise self._shed_locked(lane, "wait_budget", 503, wait)
+
+    def _estimate_locked(self, lane: Lane, ahead: int = 0) -> float:
+        """Everyone of the same or a higher priority waits first; each round of max_slots takes one service time."""
+        ahead += sum(1 for w in self._waiters if w.lane.priority <= lane.priority)
+        free = min(self.slots - self._in_flight, lane.max_slots - lane.in_flight)
+        if free > ahead:
+            return 0.0
+        rounds = (ahead - max(free, 0)) // max(1, lane.max_slots) + 1
+        return rounds * lane.service_seconds
+
+    def _shed_locked(self, lane: Lane, reason: str, status: int, wait: float) -> AdmissionRejected:
+        lane.counters[f"shed_{reason}"] += 1
+        ADMISSION_SHED.inc(lane=lane.name, reason=reason)
+        logger.warning(f"Shedding a {lane.name} request ({reason}, estimated wait {wait:.1f}s)",
+                       extra={"lane": lane.name, "reason": reason})
+        return AdmissionRejected(lane.name, reason, status, max(1, math.ceil(wait)))
+
+    def _dispatch_locked(self) -> None:
+        """Hands free slots to the waiters, highest priority first (skipping lanes at their limit)."""
+        for waiter in list(self._waiters):
+            if self._in_flight >= self.slots:
+                return
+            lane = waiter.lane
+            if lane.in_flight >= lane.max_slots:
+                continue
+            self._waiters.remove(waiter)
+            self._in_flight += 1
+            lane.in_flight += 1
+            lane.counters["admitted"] += 1
+            waiter.granted.set()
+            if waiter.on_grant is not None:
+                waiter.on_grant()
+
+    def _release(self, lane: Lane, seconds: float) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            lane.in_flight -= 1
+            lane.service_seconds += SERVICE_TIME_SMOOTHING * (seconds - lane.service_seconds)
+            self._dispatch_locked()
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    print("--- Testing admission ---")
+    lanes = [Lane("finish", 0, 4, 16, 5.0, 0.2), Lane("start", 2, 2, 2, 0.5, 0.2)]
+    controller = AdmissionController(slots=4, lanes=lanes, enabled=True)
+    outcomes: Dict[str, List] = {"finish": [], "start": []}
+
+    def request(lane: str) -> None:
+        started = time.perf_counter()
+        try:
+            with controller.acquire(lane, shed=lane != "finish"):
+                time.sleep(0.2)  # the LLM call
+            outcomes[lane].append(("ok", round(time.perf_counter() - started, 2)))
+        except AdmissionRejected as e:
+            outcomes[lane].append((e.status, e.reason, e.retry_after))
+
+    # A cohort launch: 20 starts at once, then 6 interviews finishing in the middle of it
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        for _ in range(20):
+            pool.submit(request, "start")
+        time.sleep(0.05)
+        for _ in range(6):
+            pool.submit(request, "finish")
+    for lane, results in outcomes.items():
+        done = [r[1] for r in results if r[0] == "ok"]
+        shed = [r for r in results if r[0] != "ok"]
+        print(f"{lane}: {len(done)} done (slowest {max(done, default=0):.2f}s), {len(shed)} shed, e.g. {shed[:1]}")
+    print(controller.stats()["lanes"]["start"])
+
+    async def async_starts() -> List:
+        async def one():
+            with await controller.aacquire("start"):
+                await asyncio.sleep(0.2)
+            return "ok"
+        return await asyncio.gather(*(one() for _ in range(6)), return_exceptions=True)
+
+    print("async starts:", [r if r == "ok" else r.status for r in asyncio.run(async_starts())])
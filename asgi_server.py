@@ -0,0 +1,290 @@
+# asgi_server.py
+# Async serving mode: the same /api/start, /api/finish and /api/jobs/<job_id> as flask_server.py,
+# but as a plain ASGI app that awaits the LangChain chains ('ainvoke').
+# A request waiting on the model costs one coroutine instead of one worker thread,
+# so a single process can hold hundreds of pending interviews.
+# The LLM work goes through the same admission lanes as in flask_server.py (see admission.py),
+# and the responses have the same shape, so a client can't tell the two modes apart.
+#
+# Run with any ASGI server, e.g.:
+#   uvicorn asgi_server:app --port 5000
+import os
+import json
+import time
+import uuid
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+from question_generator import agenerate_questions_node
+from critic import agenerate_critic_node
+from admission import AdmissionController, AdmissionRejected
+from job_queue import FAILED, RUNNING, SUCCEEDED, describe_job, new_job
+from job_store import JobStore
+from instrumentation import get_logger, record_error
+
+logger = get_logger("asgi_server")
+
+# The session "database" and helpers are shared with the Flask shopfront,
+# so both servers behave exactly the same (see shared_state.py). The stores block
+# (SQLite), so every call to them goes through asyncio.to_thread().
+from shared_state import (
+    WARM_UP_ON_START, report_store, session_store, save_session, critic_state_from_session, warm_up,
+)
+from report_store import transcript_hash
+
+# --- 1. Config ---
+# How many requests may be inside the app at once (waiting on the model included)
+MAX_IN_FLIGHT = int(os.environ.get("ASGI_MAX_IN_FLIGHT", "256"))
+# How long a request may wait for a free slot before we answer 503
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ASGI_QUEUE_TIMEOUT_SECONDS", "30"))
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+# Admission control, as in flask_server.py: /api/finish beats new /api/start sessions,
+# and overload is shed early with 429/503 + Retry-After (see admission.py)
+admission = AdmissionController()
+
+# Critic job records; with JOB_STORE_PATH they are shared with flask_server.py workers (see job_store.py)
+job_store = JobStore()
+CRITIC_QUEUE = "critic"
+
+_in_flight: Optional[asyncio.Semaphore] = None
+
+
+def _semaphore() -> asyncio.Semaphore:
+    # Created lazily so it binds to the event loop the server is running
+    global _in_flight
+    if _in_flight is None:
+        _in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+    return _in_flight
+
+
+# --- 2. API Endpoint 1: /api/start ---
+async def start_interview_session(data: Dict) -> Tuple[int, Dict]:
+    logger.info("[ASGI /start]: Received new session request")
+    cv_text = data.get("cv_text")
+    if not cv_text:
+        return 400, {"error": "cv_text missing"}
+
+    state_for_questions = {
+        "cv_text": cv_text,
+        "job_role": data.get("job_role"),
+        "job_company": data.get("job_company"),
+        "job_country": data.get("job_country")
+    }
+    # The start lane's slot is only taken for the LLM call (cache and near-duplicate hits don't need one)
+    question_result = await agenerate_questions_node(state_for_questions, llm_slot=lambda: admission.aacquire("start"))
+    if "error" in question_result:
+        return 500, {"error": question_result["error"]}
+
+    questions = question_result.get("questions")
+    session_id = await asyncio.to_thread(save_session, state_for_questions, questions, question_result.get("cv_compact"))
+    logger.info(f"[ASGI /start]: Session {session_id} created. Returning questions.", extra={"session_id": session_id})
+    return 200, {
+        "session_id": session_id,
+        "questions": questions,
+        "cached": question_result.get("cached", False),
+        "cv_tokens": question_result.get("cv_tokens")
+    }
+
+
+# --- 3. API Endpoint 2: /api/finish (+ /api/jobs/<job_id>) ---
+# The same contract as flask_server.py: 202 with a job id, and the client polls /api/jobs/<job_id>.
+# A stored report comes back at once (200); a retry joins the job that is writing it (202, "coalesced").
+# The Critic runs as a task on the event loop instead of in a worker thread, but its job record
+# and claim live in the job store like the Flask ones (same queue name, same claim key).
+_critic_tasks: Set["asyncio.Task"] = set()  # keeps the running jobs referenced
+
+
+def _report_body(report: Dict) -> Dict:
+    return {"job_id": None, "status": "succeeded", "cached": True, "result": {"final_review": report}}
+
+
+async def _run_critic_job(job_id: str, session_id: str, digest: str, state_for_critic: Dict) -> None:
+    """Background job body, like flask_server.run_critic_job: runs the Critic, stores the report, cleans up."""
+    async def update(**fields) -> None:
+        await asyncio.to_thread(job_store.update, job_id, **fields)
+
+    await update(status=RUNNING, stage=RUNNING, started_at=time.time())
+    try:
+        await update(stage="waiting_for_slot")
+        with await admission.aacquire("finish", shed=False):  # the highest-priority lane, never shed once queued
+            await update(stage="running_critic")
+            critic_result = await agenerate_critic_node(state_for_critic)
+        if "error" in critic_result:
+            raise Exception(critic_result["error"])
+
+        await update(stage="cleaning_up")
+        await asyncio.to_thread(report_store.put, session_id, digest, critic_result.get("final_review"))
+        await asyncio.to_thread(session_store.delete, session_id)
+        result = {"final_review": critic_result.get("final_review")}
+        if "sections" in critic_result:
+            result["sections"] = critic_result["sections"]
+    except Exception as e:
+        logger.error(f"ERROR in {CRITIC_QUEUE} job {job_id}: {e}", extra={"queue": CRITIC_QUEUE, "job_id": job_id})
+        await update(status=FAILED, stage=FAILED, error=str(e), finished_at=time.time())
+        return
+    logger.info("[ASGI /finish]: Final review ready.", extra={"session_id": session_id, "job_id": job_id})
+    await update(status=SUCCEEDED, stage=SUCCEEDED, result=result, finished_at=time.time())
+
+
+async def finish_interview_session(data: Dict) -> Tuple[int, Dict]:
+    logger.info("[ASGI /finish]: Received finish request")
+    session_id = data.get("session_id")
+    transcript = data.get("transcript")
+    if not session_id or not transcript:
+        return 400, {"error": "Missing session_id or transcript"}
+
+    # A. Already written?
+    key = (session_id, transcript_hash(transcript))
+    report = await asyncio.to_thread(report_store.get, *key)
+    if report is not None:
+        return 200, _report_body(report)
+
+    # B. ...or being written right now (by any worker)? Then join that job
+    claim_key = f"{CRITIC_QUEUE}:{':'.join(key)}"
+    job = new_job(uuid.uuid4().hex)
+    job_id = await asyncio.to_thread(job_store.claim, claim_key, CRITIC_QUEUE, job)
+    if job_id != job["job_id"]:
+        held = await asyncio.to_thread(job_store.get, job_id, CRITIC_QUEUE)
+        if held is not None and held["status"] == SUCCEEDED:
+            return 200, _report_body(held["result"]["final_review"])
+        return 202, {"job_id": job_id, "status": held["status"] if held else "queued", "coalesced": True,
+                     "status_url": f"/api/jobs/{job_id}"}
+
+    # C. Retrieve the session, and shed early if the report could not be written within its budget
+    session_data = await asyncio.to_thread(session_store.get, session_id)
+    if not session_data:
+        await asyncio.to_thread(job_store.release, claim_key, job_id)
+        return 404, {"error": "Session not found or expired"}
+    try:
+        admission.check("finish")  # queued Critics already wait in the lane, nothing else is ahead
+    except AdmissionRejected:
+        await asyncio.to_thread(job_store.release, claim_key, job_id)
+        raise
+
+    # D. Start the Critic in the background and tell the client where to collect the report
+    state_for_critic = critic_state_from_session(session_data, transcript)
+    task = asyncio.ensure_future(_run_critic_job(job_id, session_id, key[1], state_for_critic))
+    _critic_tasks.add(task)
+    task.add_done_callback(_critic_tasks.discard)
+    logger.info(f"[ASGI /finish]: Critic job {job_id} queued.", extra={"session_id": session_id, "job_id": job_id})
+    return 202, {"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"}
+
+
+async def get_job_status(job_id: str) -> Tuple[int, Dict]:
+    job = await asyncio.to_thread(job_store.get, job_id, CRITIC_QUEUE)
+    if job is None:
+        return 404, {"error": "Job not found or expired"}
+    return 200, describe_job(job)
+
+
+ROUTES = {
+    ("POST", "/api/start"): start_interview_session,
+    ("POST", "/api/finish"): finish_interview_session,
+}
+# Routes ending in a path parameter: the rest of the path is passed to the handler
+PREFIX_ROUTES = {
+    ("GET", "/api/jobs/"): get_job_status,
+}
+
+
+def _route(method: str, path: str):
+    handler = ROUTES.get((method, path))
+    if handler is not None:
+        return handler
+    for (route_method, prefix), param_handler in PREFIX_ROUTES.items():
+        param = path[len(prefix):]
+        if method == route_method and path.startswith(prefix) and param and "/" not in param:
+            return lambda data: param_handler(param)
+    return None
+
+
+# --- 4. The ASGI app itself ---
+async def _read_json(receive) -> Dict:
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return json.loads(body or b"{}")
+
+
+async def _send_json(send, status: int, payload: Dict, extra_headers: List[Tuple[bytes, bytes]] = ()) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        *CORS_HEADERS,
+        *extra_headers,
+    ]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            logger.info("Starting Job Interview Agent Backend (ASGI)")
+            if WARM_UP_ON_START:
+                await asyncio.to_thread(warm_up)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if method == "OPTIONS":
+        # CORS preflight, same "allow everything" policy as flask_server.py
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    handler = _route(method, path)
+    if handler is None:
+        await _send_json(send, 404, {"error": "Not found"})
+        return
+
+    try:
+        data = await _read_json(receive)
+    except ValueError:
+        await _send_json(send, 400, {"error": "Invalid JSON body"})
+        return
+
+    semaphore = _semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        await _send_json(send, 503, {"error": "Server busy, please retry"})
+        return
+
+    extra_headers = []
+    try:
+        status, payload = await handler(data)
+    except AdmissionRejected as rejected:
+        # Same body and Retry-After as flask_server.rejection_response
+        status = rejected.status
+        payload = {"error": "The server is busy, please retry", "reason": rejected.reason,
+                   "retry_after": rejected.retry_after}
+        extra_headers = [(b"retry-after", str(rejected.retry_after).encode())]
+    except Exception as e:
+        logger.error(f"ERROR in {path}: {e}")
+        record_error(path.lstrip("/"), e)
+        status, payload = 500, {"error": str(e)}
+    finally:
+        semaphore.release()
+    await _send_json(send, status, payload, extra_headers)
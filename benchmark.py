@@ -0,0 +1,373 @@
+# benchmark.py
+# Offline load test for the Flask API.
+# The ChatOpenAI models in question_generator.py and critic.py are swapped for the
+# local FakeInterviewLLM (fake_llm.py), so a run costs nothing and is repeatable.
+# Every scenario is driven through the Flask test client at increasing concurrency,
+# and the results (throughput, latency percentiles, memory) are written as JSON.
+#
+# Usage:
+#   python benchmark.py                                   # all scenarios, default levels
+#   python benchmark.py --scenarios start,finish --concurrency 1,8,32 --requests 200
+#   python benchmark.py --latency lognormal:0.8,0.5 --output results.json
+#   python benchmark.py --baseline results.json           # exit code 1 on a regression
+#   python benchmark.py --cold-start 5                    # import / warm-up / first request timings
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+# The fake model needs no key, but ChatOpenAI refuses to build without one,
+# and per-request INFO logs would drown the results.
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# The "start" CVs differ by one line, so the near-duplicate index would answer them all;
+# it is off (the default) unless SIMILAR_INDEX_ENABLED=1 is set explicitly, and never writes to disk here.
+os.environ.setdefault("SIMILAR_INDEX_ENABLED", "0")
+os.environ.setdefault("SIMILAR_INDEX_PATH", "")
+os.environ.setdefault("REPORT_STORE_PATH", "")  # keep benchmark reports out of reports.db
+# Measure the pipeline itself; ADMISSION_ENABLED=1 shows how much load shedding turns away (429/503)
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+from fake_llm import FakeInterviewLLM
+
+SAMPLE_CV = """Jane Doe
+jane@example.com | London
+Experience
+Software Engineer, Acme Ltd (2021-2024)
+- Built a Flask + Vue.js booking platform used by 20k students
+- Cut API latency by 40% with Redis caching
+Projects
+Interview coach: LangChain agent that generates mock interview questions
+Skills
+Python, Flask, Vue.js, PostgreSQL, Docker
+Education
+BSc Computer Science, University of London
+"""
+
+SAMPLE_TRANSCRIPT = "\n".join([
+    "assistant: Tell me about a time you disagreed with a teammate. How did you resolve it?",
+    "user: In my last project we disagreed about the database, so I set up a short meeting and we compared both options.",
+    "assistant: Why did you choose this tech stack for the main project on your CV?",
+    "user: Flask was quick to build with and Vue.js let us share components across pages.",
+    "assistant: How would you optimise a slow database query for a large dataset?",
+    "user: I would look at the query plan first, add the missing index and cache hot results.",
+])
+
+DEFAULT_SCENARIOS = ["start", "start_cached", "finish", "interview"]
+DEFAULT_CONCURRENCY = [1, 4, 16, 64]
+POLL_INTERVAL_SECONDS = 0.02
+
+
+# --- 1. Helpers ---
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = q * (len(ordered) - 1)
+    low, high = int(rank), min(int(rank) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def rss_mb() -> float:
+    """Current resident memory of this process (Linux /proc), falling back to the peak."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class RequestFailed(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"HTTP {status} {message}".strip())
+        self.status = status
+
+
+# --- 2. Scenarios ---
+# Each scenario is a callable(client, i) that performs one "operation" and raises
+# RequestFailed on a non-success status. Setup that should not be timed happens outside.
+class Scenarios:
+    def __init__(self, server):
+        self.server = server
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _unique(self) -> int:
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def _start(self, client, cv_text: str) -> str:
+        response = client.post("/api/start", json={
+            "cv_text": cv_text, "job_role": "Backend Engineer", "job_company": "Acme", "job_country": "UK",
+        })
+        if response.status_code != 200:
+            raise RequestFailed(response.status_code, "/api/start")
+        return response.get_json()["session_id"]
+
+    def _finish(self, client, session_id: str) -> None:
+        response = client.post("/api/finish", json={"session_id": session_id, "transcript": SAMPLE_TRANSCRIPT})
+        if response.status_code != 202:
+            raise RequestFailed(response.status_code, "/api/finish")
+        status_url = response.get_json()["status_url"]
+        while True:
+            job = client.get(status_url).get_json()
+            if job["status"] == "succeeded":
+                return
+            if job["status"] == "failed":
+                raise RequestFailed(500, f"critic job failed: {job.get('error')}")
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+    # A. /api/start with a new CV every time (always a cache miss)
+    def start(self, client) -> None:
+        self._start(client, f"{SAMPLE_CV}\nCandidate #{self._unique()}")
+
+    # B. /api/start with the same CV every time (question cache hits)
+    def start_cached(self, client) -> None:
+        self._start(client, SAMPLE_CV)
+
+    # C. /api/finish until the report is ready; the session is created untimed
+    def finish_setup(self) -> str:
+        state = {"cv_text": f"{SAMPLE_CV}\nCandidate #{self._unique()}", "job_role": "Backend Engineer",
+                 "job_company": "Acme", "job_country": "UK"}
+        return self.server.save_session(state, {"general_questions": [], "cv_based_questions": [],
+                                                "technical_questions": []})
+
+    def finish(self, client, session_id: str) -> None:
+        self._finish(client, session_id)
+
+    # D. A whole interview: start, then finish and wait for the report
+    def interview(self, client) -> None:
+        session_id = self._start(client, f"{SAMPLE_CV}\nCandidate #{self._unique()}")
+        self._finish(client, session_id)
+
+
+# --- 3. Runner ---
+def run_level(operation: Callable, setup: Callable, app, concurrency: int, requests: int) -> Dict:
+    """Runs 'requests' operations with 'concurrency' in flight and summarizes them."""
+    inputs = [setup() for _ in range(requests)] if setup else [None] * requests
+    latencies: List[float] = []
+    status_codes: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def one(arg):
+        client = app.test_client()
+        started = time.perf_counter()
+        code = 200
+        try:
+            operation(client, arg) if setup else operation(client)
+        except RequestFailed as e:
+            code = e.status
+        except Exception:
+            code = 599
+        elapsed = time.perf_counter() - started
+        with lock:
+            status_codes[str(code)] = status_codes.get(str(code), 0) + 1
+            if code < 400:
+                latencies.append(elapsed)
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, inputs))
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": requests - len(latencies),
+        "status_codes": status_codes,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(1000 * sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            "p50": round(1000 * percentile(latencies, 0.50), 1),
+            "p95": round(1000 * percentile(latencies, 0.95), 1),
+            "p99": round(1000 * percentile(latencies, 0.99), 1),
+            "max": round(1000 * max(latencies), 1) if latencies else 0.0,
+        },
+        "memory_mb": {"rss_before": rss_before, "rss_after": rss_mb(), "peak_rss": peak_rss_mb()},
+    }
+
+
+def run(args) -> Dict:
+    import flask_server
+    import question_generator
+    import critic
+
+    fake = FakeInterviewLLM(latency=args.latency, seed=args.seed, error_rate=args.error_rate)
+    question_generator.use_llm(fake)
+    critic.use_llm(fake)
+
+    scenarios = Scenarios(flask_server)
+    results = []
+    for name in args.scenarios:
+        setup = scenarios.finish_setup if name == "finish" else None
+        operation = getattr(scenarios, name)
+        run_level(operation, setup, flask_server.app, 1, 1)  # warm-up, not reported
+        for concurrency in args.concurrency:
+            result = {"scenario": name, **run_level(operation, setup, flask_server.app, concurrency, args.requests)}
+            results.append(result)
+            latency = result["latency_ms"]
+            print(
+                f"{name:<13} c={concurrency:<4} {result['throughput_rps']:>8} req/s  "
+                f"p50={latency['p50']:>8}ms  p99={latency['p99']:>8}ms  "
+                f"errors={result['errors']:<4} rss={result['memory_mb']['rss_after']}MB",
+                file=sys.stderr,
+            )
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": round(time.time(), 3),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "seed": args.seed,
+            "error_rate": args.error_rate,
+            "requests_per_level": args.requests,
+        },
+        "results": results + ([cold_start(args.cold_start)] if args.cold_start else []),
+    }
+
+
+# --- 4. Cold start ---
+# Every run is a fresh interpreter, like a new worker after a scale-up.
+# "import" times the imports only, "first_request" the first /api/start on the fake
+# model without warm-up (it builds the chain), "warm_up" the real ChatOpenAI warm-up.
+COLD_START_PROBE = r"""
+import json, sys, time
+probe = sys.argv[1]
+started = time.perf_counter()
+import question_generator, critic
+nodes_seconds = time.perf_counter() - started
+nodes_import_web_stack = "flask" in sys.modules
+import flask_server
+result = {
+    "import_nodes_seconds": nodes_seconds,
+    "import_server_seconds": time.perf_counter() - started,
+    "nodes_import_web_stack": nodes_import_web_stack,
+    "langchain_openai_imported": "langchain_openai" in sys.modules,
+}
+if probe == "warm_up":
+    started = time.perf_counter()
+    flask_server.warm_up()
+    result["warm_up_seconds"] = time.perf_counter() - started
+else:
+    from fake_llm import FakeInterviewLLM
+    question_generator.use_llm(FakeInterviewLLM())
+    client = flask_server.app.test_client()
+    for name in ("first_request_seconds", "second_request_seconds"):
+        started = time.perf_counter()
+        client.post("/api/start", json={"cv_text": name, "job_role": "r", "job_company": "c", "job_country": "UK"})
+        result[name] = time.perf_counter() - started
+print(json.dumps(result))
+"""
+
+
+def cold_start(runs: int) -> Dict:
+    samples: Dict[str, List] = {}
+    for _ in range(runs):
+        for probe in ("first_request", "warm_up"):
+            output = subprocess.run(
+                [sys.executable, "-c", COLD_START_PROBE, probe], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout.strip().splitlines()[-1]
+            for key, value in json.loads(output).items():
+                samples.setdefault(key, []).append(value)
+
+    summary = {}
+    for key, values in samples.items():
+        if isinstance(values[0], bool):
+            summary[key] = all(values)
+        else:
+            summary[key] = {"p50_ms": round(1000 * percentile(values, 0.5), 1),
+                            "max_ms": round(1000 * max(values), 1)}
+    return {"scenario": "cold_start", "runs": runs, **summary}
+
+
+# --- 5. Regression check ---
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Lists every (scenario, concurrency) whose p99 grew or throughput fell by more than 'tolerance'."""
+    previous = {(r["scenario"], r.get("concurrency")): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["scenario"], result.get("concurrency")))
+        if not before or "latency_ms" not in result:
+            continue
+        label = f"{result['scenario']} c={result['concurrency']}"
+        p99_now, p99_before = result["latency_ms"]["p99"], before["latency_ms"]["p99"]
+        if p99_before and p99_now > p99_before * (1 + tolerance):
+            regressions.append(f"{label}: p99 {p99_before}ms -> {p99_now}ms")
+        rps_now, rps_before = result["throughput_rps"], before["throughput_rps"]
+        if rps_before and rps_now < rps_before * (1 - tolerance):
+            regressions.append(f"{label}: throughput {rps_before} -> {rps_now} req/s")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the MVITA Flask API")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"comma separated, any of {DEFAULT_SCENARIOS}")
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)),
+                        help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="operations per concurrency level")
+    parser.add_argument("--latency", default="lognormal:0.2,0.4", help="fake LLM latency spec (see fake_llm.py)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake LLM calls that fail")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--cold-start", type=int, default=0, metavar="RUNS",
+                        help="also measure cold start over RUNS fresh processes")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(DEFAULT_SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {sorted(unknown)}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
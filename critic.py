@@ -1,9 +1,22 @@
 import os
-from typing import List, Dict
-from langchain_openai import ChatOpenAI
+import re
+import asyncio
+import json
+import time
+import threading
+from functools import partial
+from typing import Any, List, Dict, Optional, Tuple
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from pydantic import BaseModel, Field
+from langchain_core.runnables import RunnableLambda, RunnableParallel
+from pydantic import BaseModel, Field, create_model
+
+from structured_output import RepairingJsonOutputParser, conform
+from prompt_layout import compile_prompt, country_guidance
+from resilience import LLM_DEADLINE_SECONDS, ResilientLLM, build_fallback_llm
+from cv_compactor import CRITIC_CV_TOKEN_BUDGET, compact_cv, count_tokens
+from instrumentation import get_logger, instrument_node, metrics_callbacks
+
+logger = get_logger("critic")
 
 # --- Optional: Import your workflow state type ---
 try:
@@ -36,21 +49,23 @@ class PostInterviewReport(BaseModel):
         description="Optional actions AI can take to help candidate improve"
     )
 
-# --- 2. Initialize LLM and JSON parser ---
-os.environ["OPENAI_API_KEY"] = ""  # <- Add your key here
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
-parser = JsonOutputParser(pydantic_object=PostInterviewReport)
+# --- 2. LLM settings (the model and chains are built lazily, see section 4c) ---
+os.environ.setdefault("OPENAI_API_KEY", "")  # <- Add your key here
+MODEL_NAME = "gpt-4o-mini"
 
 # --- 3. Create the Prompt ---
-PROMPT_TEMPLATE = """
-You are an expert HR who is an elite in the field of interviewing and shortlisting candidates. You have been working in multiple countries and you are now working in {country}. You are very aware of the culture norms and interview etiquette of the current country you are working in. While following the country's cultural norm yourself, you will also require the candidate to be able to fit in the cultural norm.
+# Every prompt is a static prefix (instructions, examples, format instructions) and a
+# per-request suffix, so the prefix is byte-identical across requests and the provider
+# can cache it (see prompt_layout.py). Never put a per-request placeholder in a prefix.
+PROMPT_PREFIX = """
+You are an expert HR who is an elite in the field of interviewing and shortlisting candidates. You have been working in multiple countries. The country you are working in now, and its interview culture, are given with the candidate's details after these instructions. You are very aware of the culture norms and interview etiquette of the current country you are working in. While following the country's cultural norm yourself, you will also require the candidate to be able to fit in the cultural norm.
 
 SITUATION
 
-The user has uploaded:
-    •   Their CV/resume ({cv_text})
-    •   The job title and company ({job_role} at {job_company})
-    •   The transcript or summary of their mock interview ({interview_transcript})
+The user has uploaded (given after these instructions):
+    •   Their CV/resume
+    •   The job title and company
+    •   The transcript or summary of their mock interview
 
 Your goal is to evaluate how well the candidate performed in their interview, assess whether they would fit in the company and the culture, and provide a detailed report on their performance. You must act and decide like a real HR. You must not blindly appreciate, nor blindly reject the candidate without a proper reason that would make the management satisfy. This is your last chance to prove to the management team that you are able to select correct candidate and provide a valuable report. If you blindly pass or fail a candidate this time, you will be fired. 
 
@@ -190,31 +205,634 @@ Next Steps (Agentic AI Actions):
 {format_instructions}
 """
 
-prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-prompt = prompt.partial(format_instructions=parser.get_format_instructions())
+PROMPT_SUFFIX = """{country_guidance}
+
+CANDIDATE
+
+Job: {job_role} at {job_company}
+
+CV/resume:
+---
+{cv_text}
+---
+
+Interview transcript:
+---
+{interview_transcript}
+---
+"""
+
+# --- 4b. Map-reduce Critic (for long transcripts) ---
+# Instead of one huge call, the transcript is split into question/answer turns,
+# every turn is scored concurrently with a short prompt ("map"), and a final call
+# turns the short per-turn evaluations into the usual PostInterviewReport ("reduce").
+# Latency then follows the longest turn, not the length of the whole interview.
+#
+# CRITIC_MODE: "single" (one call, the default), "chunked" (always map-reduce),
+#              "auto" (map-reduce once the transcript is longer than CRITIC_CHUNKED_MIN_CHARS)
+#              or "sectioned" (the report is written in concurrent sections, see 4e)
+CRITIC_MODE = os.environ.get("CRITIC_MODE", "single")
+CRITIC_CHUNKED_MIN_CHARS = int(os.environ.get("CRITIC_CHUNKED_MIN_CHARS", "12000"))
+CRITIC_MAX_CONCURRENCY = int(os.environ.get("CRITIC_MAX_CONCURRENCY", "8"))
+
+class SegmentEvaluation(BaseModel):
+    topic: str = Field(description="Short name of the skill or topic this answer shows (e.g. Teamwork)")
+    score: int = Field(description="Answer quality from 1 (poor) to 5 (excellent)")
+    strengths: List[str] = Field(description="What the candidate did well in this answer")
+    weaknesses: List[str] = Field(description="What was missing or weak in this answer")
+    cultural_fit: str = Field(description="One sentence on how well the answer fits the local interview culture")
+    evidence: str = Field(description="A short quote or paraphrase from the answer backing the score")
+
+SEGMENT_PROMPT_PREFIX = """
+You are an expert HR interviewer. The country you are working in and the job you are hiring for are given after these instructions.
+Evaluate ONE answer from a mock interview. Be strict and fair: a vague or very short answer scores low,
+a specific, structured answer with real examples scores high.
+
+{format_instructions}
+"""
+
+SEGMENT_PROMPT_SUFFIX = """{country_guidance}
+
+You are hiring for {job_role} at {job_company}.
+
+Question ({category}):
+---
+{question}
+---
+
+Candidate's answer (follow-up questions included):
+---
+{answer}
+---
+"""
+
+REDUCE_PROMPT_PREFIX = """
+You are an expert HR who is an elite in the field of interviewing and shortlisting candidates.
+The country you are working in, the job, the candidate's CV and the evaluations are given after these instructions.
+Every answer of the interview has already been evaluated by your team, one answer at a time.
+
+Write the Post-Interview Intelligence Report from these evaluations. Decide like a real HR: do not blindly
+pass or fail the candidate, every judgement must be backed by the evaluations.
+Include: a 3-4 sentence performance summary, a PASS / FAIL decision, 3-5 strengths, 2-4 weaknesses,
+a fit assessment (Skill Fit, Behavioral Fit, Growth Potential, each with Score and Justification),
+topic ratings (each with Rating 1-5 and Reasoning), an improvement plan (Issue, Why it matters,
+Action Step, Timeline) and one or more agentic follow-up actions.
+
+{format_instructions}
+"""
+
+REDUCE_PROMPT_SUFFIX = """{country_guidance}
+
+The candidate interviewed for {job_role} at {job_company}. Their CV:
+---
+{cv_text}
+---
+
+The evaluations of every answer:
+---
+{segment_evaluations}
+---
+"""
+
+# --- 4c. Connect chains (lazily) ---
+# Importing langchain_openai and building the client, prompts and parsers is slow,
+# so every chain is built on first use instead of at import time (fast worker cold start).
+# warm_up() builds them ahead of time, e.g. from the gunicorn post_fork hook.
+# name -> (prompt prefix, prompt suffix, output model, required fields, metrics label)
+REPORT_REQUIRED_FIELDS = ("performance_summary", "decision")
+CHAIN_SPECS = {
+    "answer": (PROMPT_PREFIX, PROMPT_SUFFIX, PostInterviewReport, REPORT_REQUIRED_FIELDS, "critic"),
+    "segment": (SEGMENT_PROMPT_PREFIX, SEGMENT_PROMPT_SUFFIX, SegmentEvaluation, ("topic", "score"), "critic_segment"),
+    "reduce": (REDUCE_PROMPT_PREFIX, REDUCE_PROMPT_SUFFIX, PostInterviewReport, REPORT_REQUIRED_FIELDS, "critic_reduce"),
+}
+
+_chain_lock = threading.Lock()
+_llm = None
+_chains: Dict[str, Any] = {}
+
+def chain_prompt(name: str) -> ChatPromptTemplate:
+    """The compiled prompt of a chain: the static prefix rendered once, the suffix per request."""
+    prefix, suffix, output_model, _, _ = CHAIN_SPECS[name]
+    format_instructions = RepairingJsonOutputParser(pydantic_object=output_model).get_format_instructions()
+    return compile_prompt(prefix, suffix, format_instructions=format_instructions)
+
+def _build_chain(name: str, llm):
+    _, _, output_model, required_fields, label = CHAIN_SPECS[name]
+    # Deadline, hedging and circuit breaker around the model, see resilience.py
+    model = ResilientLLM(label, llm, fallback=build_fallback_llm(temperature=0.3))
+    # Broken JSON is repaired locally (or, last resort, fixed by a short LLM call), see structured_output.py
+    parser = RepairingJsonOutputParser(pydantic_object=output_model, required_fields=required_fields, fix_llm=model)
+    return (chain_prompt(name) | model | parser).with_config(**metrics_callbacks(label))
+
+def get_chain(name: str):
+    """Returns the "answer", "segment" or "reduce" chain, building it (once, thread-safely) on first use."""
+    global _llm
+    chain = _chains.get(name)
+    if chain is not None:
+        return chain
+    with _chain_lock:
+        if name not in _chains:
+            if _llm is None:
+                from llm_client import get_chat_model  # shared pool + rate limiter, see llm_client.py
+                _llm = get_chat_model(MODEL_NAME, 0.3, timeout_seconds=LLM_DEADLINE_SECONDS)
+            _chains[name] = _build_chain(name, _llm)
+        return _chains[name]
+
+def use_llm(new_llm) -> None:
+    """Swaps the chat model; the chains are rebuilt on next use (used by benchmark.py to plug in the fake LLM)."""
+    global _llm
+    with _chain_lock:
+        _llm = new_llm
+        _chains.clear()
+
+def warm_up() -> None:
+    """Builds every chain and loads the tokenizer now, so the first /api/finish doesn't pay for it."""
+    for name in CHAIN_SPECS:
+        get_chain(name)
+    count_tokens("warm up")
+
+_TURN = re.compile(r"^\s*([A-Za-z_ ]{1,20}):\s?(.*)$")
+CANDIDATE_ROLES = {"user", "candidate", "human", "interviewee"}
+
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "to", "of", "in", "on", "for", "with", "about", "me", "you", "your",
+    "i", "we", "it", "that", "this", "is", "are", "was", "were", "do", "did", "can", "could", "would",
+    "how", "what", "why", "when", "tell", "more", "please", "have", "has",
+}
+
+def _words(text: str) -> set:
+    return set(re.findall(r"[a-z0-9']+", text.casefold())) - _STOPWORDS
+
+def _turns(transcript: Any) -> List[Dict[str, str]]:
+    """Turns the transcript into [{"role", "content"}]. Accepts the Vue.js "role: content" text or a list of dicts."""
+    if isinstance(transcript, list):
+        return [{"role": str(t.get("role", "")), "content": str(t.get("content", ""))} for t in transcript]
+    turns: List[Dict[str, str]] = []
+    for line in str(transcript).splitlines():
+        match = _TURN.match(line)
+        if match:
+            turns.append({"role": match.group(1).strip(), "content": match.group(2)})
+        elif turns and line.strip():
+            turns[-1]["content"] += "\n" + line  # multi-line message
+    return turns
+
+def _planned(questions: Optional[Dict[str, List[str]]]) -> List[Tuple[str, str, set]]:
+    return [(category, question, _words(question)) for category, items in (questions or {}).items() for question in items]
+
+def match_planned_question(text: str, planned: List[Tuple[str, str, set]]) -> Optional[Tuple[str, str]]:
+    """(category, planned question) the interviewer's wording refers to (word overlap >= 0.6), or None."""
+    if not planned:
+        return None
+    words = _words(text)
+    best = max((len(words & qwords) / max(len(qwords), 1), category, question) for category, question, qwords in planned)
+    return (best[1], best[2]) if best[0] >= 0.6 else None
+
+def split_transcript(transcript: Any, questions: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, str]]:
+    """
+    Splits a transcript into question/answer segments:
+        [{"question", "category", "answer"}]
+    A new segment starts when the interviewer asks one of the planned 'questions'
+    (from the session); other interviewer turns count as follow-ups of the current segment.
+    Without planned questions, every interviewer turn starts a segment.
+    """
+    planned = _planned(questions)
+    segments: List[Dict[str, str]] = []
+    for turn in _turns(transcript):
+        content = turn["content"].strip()
+        if not content:
+            continue
+        if turn["role"].casefold() in CANDIDATE_ROLES:
+            if not segments:
+                segments.append({"question": "(introduction)", "category": "general", "answer": ""})
+            segments[-1]["answer"] = (segments[-1]["answer"] + "\n" + content).strip()
+            continue
+
+        match = match_planned_question(content, planned)
+        if match and segments and segments[-1]["question"] == match[1]:
+            match = None  # the same question asked again is a follow-up
+        if match or not planned or not segments:
+            segments.append({
+                "question": match[1] if match else content,
+                "category": match[0] if match else "general",
+                "answer": "",
+            })
+        else:
+            segments[-1]["answer"] = (segments[-1]["answer"] + "\n[Follow-up] " + content).strip()
+    return [segment for segment in segments if segment["answer"]]
+
+def segment_inputs(state: InterviewWorkflowState, segment: Dict[str, str]) -> Dict:
+    return {
+        "country": state["job_country"],
+        "country_guidance": country_guidance(state["job_country"]),
+        "job_role": state["job_role"],
+        "job_company": state["job_company"],
+        "category": segment["category"],
+        "question": segment["question"],
+        "answer": segment["answer"],
+    }
+
+def reduce_inputs(state: InterviewWorkflowState, evaluations: List[Dict]) -> Dict:
+    inputs = critic_inputs(state)
+    del inputs["interview_transcript"]
+    inputs["segment_evaluations"] = json.dumps(evaluations, ensure_ascii=False, indent=1)
+    return inputs
+
+def use_chunked_critic(state: InterviewWorkflowState) -> bool:
+    if CRITIC_MODE == "chunked":
+        return True
+    if CRITIC_MODE == "auto":
+        return len(str(state.get("interview_transcript", ""))) >= CRITIC_CHUNKED_MIN_CHARS
+    return False
+
+def _collect_evaluations(segments: List[Dict], results: List[Any]) -> List[Dict]:
+    evaluations = []
+    for segment, result in zip(segments, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not score segment '{segment['question'][:40]}': {result}")
+            continue
+        evaluations.append({"question": segment["question"], "category": segment["category"], **result})
+    return evaluations
+
+@instrument_node("critic_chunked")
+def generate_critic_node_chunked(state: InterviewWorkflowState) -> Dict:
+    """
+    Map-reduce version of generate_critic_node: scores every question/answer
+    segment concurrently, then reduces the scores into a PostInterviewReport.
+    """
+    logger.info("[Node]: Running Post-Interview Analysis (map-reduce)")
+    try:
+        segments = split_transcript(state["interview_transcript"], state.get("questions"))
+        if not segments:
+            logger.info("[Node]: Transcript has no answers to split, using the single-call Critic")
+            return generate_critic_node(state, allow_chunked=False)
+        logger.info(f"[Node]: Scoring {len(segments)} segments")
+        results = get_chain("segment").batch(
+            [segment_inputs(state, segment) for segment in segments],
+            config={"max_concurrency": CRITIC_MAX_CONCURRENCY},
+            return_exceptions=True,
+        )
+        evaluations = _collect_evaluations(segments, results)
+        if not evaluations:
+            raise Exception("every transcript segment failed to score")
+        report = get_chain("reduce").invoke(reduce_inputs(state, evaluations))
+        return {"final_review": report, "segment_evaluations": evaluations}
+    except Exception as e:
+        logger.error(f"ERROR in Post-Interview Analysis Node (map-reduce): {e}")
+        return {"error": f"Failed to generate report: {e}"}
+
+@instrument_node("critic_chunked")
+async def agenerate_critic_node_chunked(state: InterviewWorkflowState) -> Dict:
+    """Async twin of generate_critic_node_chunked."""
+    logger.info("[Node]: Running Post-Interview Analysis (map-reduce, async)")
+    try:
+        segments = split_transcript(state["interview_transcript"], state.get("questions"))
+        if not segments:
+            return await agenerate_critic_node(state, allow_chunked=False)
+        results = await get_chain("segment").abatch(
+            [segment_inputs(state, segment) for segment in segments],
+            config={"max_concurrency": CRITIC_MAX_CONCURRENCY},
+            return_exceptions=True,
+        )
+        evaluations = _collect_evaluations(segments, results)
+        if not evaluations:
+            raise Exception("every transcript segment failed to score")
+        report = await get_chain("reduce").ainvoke(await asyncio.to_thread(reduce_inputs, state, evaluations))
+        return {"final_review": report, "segment_evaluations": evaluations}
+    except Exception as e:
+        logger.error(f"ERROR in Post-Interview Analysis Node (map-reduce): {e}")
+        return {"error": f"Failed to generate report: {e}"}
+
+# --- 4d. Incremental Critic (one answer at a time, during the interview) ---
+# The frontend posts every answer to /api/answer as soon as the candidate gives it;
+# it is scored in the background with the same segment prompt as above and the
+# evaluation is kept on the session ('answer_evaluations'). At /api/finish only the
+# reduce call is left (plus scoring any turn that never got posted).
+@instrument_node("answer_scoring")
+def evaluate_answer_node(state: InterviewWorkflowState, question: str, answer: str, category: str = "general") -> Dict:
+    """Scores a single answer against its question."""
+    logger.info(f"[Node]: Scoring one answer ({category})")
+    try:
+        segment = {"question": question, "category": category, "answer": answer}
+        evaluation = get_chain("segment").invoke(segment_inputs(state, segment))
+        # Keyed on the planned question the wording resolves to, exactly like split_transcript()
+        # names the segment at /api/finish, so a paraphrased question still finds its score
+        match = match_planned_question(question, _planned(state.get("questions")))
+        return {"evaluation": {"question": question, "category": category, **evaluation,
+                               "planned_question": match[1] if match else question}}
+    except Exception as e:
+        logger.error(f"ERROR in Answer Scoring Node: {e}")
+        return {"error": f"Failed to score answer: {e}"}
+
+def _evaluation_key(evaluation: Dict, planned: List[Tuple[str, str, set]]) -> str:
+    question = evaluation.get("planned_question")
+    if question is None:  # stored before evaluations carried their planned question
+        match = match_planned_question(evaluation["question"], planned)
+        question = match[1] if match else evaluation["question"]
+    return _normalize_question(question)
+
+def _unscored_segments(state: InterviewWorkflowState, evaluations: List[Dict]) -> List[Dict]:
+    planned = _planned(state.get("questions"))
+    scored = {_evaluation_key(evaluation, planned) for evaluation in evaluations}
+    segments = split_transcript(state["interview_transcript"], state.get("questions"))
+    return [segment for segment in segments if _normalize_question(segment["question"]) not in scored]
+
+def _dedupe_evaluations(state: InterviewWorkflowState, evaluations: List[Dict]) -> List[Dict]:
+    """One evaluation per segment (the latest wins), so a re-posted answer isn't counted twice in the reduce."""
+    planned = _planned(state.get("questions"))
+    return list({_evaluation_key(evaluation, planned): evaluation for evaluation in evaluations}.values())
+
+def _normalize_question(question: str) -> str:
+    return " ".join(sorted(_words(question)))
+
+@instrument_node("critic_from_evaluations")
+def generate_critic_from_evaluations(state: InterviewWorkflowState) -> Dict:
+    """
+    Builds the PostInterviewReport from the precomputed 'answer_evaluations'.
+    Turns of the transcript that were never scored are scored now, concurrently.
+    """
+    logger.info("[Node]: Running Post-Interview Analysis (from per-answer evaluations)")
+    try:
+        evaluations = list(state["answer_evaluations"])
+        missing = _unscored_segments(state, evaluations)
+        if missing:
+            logger.info(f"[Node]: Scoring {len(missing)} answers that were not scored during the interview")
+            results = get_chain("segment").batch(
+                [segment_inputs(state, segment) for segment in missing],
+                config={"max_concurrency": CRITIC_MAX_CONCURRENCY},
+                return_exceptions=True,
+            )
+            evaluations += _collect_evaluations(missing, results)
+        evaluations = _dedupe_evaluations(state, evaluations)
+        report = get_chain("reduce").invoke(reduce_inputs(state, evaluations))
+        return {"final_review": report, "segment_evaluations": evaluations}
+    except Exception as e:
+        logger.error(f"ERROR in Post-Interview Analysis Node (per-answer): {e}")
+        return {"error": f"Failed to generate report: {e}"}
+
+@instrument_node("critic_from_evaluations")
+async def agenerate_critic_from_evaluations(state: InterviewWorkflowState) -> Dict:
+    """Async twin of generate_critic_from_evaluations."""
+    logger.info("[Node]: Running Post-Interview Analysis (from per-answer evaluations, async)")
+    try:
+        evaluations = list(state["answer_evaluations"])
+        missing = _unscored_segments(state, evaluations)
+        if missing:
+            logger.info(f"[Node]: Scoring {len(missing)} answers that were not scored during the interview")
+            results = await get_chain("segment").abatch(
+                [segment_inputs(state, segment) for segment in missing],
+                config={"max_concurrency": CRITIC_MAX_CONCURRENCY},
+                return_exceptions=True,
+            )
+            evaluations += _collect_evaluations(missing, results)
+        evaluations = _dedupe_evaluations(state, evaluations)
+        report = await get_chain("reduce").ainvoke(await asyncio.to_thread(reduce_inputs, state, evaluations))
+        return {"final_review": report, "segment_evaluations": evaluations}
+    except Exception as e:
+        logger.error(f"ERROR in Post-Interview Analysis Node (per-answer): {e}")
+        return {"error": f"Failed to generate report: {e}"}
+
+# --- 4e. Sectioned Critic (CRITIC_MODE=sectioned) ---
+# Writing all eight report fields in one completion makes /api/finish wait for one long
+# output. Here a short "assessment" call writes the judgement (summary, decision,
+# strengths, weaknesses); the remaining sections only elaborate on it, so they are written
+# concurrently from that shared assessment and assembled into the same PostInterviewReport.
+# Every call is retried on its own (CRITIC_SECTION_ATTEMPTS) and timed; the timings come
+# back next to the report as "sections". A section that still fails is left empty.
+CRITIC_SECTION_ATTEMPTS = int(os.environ.get("CRITIC_SECTION_ATTEMPTS", "2"))
+
+def _report_part(name: str, fields: Tuple[str, ...]):
+    """A model with just these PostInterviewReport fields (same types and descriptions)."""
+    return create_model(name, **{f: (PostInterviewReport.model_fields[f].annotation, PostInterviewReport.model_fields[f])
+                                 for f in fields})
+
+ASSESSMENT_FIELDS = ("performance_summary", "decision", "strengths", "weaknesses")
+CoreAssessment = _report_part("CoreAssessment", ASSESSMENT_FIELDS)
+
+ASSESSMENT_PROMPT_PREFIX = """
+You are an expert HR who is an elite in the field of interviewing and shortlisting candidates.
+You are very aware of the culture norms and interview etiquette of the country you are working in, and the candidate
+must be able to fit in them. The country, the job, the CV and the interview transcript are given after these instructions.
+
+Assess the interview like a real HR: do not blindly pass or fail the candidate. A candidate who only said hello
+or showed a basic understanding must not pass; one who answered every question in depth must not be overlooked.
+Every judgement must be backed by the transcript or the CV.
+Write only the core assessment: a 3-4 sentence performance summary (preparation, clarity, relevance, confidence,
+communication), a PASS / FAIL decision with a one-line reason, 3-5 strengths and 2-4 weaknesses, each with a brief
+explanation from the answers or the CV. The rest of the report will be written from your assessment.
+
+{format_instructions}
+"""
+
+ASSESSMENT_PROMPT_SUFFIX = """{country_guidance}
+
+The candidate interviewed for {job_role} at {job_company}. Their CV:
+---
+{cv_text}
+---
+
+The transcript of the interview:
+---
+{interview_transcript}
+---
+"""
+
+SECTION_PROMPT_PREFIX = """
+You are an expert HR writing one section of a Post-Interview Intelligence Report. The country you are working in,
+the job, the interview transcript and your team's assessment of the interview are given after these instructions.
+Build on the assessment, do not contradict it.
+
+{section_instructions}
+
+{format_instructions}
+"""
+
+SECTION_PROMPT_SUFFIX = """{country_guidance}
+
+The candidate interviewed for {job_role} at {job_company}.
+
+The transcript of the interview:
+---
+{interview_transcript}
+---
+
+Your team's assessment of the interview:
+---
+{assessment}
+---
+"""
+
+# name -> (report fields, instructions)
+REPORT_SECTIONS = {
+    "fit": (
+        ("fit_assessment", "topic_ratings"),
+        "Write the fit assessment (Skill Fit, Behavioral Fit and Growth Potential, each with a Score (0-100%) and a "
+        "Justification) and the topic-level ratings (topics such as Technical Knowledge, Teamwork, Leadership, "
+        "Communication, each with a Rating 1-5 and short Reasoning).",
+    ),
+    "improvement": (
+        ("improvement_plan",),
+        "Write the actionable improvement plan. For each weakness or low-rated area give the Issue, Why it matters, "
+        "the Action Step and the Timeline: short-term (1 week), medium (1 month) or long-term (3 months).",
+    ),
+    "followup": (
+        ("agentic_followup",),
+        "Suggest one to three next steps the AI itself could take to help the candidate improve, for example "
+        "scheduling a focused mock interview for weak topics, generating flashcards or practice questions, "
+        "or creating a learning timeline.",
+    ),
+}
+
+CHAIN_SPECS["assessment"] = (
+    ASSESSMENT_PROMPT_PREFIX, ASSESSMENT_PROMPT_SUFFIX, CoreAssessment, REPORT_REQUIRED_FIELDS, "critic_assessment",
+)
+for _name, (_fields, _instructions) in REPORT_SECTIONS.items():
+    CHAIN_SPECS[f"section_{_name}"] = (
+        SECTION_PROMPT_PREFIX.replace("{section_instructions}", _instructions),
+        SECTION_PROMPT_SUFFIX,
+        _report_part(f"Report{_name.title()}Section", _fields),
+        _fields,
+        f"critic_section_{_name}",
+    )
+
+def _timing(started: float, attempts: int, error: Optional[Exception] = None) -> Dict:
+    timing = {"seconds": round(time.perf_counter() - started, 3), "attempts": attempts,
+              "status": "failed" if error else "ok"}
+    if error:
+        timing["error"] = str(error)
+    return timing
+
+def run_report_part(chain_name: str, inputs: Dict) -> Tuple[Optional[Dict], Dict]:
+    """Runs one chain with its own retries. Returns (output or None, timing)."""
+    started, error = time.perf_counter(), None
+    for attempt in range(1, CRITIC_SECTION_ATTEMPTS + 1):
+        try:
+            return get_chain(chain_name).invoke(inputs), _timing(started, attempt)
+        except Exception as e:
+            error = e
+            logger.warning(f"Critic part '{chain_name}' failed (attempt {attempt}): {e}")
+    return None, _timing(started, CRITIC_SECTION_ATTEMPTS, error)
+
+async def arun_report_part(chain_name: str, inputs: Dict) -> Tuple[Optional[Dict], Dict]:
+    started, error = time.perf_counter(), None
+    for attempt in range(1, CRITIC_SECTION_ATTEMPTS + 1):
+        try:
+            return await get_chain(chain_name).ainvoke(inputs), _timing(started, attempt)
+        except Exception as e:
+            error = e
+            logger.warning(f"Critic part '{chain_name}' failed (attempt {attempt}): {e}")
+    return None, _timing(started, CRITIC_SECTION_ATTEMPTS, error)
+
+# All sections at once: threads for invoke, asyncio for ainvoke
+report_sections = RunnableParallel(**{
+    name: RunnableLambda(partial(run_report_part, f"section_{name}"), afunc=partial(arun_report_part, f"section_{name}"))
+    for name in REPORT_SECTIONS
+})
+
+def section_inputs(inputs: Dict, assessment: Dict) -> Dict:
+    return {**inputs, "assessment": json.dumps(assessment, ensure_ascii=False, indent=1)}
+
+def assemble_report(assessment: Dict, parts: Dict[str, Tuple[Optional[Dict], Dict]]) -> Tuple[Dict, Dict]:
+    """Merges the assessment and the sections into one PostInterviewReport; returns (report, timings)."""
+    report = dict(assessment)
+    for output, _ in parts.values():
+        report.update(output or {})
+    report, _ = conform(report, PostInterviewReport, REPORT_REQUIRED_FIELDS)  # failed sections -> empty
+    return report, {name: timing for name, (_, timing) in parts.items()}
+
+@instrument_node("critic_sectioned")
+def generate_critic_node_sectioned(state: InterviewWorkflowState) -> Dict:
+    """The assessment first, then every other report section concurrently."""
+    logger.info("[Node]: Running Post-Interview Analysis (sectioned)")
+    try:
+        inputs = critic_inputs(state)
+        assessment, assessment_timing = run_report_part("assessment", inputs)
+        if assessment is None:
+            raise Exception(f"the assessment failed: {assessment_timing['error']}")
+        report, timings = assemble_report(assessment, report_sections.invoke(section_inputs(inputs, assessment)))
+        return {"final_review": report, "sections": {"assessment": assessment_timing, **timings}}
+    except Exception as e:
+        logger.error(f"ERROR in Post-Interview Analysis Node (sectioned): {e}")
+        return {"error": f"Failed to generate report: {e}"}
 
-# --- 4. Connect chain ---
-answer_chain = prompt | llm | parser
+@instrument_node("critic_sectioned")
+async def agenerate_critic_node_sectioned(state: InterviewWorkflowState) -> Dict:
+    """Async twin of generate_critic_node_sectioned."""
+    logger.info("[Node]: Running Post-Interview Analysis (sectioned, async)")
+    try:
+        inputs = await asyncio.to_thread(critic_inputs, state)  # CV compaction, off the event loop
+        assessment, assessment_timing = await arun_report_part("assessment", inputs)
+        if assessment is None:
+            raise Exception(f"the assessment failed: {assessment_timing['error']}")
+        parts = await report_sections.ainvoke(section_inputs(inputs, assessment))
+        report, timings = assemble_report(assessment, parts)
+        return {"final_review": report, "sections": {"assessment": assessment_timing, **timings}}
+    except Exception as e:
+        logger.error(f"ERROR in Post-Interview Analysis Node (sectioned): {e}")
+        return {"error": f"Failed to generate report: {e}"}
 
 # --- 5. Main Node Function ---
-def generate_critic_node(state: InterviewWorkflowState) -> Dict:
+def critic_inputs(state: InterviewWorkflowState) -> Dict:
+    """
+    Maps the State onto the placeholders of PROMPT_SUFFIX.
+    Reuses the CV already compacted at /api/start ('cv_compact') when the session has it.
+    """
+    compaction = compact_cv(state.get("cv_compact") or state["cv_text"], CRITIC_CV_TOKEN_BUDGET)
+    logger.info(
+        f"[Node]: Critic CV is {compaction['compacted_tokens']} tokens",
+        extra={"cv_tokens_compacted": compaction["compacted_tokens"],
+               "cv_tokens_saved": count_tokens(state["cv_text"]) - compaction["compacted_tokens"]},
+    )
+    return {
+        "cv_text": compaction["text"],
+        "job_role": state["job_role"],
+        "job_company": state["job_company"],
+        "country": state["job_country"],  # ✅ 改关键字
+        "country_guidance": country_guidance(state["job_country"]),
+        "interview_transcript": state["interview_transcript"]
+    }
+
+@instrument_node("critic")
+def generate_critic_node(state: InterviewWorkflowState, allow_chunked: bool = True) -> Dict:
     """
     Generates post-interview analysis for a candidate.
+    (Answers already scored during the interview are only aggregated; long transcripts go
+    to the map-reduce Critic, or the report is written in sections, when CRITIC_MODE asks for it.)
     """
-    print("\n--- [Node]: Running Post-Interview Analysis ---")
+    if allow_chunked and state.get("answer_evaluations"):
+        return generate_critic_from_evaluations(state)
+    if allow_chunked and use_chunked_critic(state):
+        return generate_critic_node_chunked(state)
+    if allow_chunked and CRITIC_MODE == "sectioned":
+        return generate_critic_node_sectioned(state)
+    logger.info("[Node]: Running Post-Interview Analysis")
     try:
-        inputs = {
-            "cv_text": state["cv_text"],
-            "job_role": state["job_role"],
-            "job_company": state["job_company"],
-            "country": state["job_country"],  # ✅ 改关键字
-            "interview_transcript": state["interview_transcript"]
-        }
-        print(f"Generating post-interview report for {inputs['job_role']} at {inputs['job_company']}")
-        report = answer_chain.invoke(inputs)
+        inputs = critic_inputs(state)
+        logger.info(f"Generating post-interview report for {inputs['job_role']} at {inputs['job_company']}")
+        report = get_chain("answer").invoke(inputs)
         return {"final_review": report}
     except Exception as e:
-        print(f"!! ERROR in Post-Interview Analysis Node: {e}")
+        logger.error(f"ERROR in Post-Interview Analysis Node: {e}")
+        return {"error": f"Failed to generate report: {e}"}
+
+@instrument_node("critic")
+async def agenerate_critic_node(state: InterviewWorkflowState, allow_chunked: bool = True) -> Dict:
+    """
+    Async twin of generate_critic_node (awaits 'ainvoke', used by asgi_server.py).
+    """
+    if allow_chunked and state.get("answer_evaluations"):
+        return await agenerate_critic_from_evaluations(state)
+    if allow_chunked and use_chunked_critic(state):
+        return await agenerate_critic_node_chunked(state)
+    if allow_chunked and CRITIC_MODE == "sectioned":
+        return await agenerate_critic_node_sectioned(state)
+    logger.info("[Node]: Running Post-Interview Analysis (async)")
+    try:
+        inputs = await asyncio.to_thread(critic_inputs, state)  # CV compaction, off the event loop
+        logger.info(f"Generating post-interview report for {inputs['job_role']} at {inputs['job_company']}")
+        report = await get_chain("answer").ainvoke(inputs)
+        return {"final_review": report}
+    except Exception as e:
+        logger.error(f"ERROR in Post-Interview Analysis Node: {e}")
         return {"error": f"Failed to generate report: {e}"}
 
 # --- 6. Standalone test ---
@@ -236,6 +854,19 @@ Candidate explained previous projects, gave examples of problem-solving,
 and described leadership experience managing a small engineering team.
 """
     }
+    # A paraphrased question scored by /api/answer must match its transcript segment (no LLM needed)
+    planned_state = {
+        "questions": {"technical": ["How did you design the microservices in Project Alpha?"]},
+        "interview_transcript": "interviewer: So how did you design the microservices in Project Alpha?\n"
+                                "candidate: Small Go services behind a gateway.\n",
+    }
+    match = match_planned_question("So how did you design the microservices in Project Alpha?", _planned(planned_state["questions"]))
+    pre_scored = [{"question": "So how did you design the microservices in Project Alpha?", "planned_question": match[1], "score": 4},
+                  {"question": "So how did you design the microservices in Project Alpha?", "score": 5}]  # an older record
+    assert match == ("technical", "How did you design the microservices in Project Alpha?"), match
+    assert _unscored_segments(planned_state, pre_scored) == []
+    assert _dedupe_evaluations(planned_state, pre_scored) == [pre_scored[1]]  # the latest one wins
+
     result = generate_critic_node(test_state)
     import json
     if "error" in result:
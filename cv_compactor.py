@@ -0,0 +1,210 @@
+# cv_compactor.py
+# Cleans up an extracted CV before it is pasted into a prompt.
+# Extracted text is full of repeated page headers/footers, page numbers and
+# whitespace runs; all of it costs input tokens on every LLM call.
+#
+# compact_cv() normalizes and deduplicates the text, counts tokens locally and,
+# if the CV is still over the budget, drops the least useful sections first
+# (experience and projects are kept, hobbies and references go first).
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# tiktoken is optional: without it we fall back to ~4 characters per token.
+# The encoding is loaded on first use (it may have to be downloaded), not at import time.
+_ENCODING = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+# --- 1. Config ---
+QUESTION_CV_TOKEN_BUDGET = int(os.environ.get("CV_TOKEN_BUDGET_QUESTIONS", "1500"))
+CRITIC_CV_TOKEN_BUDGET = int(os.environ.get("CV_TOKEN_BUDGET_CRITIC", "1200"))
+# Page breaks in extracted text (helpers.py ends every PDF page with one)
+PAGE_BREAK = "\f"
+# Running headers/footers: a line among the first/last REPEAT_EDGE_LINES lines of two or more
+# pages, or any line found on REPEAT_MIN_PAGES pages or more, is kept only once
+REPEAT_EDGE_LINES = int(os.environ.get("CV_REPEAT_EDGE_LINES", "3"))
+REPEAT_MIN_PAGES = int(os.environ.get("CV_REPEAT_MIN_PAGES", "3"))
+
+# Lower number = more important = trimmed last
+SECTION_PRIORITIES = {
+    "header": 0,
+    "experience": 1,
+    "projects": 2,
+    "skills": 3,
+    "summary": 4,
+    "education": 5,
+    "publications": 6,
+    "certifications": 7,
+    "awards": 8,
+    "other": 9,
+    "languages": 10,
+    "volunteering": 11,
+    "interests": 12,
+    "references": 13,
+}
+
+SECTION_HEADINGS = {
+    "experience": ["experience", "work experience", "professional experience", "employment",
+                   "employment history", "work history", "career history", "internships"],
+    "projects": ["projects", "personal projects", "selected projects", "key projects", "portfolio"],
+    "skills": ["skills", "technical skills", "core skills", "key skills", "technologies", "tech stack",
+               "competencies", "core competencies"],
+    "summary": ["summary", "profile", "professional summary", "about me", "objective", "career objective"],
+    "education": ["education", "academic background", "qualifications", "education and qualifications"],
+    "publications": ["publications", "research", "papers"],
+    "certifications": ["certifications", "certificates", "courses", "training", "licenses"],
+    "awards": ["awards", "honors", "honours", "achievements", "awards and achievements"],
+    "languages": ["languages"],
+    "volunteering": ["volunteering", "volunteer experience", "extracurricular activities", "activities",
+                     "leadership and activities"],
+    "interests": ["interests", "hobbies", "hobbies and interests", "personal interests"],
+    "references": ["references", "referees"],
+}
+_HEADING_LOOKUP = {heading: section for section, headings in SECTION_HEADINGS.items() for heading in headings}
+
+# "3", "Page 3", "3 / 5", "Page 3 of 5", "- 3 -"
+_PAGE_ARTIFACT = re.compile(r"^[-–\s]*(page\s*)?\d{1,3}(\s*(/|of)\s*\d{1,3})?[-–\s]*$", re.IGNORECASE)
+# Lines made only of separators ("-----", "•••", "____")
+_SEPARATOR_ONLY = re.compile(r"^[\W_]+$")
+
+
+# --- 2. Token counting ---
+def _encoding():
+    global _ENCODING, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _ENCODING = tiktoken.get_encoding("o200k_base")  # the gpt-4o family encoding
+                except Exception:
+                    _ENCODING = None
+                _encoding_loaded = True
+    return _ENCODING
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+# --- 3. Normalization ---
+def _clean_lines(page: str) -> List[str]:
+    lines = []
+    for raw_line in page.splitlines():
+        line = " ".join(raw_line.split())
+        if line and not _PAGE_ARTIFACT.match(line) and not _SEPARATOR_ONLY.match(line):
+            lines.append(line)
+    return lines
+
+
+def _running_lines(pages: List[List[str]]) -> set:
+    """
+    Lines that repeat at the same place at the top or bottom of several pages,
+    or that appear on REPEAT_MIN_PAGES pages or more.
+    """
+    edges, anywhere = Counter(), Counter()
+    for lines in pages:
+        keys = [line.casefold() for line in lines]
+        edge_count = min(REPEAT_EDGE_LINES, len(keys))
+        edges.update({(offset, keys[offset]) for offset in range(edge_count)})
+        edges.update({(-offset, keys[-offset]) for offset in range(1, edge_count + 1)})
+        anywhere.update(set(keys))
+    return ({key for (_, key), pages_seen in edges.items() if pages_seen >= 2}
+            | {key for key, pages_seen in anywhere.items() if pages_seen >= REPEAT_MIN_PAGES})
+
+
+def normalize_cv(text: str) -> List[str]:
+    """
+    Returns the cleaned lines of a CV: unicode-normalized, whitespace-collapsed, without
+    page numbers, separator lines or running headers/footers (e.g. a name/contact header
+    on every page, kept once). Other repeated lines, like "Python" under two jobs, stay.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    pages = [lines for lines in (_clean_lines(page) for page in text.split(PAGE_BREAK)) if lines]
+    running = _running_lines(pages) if len(pages) > 1 else set()
+    lines = []
+    seen = set()
+    for page in pages:
+        for line in page:
+            key = line.casefold()
+            if key in running:
+                if key in seen:
+                    continue
+                seen.add(key)
+            lines.append(line)
+    return lines
+
+
+def _heading_of(line: str) -> str:
+    if len(line) > 40:
+        return ""
+    key = re.sub(r"[^a-z& ]", "", line.casefold()).replace("&", "and").strip()
+    return _HEADING_LOOKUP.get(key, "")
+
+
+def split_sections(lines: List[str]) -> List[Tuple[str, List[str]]]:
+    """Groups lines under the recognised headings. Lines before the first heading are the 'header'."""
+    sections: List[Tuple[str, List[str]]] = [("header", [])]
+    for line in lines:
+        section = _heading_of(line)
+        if section:
+            sections.append((section, [line]))
+        else:
+            sections[-1][1].append(line)
+    return [(name, body) for name, body in sections if body]
+
+
+# --- 4. Compaction ---
+def compact_cv(text: str, token_budget: int = QUESTION_CV_TOKEN_BUDGET) -> Dict:
+    """
+    Normalizes the CV and trims it to 'token_budget' tokens, section by section.
+    Returns {"text", "original_tokens", "compacted_tokens", "tokens_saved", "dropped_sections"}.
+    """
+    original_tokens = count_tokens(text)
+    sections = split_sections(normalize_cv(text))
+    section_tokens = [count_tokens("\n".join(body)) + 1 for _, body in sections]
+
+    # A. Pick whole sections by priority while they fit; the first one that
+    #    doesn't fit is cut line by line, the rest of the budget goes to smaller ones.
+    keep: Dict[int, List[str]] = {}
+    dropped: List[str] = []
+    remaining = token_budget
+    by_priority = sorted(range(len(sections)), key=lambda i: SECTION_PRIORITIES.get(sections[i][0], 9))
+    for i in by_priority:
+        name, body = sections[i]
+        if section_tokens[i] <= remaining:
+            keep[i] = body
+            remaining -= section_tokens[i]
+            continue
+        partial = []
+        for line in body:
+            line_tokens = count_tokens(line) + 1
+            if line_tokens > remaining:
+                break
+            partial.append(line)
+            remaining -= line_tokens
+        if len(partial) > (0 if name == "header" else 1):  # a lone heading is useless
+            keep[i] = partial
+        else:
+            remaining += sum(count_tokens(line) + 1 for line in partial)
+            dropped.append(name)
+
+    # B. Put the kept sections back in their original order
+    compacted = "\n".join(line for i in sorted(keep) for line in keep[i])
+    compacted_tokens = count_tokens(compacted)
+    return {
+        "text": compacted,
+        "original_tokens": original_tokens,
+        "compacted_tokens": compacted_tokens,
+        "tokens_saved": max(0, original_tokens - compacted_tokens),
+        "dropped_sections": dropped,
+    }
@@ -0,0 +1,249 @@
+# fake_llm.py
+# A local stand-in for ChatOpenAI, used by the offline benchmark (benchmark.py).
+# It never touches the network: it sleeps for a latency drawn from a configurable
+# distribution and answers with canned JSON that matches the schema the prompt asks for
+# (InterviewQuestions, SegmentEvaluation or PostInterviewReport).
+#
+# Latency specs:
+#   "constant:0.5"          always 0.5 s
+#   "uniform:0.2,1.5"       between 0.2 s and 1.5 s
+#   "lognormal:0.8,0.5"     median 0.8 s, sigma 0.5 (a long right tail, like a real provider)
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from cv_compactor import count_tokens
+
+# --- 1. Canned answers ---
+CANNED_QUESTIONS = {
+    "general_questions": [
+        "Tell me about a time you disagreed with a teammate. How did you resolve it?",
+        "What motivates you to apply for this role?",
+    ],
+    "cv_based_questions": [
+        "Why did you choose this tech stack for the main project on your CV?",
+        "What was your role in the team project you listed, and what would you do differently?",
+        "Which achievement on your CV are you most proud of, and why?",
+    ],
+    "technical_questions": [
+        "How would you optimise a slow database query for a large dataset?",
+        "How would you design a service that has to handle a sudden spike in traffic?",
+    ],
+}
+
+CANNED_SEGMENT = {
+    "topic": "Teamwork",
+    "score": 4,
+    "strengths": ["Gave a concrete example", "Explained the outcome"],
+    "weaknesses": ["Could quantify the impact"],
+    "cultural_fit": "Polite and collaborative, which fits the local interview culture.",
+    "evidence": "I set up a short meeting to align on the plan.",
+}
+
+CANNED_REPORT = {
+    "performance_summary": "The candidate answered clearly and backed most answers with examples. "
+                           "Technical depth was good, but impact was rarely quantified.",
+    "decision": "PASS",
+    "strengths": ["Clear communication", "Relevant project experience", "Collaborative attitude"],
+    "weaknesses": ["Rarely quantifies impact", "Short answers on system design"],
+    "fit_assessment": {
+        "Skill Fit": {"Score": "80%", "Justification": "Projects match the core requirements."},
+        "Behavioral Fit": {"Score": "75%", "Justification": "Answers show teamwork and respect."},
+        "Growth Potential": {"Score": "85%", "Justification": "Learns quickly from feedback."},
+    },
+    "topic_ratings": {
+        "Teamwork": {"Rating": "4", "Reasoning": "Concrete example of resolving a disagreement."},
+        "System Design": {"Rating": "3", "Reasoning": "Reasonable ideas, little depth."},
+    },
+    "improvement_plan": [
+        {"Issue": "Impact is not quantified", "Why it matters": "Interviewers look for measurable results",
+         "Action Step": "Add one number to every project story", "Timeline": "1 week"},
+    ],
+    "agentic_followup": ["Schedule a mock system design interview"],
+}
+
+
+_REQUIRED_KEYS = re.compile(r'"required": \[([^\]]*)\]')
+
+
+def canned_response(prompt_text: str) -> Dict[str, Any]:
+    """Picks the canned JSON whose keys the prompt's format instructions ask for."""
+    # The JSON schema at the end of the prompt lists exactly the keys wanted; a sub-schema
+    # (one question category, one report section) gets just those keys of the canned answer
+    schemas = _REQUIRED_KEYS.findall(prompt_text)
+    if schemas:
+        keys = re.findall(r'"(\w+)"', schemas[-1])
+        for canned in (CANNED_QUESTIONS, CANNED_SEGMENT, CANNED_REPORT):
+            if keys and all(key in canned for key in keys):
+                return {key: canned[key] for key in keys}
+    if "performance_summary" in prompt_text:
+        return CANNED_REPORT
+    if "cultural_fit" in prompt_text and "evidence" in prompt_text:
+        return CANNED_SEGMENT
+    return CANNED_QUESTIONS
+
+
+# --- 2. Latency distributions ---
+def parse_latency(spec: str):
+    """Turns a latency spec ("constant:0.5", "uniform:a,b", "lognormal:median,sigma") into a sampler."""
+    kind, _, args = (spec or "constant:0").partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] if args else []
+    if kind == "constant":
+        seconds = values[0] if values else 0.0
+        return lambda rng: seconds
+    if kind == "uniform":
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency spec: {spec!r}")
+
+
+# --- 3. Provider prompt cache ---
+class PromptCacheSimulator:
+    """
+    Mimics OpenAI's automatic prompt caching: prompts of at least 'min_chars' are cached in
+    'block_chars' increments, and a later prompt that starts with the same blocks reports
+    them as cached. Characters, not tokens (about 4 characters per token), keep it cheap.
+    """
+
+    def __init__(self, min_chars: int = 4096, block_chars: int = 512, max_entries: int = 4096):
+        self.min_chars, self.block_chars, self.max_entries = min_chars, block_chars, max_entries
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt_text: str) -> int:
+        """Returns how many leading characters were served from the cache; caches this prompt's prefix."""
+        if len(prompt_text) < self.min_chars:
+            return 0
+        digest, digests = hashlib.sha256(), []
+        for end in range(self.block_chars, len(prompt_text) + 1, self.block_chars):
+            digest.update(prompt_text[end - self.block_chars:end].encode("utf-8"))
+            digests.append(digest.copy().hexdigest())
+        cached = 0
+        with self._lock:
+            for i, key in enumerate(digests):
+                if key not in self._seen:
+                    break
+                self._seen.move_to_end(key)
+                cached = (i + 1) * self.block_chars
+            for key in digests:
+                self._seen[key] = None
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        return cached if cached >= self.min_chars else 0
+
+
+# --- 4. The fake model ---
+class FakeInterviewLLM(BaseChatModel):
+    """
+    Deterministic (seeded) fake chat model.
+    'latency' is the total time per call; streaming spreads it over the chunks,
+    with 'first_token_share' of it spent before the first chunk.
+    """
+
+    latency: str = "constant:0"
+    seed: int = 0
+    error_rate: float = 0.0
+    first_token_share: float = 0.3
+    stream_chunk_chars: int = 40
+    prompt_cache: bool = True
+
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _sampler: Any = PrivateAttr()
+    _cache: Optional[PromptCacheSimulator] = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._sampler = parse_latency(self.latency)
+        self._cache = PromptCacheSimulator() if self.prompt_cache else None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-interview-llm"
+
+    # A. Helpers
+    def _draw(self):
+        """Returns (delay, fail) for one call; the seeded RNG makes every run draw the same sequence."""
+        with self._lock:
+            return max(0.0, self._sampler(self._rng)), self._rng.random() < self.error_rate
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        prompt_text = "\n".join(str(m.content) for m in messages)
+        content = json.dumps(canned_response(prompt_text), ensure_ascii=False)
+        input_tokens, output_tokens = count_tokens(prompt_text), count_tokens(content)
+        cached_chars = self._cache.lookup(prompt_text) if self._cache else 0
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": {"cache_read": count_tokens(prompt_text[:cached_chars]) if cached_chars else 0},
+            },
+        )
+
+    # B. LangChain hooks
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("fake LLM: injected error")
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("fake LLM: injected error")
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        delay, fail = self._draw()
+        message = self._respond(messages)
+        text = message.content
+        pieces = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)]
+        time.sleep(delay * self.first_token_share)
+        if fail:
+            raise RuntimeError("fake LLM: injected error")
+        per_piece = delay * (1 - self.first_token_share) / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(per_piece)
+            last = i == len(pieces) - 1
+            chunk = AIMessageChunk(content=piece, usage_metadata=message.usage_metadata if last else None)
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+if __name__ == "__main__":
+    from langchain_core.messages import HumanMessage
+
+    print("--- Testing fake_llm ---")
+    llm = FakeInterviewLLM(latency="lognormal:0.05,0.5", seed=1)
+    start = time.perf_counter()
+    result = llm.invoke([HumanMessage(content="Return general_questions ...")])
+    print(f"invoke: {time.perf_counter() - start:.3f}s, usage={result.usage_metadata}")
+    print(json.loads(result.content)["general_questions"][0])
+    streamed = "".join(chunk.content for chunk in llm.stream([HumanMessage(content="performance_summary")]))
+    print("streamed report decision:", json.loads(streamed)["decision"])
+    instructions = "Return general_questions. " * 300  # a long static prefix, then a different CV each time
+    for cv in ("CV of Jane", "CV of Sam"):
+        print("prompt cache:", llm.invoke([HumanMessage(content=instructions + cv)]).usage_metadata["input_token_details"])
@@ -0,0 +1,124 @@
+# fake_openai_server.py
+# A tiny OpenAI-compatible HTTP server (POST /v1/chat/completions) for testing the
+# resilience layer (resilience.py) with the real ChatOpenAI client, without a real provider.
+# It answers with the canned JSON of fake_llm.py and can inject latency, hangs and errors.
+#
+# Usage:
+#   python fake_openai_server.py --port 8089 --latency lognormal:0.5,0.4 --hang-rate 0.05 --error-rate 0.02
+#   OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=sk-fake python flask_server.py
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+from fake_llm import PromptCacheSimulator, canned_response, parse_latency
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Settings can be changed while it runs (e.g. set error_rate=1.0 to simulate an outage).
+    hang_rate: share of calls that sleep 'hang_seconds' before answering.
+    error_rate: share of calls that fail with 'error_status' (500, 429, 503...).
+    Repeated prompt prefixes are reported as cached tokens, like OpenAI's prompt caching.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency="constant:0.05", error_rate=0.0, error_status=500,
+                 hang_rate=0.0, hang_seconds=60.0, seed=0):
+        super().__init__(address, _Handler)
+        self.sampler = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.rng = random.Random(seed)
+        self.prompt_cache = PromptCacheSimulator()
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def draw(self) -> Tuple[float, bool]:
+        with self.lock:
+            self.calls += 1
+            delay = max(0.0, self.sampler(self.rng))
+            if self.rng.random() < self.hang_rate:
+                delay = self.hang_seconds
+            return delay, self.rng.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+
+    def log_message(self, format, *args):  # keep the test output clean
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        delay, fail = self.server.draw()
+        time.sleep(delay)
+        if fail:
+            self._send_json(self.server.error_status, {"error": {"message": "injected error", "type": "server_error"}})
+            return
+
+        prompt_text = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        content = json.dumps(canned_response(prompt_text), ensure_ascii=False)
+        usage = {"prompt_tokens": len(prompt_text) // 4, "completion_tokens": len(content) // 4,
+                 "prompt_tokens_details": {"cached_tokens": self.server.prompt_cache.lookup(prompt_text) // 4}}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"chatcmpl-fake-{self.server.calls}", "created": int(time.time()), "model": body.get("model", "fake")}
+
+        if not body.get("stream"):
+            self._send_json(200, {
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [content[i:i + 40] for i in range(0, len(content), 40)]
+        for i, piece in enumerate(pieces):
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": piece},
+                                  "finish_reason": "stop" if i == len(pieces) - 1 else None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send_json(self, status: int, payload) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_in_background(port: int = 0, **settings) -> Tuple[FakeOpenAIServer, str]:
+    """Starts the server on a daemon thread; returns (server, base_url for ChatOpenAI)."""
+    server = FakeOpenAIServer(("127.0.0.1", port), **settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="lognormal:0.5,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(("127.0.0.1", args.port), latency=args.latency, error_rate=args.error_rate,
+                              error_status=args.error_status, hang_rate=args.hang_rate,
+                              hang_seconds=args.hang_seconds)
+    print(f"Fake OpenAI server on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
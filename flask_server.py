@@ -1,36 +1,188 @@
 # flask_server.py
 import os
 import json
-from flask import Flask, request, jsonify
+import time
+import itertools
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS  # <-- [NEW] 1. Import CORS
+from werkzeug.utils import secure_filename
 from typing import TypedDict, List, Dict
 
 # --- 1. Import your "workstations" (nodes) ---
-from question_generator import generate_questions_node 
-from critic import generate_critic_node 
+from question_generator import (
+    generate_questions_node, generate_questions_batch, question_cache, similar_index, stream_questions,
+    BATCH_MAX_CONCURRENCY,
+)
+from critic import generate_critic_node, evaluate_answer_node
+from job_queue import JobQueue, JobQueueFull
+from job_store import JobStore
+from admission import AdmissionController, AdmissionRejected, Ticket
+from helpers import DocumentTooLarge, MAX_FILE_BYTES
+from upload_store import UploadStore
+from report_store import transcript_hash
+# Sessions, reports and the helpers around them are shared with asgi_server.py (see shared_state.py)
+from shared_state import (
+    WARM_UP_ON_START, report_store, session_store, save_session, critic_state_from_session, warm_up,
+)
+from instrumentation import REQUEST_DURATION, REQUESTS, get_logger, record_error, registry
 
 # --- 2. Define the "conveyor belt" (State) ---
 # [THE FIX] We now import the single source of truth
 from shared_types import InterviewWorkflowState
 
+logger = get_logger("flask_server")
+
 # --- 3. Build the Flask "shopfront" ---
 app = Flask(__name__)
-os.makedirs("uploads", exist_ok=True)
+# Reject oversized uploads before reading them (413)
+app.config["MAX_CONTENT_LENGTH"] = MAX_FILE_BYTES
 
 # --- [NEW] 2. Enable CORS ---
 # This tells the browser: "Allow all origins to access my API"
 # (For a Hackathon, "*" is the fastest setting)
 CORS(app) 
 
-# (This is a temporary "database", same as before)
-global_session_store = {}
+# Uploaded CVs, stored once per content hash with their extracted text (see upload_store.py)
+upload_store = UploadStore()
+
+# Background workers for the Critic (see job_queue.py); their job records go to a shared
+# store, so a poll served by another worker process still finds the job (see job_store.py)
+job_store = JobStore()
+critic_jobs = JobQueue("critic", store=job_store)
+# ...and for scoring single answers while the interview is still running
+answer_jobs = JobQueue("answer", max_pending=int(os.environ.get("ANSWER_QUEUE_MAX_PENDING", "256")), store=job_store)
+# ...and for cohort batches (/api/start/batch), one at a time
+batch_jobs = JobQueue("batch", max_workers=int(os.environ.get("BATCH_JOB_WORKERS", "1")),
+                      max_pending=int(os.environ.get("BATCH_QUEUE_MAX_PENDING", "4")), store=job_store)
+# How long a Critic job waits for answers still being scored; whatever isn't scored by then is scored by the Critic
+ANSWER_WAIT_SECONDS = float(os.environ.get("ANSWER_WAIT_SECONDS", "20"))
+
+# Admission control: LLM work takes a slot per lane; /api/finish beats new /api/start
+# sessions, and overload is shed early with 429/503 + Retry-After (see admission.py)
+admission = AdmissionController()
+
+# --- 3a. Metrics (see instrumentation.py) ---
+# Every request is timed per endpoint; /metrics serves everything in the Prometheus format.
+@app.before_request
+def start_request_timer():
+    request.environ["mvita.started_at"] = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started_at = request.environ.get("mvita.started_at")
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if started_at is not None:
+        REQUEST_DURATION.observe(time.perf_counter() - started_at, endpoint=endpoint, method=request.method)
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+def _queue_gauge(field: str):
+    return lambda: [({"queue": q.name}, q.stats()[field]) for q in (critic_jobs, answer_jobs, batch_jobs)]
+
+
+registry.gauge_callback("mvita_job_queue_queued", "Jobs waiting for a worker", _queue_gauge("queued"))
+registry.gauge_callback("mvita_job_queue_running", "Jobs being worked on", _queue_gauge("running"))
+registry.gauge_callback("mvita_admission_queue_depth", "Requests waiting for an admission slot", lambda: admission.depths("queued"))
+registry.gauge_callback("mvita_admission_in_flight", "Requests holding an admission slot", lambda: admission.depths("in_flight"))
+registry.gauge_callback("mvita_sessions", "Live interview sessions", lambda: session_store.stats()["size"])
+registry.gauge_callback("mvita_session_evictions", "Sessions evicted for size", lambda: session_store.stats()["evictions"])
+registry.gauge_callback("mvita_upload_store_bytes", "Bytes of uploaded files on disk", lambda: upload_store.stats()["bytes"])
+registry.gauge_callback("mvita_question_cache_hit_ratio", "Question cache hit ratio", lambda: question_cache.stats()["hit_ratio"])
+if similar_index is not None:
+    registry.gauge_callback("mvita_similar_index_hit_ratio", "Near-duplicate CV index hit ratio",
+                            lambda: similar_index.stats()["hit_ratio"])
+
+
+# --- 3b. Admission control (see admission.py) ---
+def rejection_response(rejected: AdmissionRejected):
+    body = {"error": "The server is busy, please retry", "reason": rejected.reason, "retry_after": rejected.retry_after}
+    return jsonify(body), rejected.status, {"Retry-After": str(rejected.retry_after)}
+
+
+@app.errorhandler(AdmissionRejected)
+def handle_admission_rejected(rejected):
+    return rejection_response(rejected)
+
+
+def start_slot() -> Ticket:
+    """The admission slot a new session needs for its LLM call (cache and near-duplicate hits don't take one)."""
+    return admission.acquire("start")
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+# --- 3c. API Endpoint: /api/upload ---
+# Server-side CV extraction (multipart form: "file", plus optional
+# "user", "job_role", "job_company"), so we don't rely only on pdfText.js in the browser.
+@app.route('/api/upload', methods=['POST'])
+def upload_document():
+    logger.info("[API /upload]: Received document")
+    uploaded = request.files.get("file")
+    if uploaded is None or not uploaded.filename:
+        return jsonify({"error": "file missing"}), 400
+
+    original_name = secure_filename(uploaded.filename)
+    if not original_name.lower().endswith((".pdf", ".docx")):
+        return jsonify({"error": "Unsupported file format. Only PDF and DOCX allowed."}), 400
+
+    try:
+        record, extraction = upload_store.save(
+            uploaded.stream, original_name,
+            user=request.form.get("user", "anonymous"),
+            job_role=request.form.get("job_role", ""),
+            job_company=request.form.get("job_company", ""),
+        )
+    except DocumentTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        logger.error(f"ERROR in /upload: {e}")
+        record_error("api/upload", e)
+        return jsonify({"error": f"Could not read document: {e}"}), 422
+
+    logger.info(f"[API /upload]: {len(extraction['text'])} characters from {record['filename']} "
+                f"(deduplicated: {record['deduplicated']}, cached text: {record['extraction_cached']})")
+    return jsonify({
+        "cv_text": extraction["text"],
+        "pages_read": extraction["pages_read"],
+        "total_pages": extraction["total_pages"],
+        "truncated": extraction["truncated"],
+        "filename": record["filename"],
+        "upload_id": record["upload_id"],
+        "deduplicated": record["deduplicated"],
+    })
+
+
+# Uploads by user / role / company / time (query string: user, job_role, job_company,
+# since, until as unix timestamps, limit)
+@app.route('/api/uploads', methods=['GET'])
+def list_uploads():
+    args = request.args
+    try:
+        uploads = upload_store.find(
+            user=args.get("user"), job_role=args.get("job_role"), job_company=args.get("job_company"),
+            since=args.get("since", type=float), until=args.get("until", type=float),
+            limit=min(args.get("limit", 100, type=int), 1000),
+        )
+    except Exception as e:
+        record_error("api/uploads", e)
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"uploads": uploads})
+
+
+@app.route('/api/uploads/stats', methods=['GET'])
+def upload_store_stats():
+    return jsonify(upload_store.stats())
 
 
 # --- 4. API Endpoint 1: /api/start ---
-# (This part's code is [completely unchanged])
 @app.route('/api/start', methods=['POST'])
 def start_interview_session():
-    print("\n--- [API /start]: Received new session request ---")
+    logger.info("[API /start]: Received new session request")
     try:
         # A. Get data from frontend JSON
         data = request.get_json()
@@ -39,7 +191,7 @@ def start_interview_session():
         job_company = data.get("job_company")
         job_country = data.get("job_country")
 
-        print(f"Received job_role: {job_role}, job_company: {job_company}, job_country: {job_country}")
+        logger.info(f"Received job_role: {job_role}, job_company: {job_company}, job_country: {job_country}")
         if not cv_text:
             return jsonify({"error": "cv_text missing"}), 400
 
@@ -51,9 +203,9 @@ def start_interview_session():
             "job_country": job_country
         }
 
-        # C. Call question generator node
-        print("--- [API /start]: Calling Question Generator Node ---")
-        question_result = generate_questions_node(state_for_questions)
+        # C. Call question generator node (only the LLM call needs an admission slot, cache hits don't queue)
+        logger.info("[API /start]: Calling Question Generator Node")
+        question_result = generate_questions_node(state_for_questions, llm_slot=start_slot)
 
         if "error" in question_result:
             raise Exception(question_result["error"])
@@ -61,30 +213,240 @@ def start_interview_session():
         questions = question_result.get("questions")
 
         # D. Save session
-        session_id = "session_" + str(hash(cv_text))
-        global_session_store[session_id] = {
-            "cv_text": cv_text,
-            "job_role": job_role,
-            "job_company": job_company,
-            "job_country": job_country,
-            "questions": questions
+        session_id = save_session(state_for_questions, questions, question_result.get("cv_compact"))
+
+        logger.info(f"[API /start]: Session {session_id} created. Returning questions.", extra={"session_id": session_id})
+
+        return jsonify({
+            "session_id": session_id,
+            "questions": questions,
+            "cached": question_result.get("cached", False),
+            "similar_match": question_result.get("similar_match"),
+            "cv_tokens": question_result.get("cv_tokens")
+        })
+
+    except AdmissionRejected as rejected:
+        return rejection_response(rejected)
+    except Exception as e:
+        logger.error(f"ERROR in /start: {e}")
+        record_error("api/start", e)
+        return jsonify({"error": str(e)}), 500
+
+
+
+# --- 4b. API Endpoint: /api/start/stream (Server-Sent Events) ---
+# Same input as /api/start, but every question is pushed as soon as the model
+# has finished writing it, so the avatar can start with question one right away.
+# Events:
+#   event: question -> {"category", "index", "question"}
+#   event: done     -> {"session_id", "questions", "cached", "cv_tokens"}  (the full, validated set)
+#   event: error    -> {"error"}
+# (EventSource only does GET, so the frontend should read this with fetch().)
+def sse_event(event: str, payload: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route('/api/start/stream', methods=['POST'])
+def stream_interview_session():
+    logger.info("[API /start/stream]: Received new streaming session request")
+    data = request.get_json(silent=True) or {}
+    if not data.get("cv_text"):
+        return jsonify({"error": "cv_text missing"}), 400
+
+    state_for_questions = {
+        "cv_text": data.get("cv_text"),
+        "job_role": data.get("job_role"),
+        "job_company": data.get("job_company"),
+        "job_country": data.get("job_country")
+    }
+
+    # The first item is pulled here: it runs the cache lookups and, on a miss, takes the
+    # admission slot, so a shed request still gets a plain 429/503 instead of an SSE error.
+    # The slot is held until the model has finished (or the client went away).
+    items = stream_questions(state_for_questions, llm_slot=start_slot)
+    try:
+        first = next(items)
+    except AdmissionRejected as rejected:
+        return rejection_response(rejected)
+    except Exception as e:
+        logger.error(f"ERROR in /start/stream: {e}")
+        record_error("api/start/stream", e)
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        try:
+            for item in itertools.chain([first], items):
+                if item["event"] == "question":
+                    yield sse_event("question", {k: v for k, v in item.items() if k != "event"})
+                else:
+                    session_id = save_session(state_for_questions, item["questions"], item["cv_compact"])
+                    logger.info(f"[API /start/stream]: Session {session_id} created.")
+                    yield sse_event("done", {
+                        "session_id": session_id,
+                        "questions": item["questions"],
+                        "cached": item["cached"],
+                        "similar_match": item.get("similar_match"),
+                        "cv_tokens": item["cv_tokens"]
+                    })
+        except Exception as e:
+            logger.error(f"ERROR in /start/stream: {e}")
+            record_error("api/start/stream", e)
+            yield sse_event("error", {"error": str(e)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+
+# --- 4c. API Endpoint: /api/start/batch (cohort onboarding) ---
+# Body: {"items": [{"cv_text", "job_role", "job_company", "job_country"}, ...],
+#        "max_concurrency": optional}
+# A cohort takes minutes, so it runs as a background job: the endpoint answers 202 with a
+# job id and the client polls /api/batches/<job_id>. When the job has succeeded, "result"
+# holds {"results", "report"}; every successful item gets its own session, failed items
+# carry an "error".
+BATCH_MAX_ITEMS = int(os.environ.get("QUESTION_BATCH_MAX_ITEMS", "500"))
+
+
+def run_batch_job(progress, states: List, invalid: List, item_count: int, max_concurrency: int) -> Dict:
+    """
+    Background job body: generates the questions of a cohort and opens a session per item.
+    Every LLM call of the cohort takes its own batch-lane slot, so a cohort never puts more
+    load on the provider than the lane allows, whatever its max_concurrency.
+    """
+    progress("generating")
+    batch = generate_questions_batch([state for _, state in states], max_concurrency=max_concurrency,
+                                     llm_slot=lambda: admission.acquire("batch", shed=False))
+
+    progress("saving_sessions")
+    responses: List = [None] * item_count
+    for index, error in invalid:
+        responses[index] = {"index": index, "error": error}
+    for (index, state), result in zip(states, batch["results"]):
+        if "error" in result:
+            responses[index] = {"index": index, "error": result["error"]}
+            continue
+        session_id = save_session(state, result["questions"], result.get("cv_compact"))
+        responses[index] = {
+            "index": index,
+            "session_id": session_id,
+            "questions": result["questions"],
+            "cached": result["cached"],
+            "similar_match": result.get("similar_match")
         }
+    logger.info(f"[Job /start/batch]: {item_count} items done.")
+    return {"results": responses, "report": batch["report"]}
 
-        print(f"--- [API /start]: Session {session_id} created. Returning questions. ---")
 
-        return jsonify({"session_id": session_id, "questions": questions})
+@app.route('/api/start/batch', methods=['POST'])
+def start_interview_sessions_batch():
+    logger.info("[API /start/batch]: Received batch request")
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get("items")
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "items missing"}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({"error": f"Too many items (max {BATCH_MAX_ITEMS})"}), 400
+        max_concurrency = max(1, min(int(data.get("max_concurrency") or BATCH_MAX_CONCURRENCY), BATCH_MAX_CONCURRENCY))
+
+        # A. Validate the items; only the valid ones go to the generator
+        states, invalid = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get("cv_text"):
+                invalid.append((index, "cv_text missing"))
+                continue
+            states.append((index, {
+                "cv_text": item.get("cv_text"),
+                "job_role": item.get("job_role"),
+                "job_company": item.get("job_company"),
+                "job_country": item.get("job_country")
+            }))
+
+        # B. Hand the cohort over to the background worker, unless it could not start within its budget
+        queued_batches = batch_jobs.stats()["queued"]
+        admission.check("batch", ahead=queued_batches)
+        try:
+            job_id = batch_jobs.submit(run_batch_job, states, invalid, len(items), max_concurrency)
+        except JobQueueFull as e:
+            logger.warning(f"/start/batch rejected: {e}")
+            retry_after = str(admission.retry_after("batch", ahead=queued_batches))
+            return jsonify({"error": "Too many batches in progress, please retry"}), 503, {"Retry-After": retry_after}
 
+        logger.info(f"[API /start/batch]: {len(items)} items queued as job {job_id}.", extra={"job_id": job_id})
+        return jsonify({"job_id": job_id, "status": "queued", "items": len(items),
+                        "status_url": f"/api/batches/{job_id}"}), 202
+
+    except AdmissionRejected as rejected:
+        return rejection_response(rejected)
     except Exception as e:
-        print(f"!! ERROR in /start: {e} !!")
+        logger.error(f"ERROR in /start/batch: {e}")
+        record_error("api/start/batch", e)
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/batches/<job_id>', methods=['GET'])
+def get_batch_status(job_id):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(job)
+
 
 # --- 5. API Endpoint 2: /api/finish ---
-# (This part's code is [completely unchanged])
+# The Critic is slow (long prompt + long report), so it no longer runs inside the
+# HTTP request. We queue it as a background job and answer 202 with a job id;
+# the frontend then polls /api/jobs/<job_id> until the report is ready.
+def wait_for_answer_scores(session_id: str) -> List:
+    """
+    Waits (up to ANSWER_WAIT_SECONDS) for the answers this process is still scoring, then returns
+    all evaluations. The answer queue wakes us when a job finishes, nothing is polled. Answers
+    being scored by another worker process aren't waited for: the Critic scores whatever is
+    still missing itself (see critic.generate_critic_from_evaluations).
+    """
+    session_data = session_store.get(session_id) or {}
+    if not answer_jobs.wait(session_data.get("answer_jobs", []), ANSWER_WAIT_SECONDS):
+        logger.info(f"[Job /finish]: answers of {session_id} still being scored, the Critic scores them itself")
+    return (session_store.get(session_id) or session_data).get("answer_evaluations", [])
+
+
+def run_critic_job(progress, session_id: str, state_for_critic: Dict, transcript_digest: str = None) -> Dict:
+    """Background job body: calls "workstation 3" (Critic), stores the report and cleans up the session."""
+    progress("waiting_for_answer_scores")
+    state_for_critic = {**state_for_critic, "answer_evaluations": wait_for_answer_scores(session_id)}
+    progress("waiting_for_slot")
+    with admission.acquire("finish", shed=False):  # the highest-priority lane, never shed once queued
+        progress("running_critic")
+        logger.info("[Job /finish]: Calling Critic Node")
+        critic_result = generate_critic_node(state_for_critic)
+
+    if "error" in critic_result:
+        raise Exception(critic_result["error"])
+
+    progress("cleaning_up")
+    if transcript_digest:
+        report_store.put(session_id, transcript_digest, critic_result.get("final_review"))
+    session_store.delete(session_id)
+    logger.info("[Job /finish]: Final review ready.")
+    result = {"final_review": critic_result.get("final_review")}
+    if "sections" in critic_result:
+        result["sections"] = critic_result["sections"]  # per-section timings (CRITIC_MODE=sectioned)
+    return result
+
+
+# /api/finish is idempotent: a retry with the same session and transcript gets the
+# stored report (200), or joins the Critic job that is still running for it (202).
+# The (session, transcript) key is claimed in the job store first, so only one Critic
+# starts even when the retry lands on another worker process (see JobQueue.claim).
+
+
+def _report_response(report: Dict):
+    return jsonify({"job_id": None, "status": "succeeded", "cached": True,
+                    "result": {"final_review": report}}), 200
+
+
 @app.route('/api/finish', methods=['POST'])
 def finish_interview_session():
-    print("\n--- [API /finish]: Received finish request ---")
+    logger.info("[API /finish]: Received finish request")
     try:
         # A. Get data from the Vue.js JSON
         data = request.json
@@ -94,44 +456,159 @@ def finish_interview_session():
         if not session_id or not transcript:
             return jsonify({"error": "Missing session_id or transcript"}), 400
 
-        # B. Retrieve the session
-        session_data = global_session_store.get(session_id)
+        # B. Already written? (a retry after a timeout, or a second tab)
+        key = (session_id, transcript_hash(transcript))
+        report = report_store.get(*key)
+        if report is not None:
+            logger.info("[API /finish]: Returning the stored report.", extra={"session_id": session_id})
+            return _report_response(report)
+
+        # C. ...or being written right now (by any worker)? Then wait for that job instead of starting another
+        claim_key = ":".join(key)
+        job_id, claimed = critic_jobs.claim(claim_key)
+        if not claimed:
+            job = critic_jobs.get(job_id)
+            if job is not None and job["status"] == "succeeded":
+                return _report_response(job["result"]["final_review"])
+            logger.info(f"[API /finish]: Joining Critic job {job_id}.", extra={"session_id": session_id})
+            return jsonify({"job_id": job_id, "status": job["status"] if job else "queued", "coalesced": True,
+                            "status_url": f"/api/jobs/{job_id}"}), 202
+
+        # D. Retrieve the session
+        session_data = session_store.get(session_id)
         if not session_data:
+            critic_jobs.release(claim_key, job_id)
             return jsonify({"error": "Session not found or expired"}), 404
 
-        # C. Prepare the "conveyor belt" (State)
-        state_for_critic = {
-            "cv_text": session_data["cv_text"],
-            "job_role": session_data["job_role"],
-            "job_company": session_data["job_company"],
-            "job_country": session_data["job_country"],
-            "questions": session_data["questions"],
-            "interview_transcript": transcript 
-        }
-        
-        # D. !! [MANUALLY] call "workstation 3" (Critic) !!
-        print("--- [API /finish]: Calling Critic Node ---")
-        critic_result = generate_critic_node(state_for_critic) 
-        
-        if "error" in critic_result:
-            raise Exception(critic_result["error"])
-        
-        final_review = critic_result.get("final_review")
-        
-        # E. Clean up the session
-        del global_session_store[session_id]
-        
-        # F. Send the [final report] back to Vue.js
-        print("--- [API /finish]: Returning final review. ---")
-        return jsonify({"final_review": final_review})
+        # E. Prepare the "conveyor belt" (State) and hand the Critic over to the background workers,
+        #    unless the report could not be written within its budget anyway (shed early instead)
+        queued_critics = critic_jobs.stats()["queued"]
+        try:
+            admission.check("finish", ahead=queued_critics)
+        except AdmissionRejected as rejected:
+            critic_jobs.release(claim_key, job_id)
+            return rejection_response(rejected)
+        state_for_critic = critic_state_from_session(session_data, transcript)
+        try:
+            critic_jobs.submit(run_critic_job, session_id, state_for_critic, key[1], job_id=job_id)
+        except JobQueueFull as e:
+            critic_jobs.release(claim_key, job_id)
+            logger.warning(f"/finish rejected: {e}")
+            retry_after = str(admission.retry_after("finish", ahead=queued_critics))
+            return jsonify({"error": "Too many reports in progress, please retry"}), 503, {"Retry-After": retry_after}
+
+        # F. Tell Vue.js where to collect the [final report]
+        logger.info(f"[API /finish]: Critic job {job_id} queued.", extra={"session_id": session_id, "job_id": job_id})
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"}), 202
 
     except Exception as e:
-        print(f"!! ERROR in /finish: {e} !!")
+        logger.error(f"ERROR in /finish: {e}")
+        record_error("api/finish", e)
         return jsonify({"error": str(e)}), 500
 
 
-# --- 6. Start the server ---
+# "View my report" after the interview: the newest stored report of a session
+@app.route('/api/report/<session_id>', methods=['GET'])
+def get_report(session_id):
+    report = report_store.latest(session_id)
+    if report is None:
+        return jsonify({"error": "No report for this session (not finished yet, or expired)"}), 404
+    return jsonify({"session_id": session_id, **report})
+
+
+# --- 5a. API Endpoint: /api/answer (score answers during the interview) ---
+# Body: {"session_id", "question", "answer", "category": optional}
+# Called by the frontend after each candidate answer. Scoring runs in the background
+# and the result is kept on the session, so /api/finish only has to aggregate.
+def run_answer_job(progress, session_id: str, question: str, answer: str, category: str) -> Dict:
+    session_data = session_store.get(session_id)
+    if not session_data:
+        raise Exception("Session not found or expired")
+    progress("scoring")
+    with admission.acquire("answer", shed=False):
+        result = evaluate_answer_node(session_data, question, answer, category)
+    if "error" in result:
+        raise Exception(result["error"])
+    evaluation = result["evaluation"]
+    session_store.update(session_id, lambda s: s.setdefault("answer_evaluations", []).append(evaluation))
+    return {"evaluation": evaluation}
+
+
+@app.route('/api/answer', methods=['POST'])
+def score_answer():
+    data = request.get_json(silent=True) or {}
+    session_id = data.get("session_id")
+    question, answer = data.get("question"), data.get("answer")
+    if not session_id or not question or not answer:
+        return jsonify({"error": "Missing session_id, question or answer"}), 400
+    if session_store.get(session_id) is None:
+        return jsonify({"error": "Session not found or expired"}), 404
+
+    try:
+        job_id = answer_jobs.submit(run_answer_job, session_id, question, answer, data.get("category", "general"))
+    except JobQueueFull as e:
+        # Not fatal: the answer will simply be scored at /api/finish
+        logger.warning(f"/answer skipped: {e}")
+        return jsonify({"error": "Scoring queue is full, answer will be scored at the end"}), 503, \
+            {"Retry-After": str(admission.retry_after("answer"))}
+
+    session_store.update(session_id, lambda s: s.setdefault("answer_jobs", []).append(job_id))
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/api/answers/{job_id}"}), 202
+
+
+@app.route('/api/answers/<job_id>', methods=['GET'])
+def get_answer_status(job_id):
+    job = answer_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(job)
+
+
+# --- 5b. API Endpoint: /api/jobs/<job_id> ---
+# Status (queued / running / succeeded / failed), current stage and timing of a job.
+# When the job has succeeded, "result" holds {"final_review": ...}.
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = critic_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(job)
+
+
+@app.route('/api/sessions/stats', methods=['GET'])
+def session_store_stats():
+    return jsonify(session_store.stats())
+
+
+@app.route('/api/reports/stats', methods=['GET'])
+def report_store_stats():
+    return jsonify(report_store.stats())
+
+
+@app.route('/api/admission/stats', methods=['GET'])
+def admission_stats():
+    return jsonify(admission.stats())
+
+
+@app.route('/api/jobs/stats', methods=['GET'])
+def job_queue_stats():
+    return jsonify({**critic_jobs.stats(), "store": job_store.stats()})
+
+
+# --- 6. API Endpoint 3: /api/cache/stats ---
+# Hit/miss counters of the question cache (see question_cache.py)
+# and of the near-duplicate CV index (see similar_index.py)
+@app.route('/api/cache/stats', methods=['GET'])
+def question_cache_stats():
+    stats = question_cache.stats()
+    stats["similar_index"] = similar_index.stats() if similar_index is not None else None
+    return jsonify(stats)
+
+
+# --- 7. Start the server ---
 if __name__ == "__main__":
-    print("=== Starting Job Interview Agent Backend (Flask) ===")
+    logger.info("Starting Job Interview Agent Backend (Flask)")
+    if WARM_UP_ON_START:
+        warm_up()
     # Your Vue.js teammate will call http://127.0.0.1:5000/api/start
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,35 @@
+# gunicorn.conf.py
+# Optional production config for the Flask backend:
+#   gunicorn flask_server:app
+#
+# The app is imported once in the master (preload_app) and forked into the workers,
+# so the imports are paid only once. The LLM clients are NOT built before the fork
+# (their HTTP connection pools must not be shared between processes); each worker
+# builds its own in post_fork, before it accepts its first request.
+# With several workers, sessions, job records and reports must live in SQLite so that
+# /api/answer, /api/finish and the job polls work whichever worker they land on; this
+# config switches SESSION_STORE to sqlite, and falls back to one worker when the job or
+# report store was explicitly kept in memory (JOB_STORE_PATH="" / REPORT_STORE_PATH="").
+import os
+import sys
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+if workers > 1:
+    if os.environ.get("SESSION_STORE", "memory") != "sqlite":
+        print(f"gunicorn.conf: {workers} workers, using SESSION_STORE=sqlite", file=sys.stderr)
+        os.environ["SESSION_STORE"] = "sqlite"
+    in_memory = [name for name in ("JOB_STORE_PATH", "REPORT_STORE_PATH") if os.environ.get(name) == ""]
+    if in_memory:
+        print(f"gunicorn.conf: {', '.join(in_memory)} keeps state in memory, running 1 worker", file=sys.stderr)
+        workers = 1
+# The client-side LLM rate limiter is per process: give every worker its share of the account
+os.environ.setdefault("LLM_LIMIT_PROCESSES", str(workers))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+preload_app = True
+
+
+def post_fork(server, worker):
+    from flask_server import warm_up
+    warm_up()
@@ -1,25 +1,172 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
 import PyPDF2
 import docx
 
-def extract_text(file_path):
+from cv_compactor import PAGE_BREAK
+
+# --- Limits (all optional, read from the environment) ---
+# Files bigger than this are refused before we even open them
+MAX_FILE_BYTES = int(os.environ.get("EXTRACT_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+# Only the first N pages of a PDF are read; a CV never needs more
+MAX_PAGES = int(os.environ.get("EXTRACT_MAX_PAGES", "30"))
+# Extraction stops as soon as this many characters have been collected
+MAX_CHARS = int(os.environ.get("EXTRACT_MAX_CHARS", "200000"))
+# PDFs with at least this many pages (after the cap) are split across processes
+PARALLEL_PAGE_THRESHOLD = int(os.environ.get("EXTRACT_PARALLEL_PAGE_THRESHOLD", "12"))
+MAX_WORKERS = int(os.environ.get("EXTRACT_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages per task handed to a worker process; small ranges let extraction stop near MAX_CHARS
+PAGES_PER_TASK = int(os.environ.get("EXTRACT_PAGES_PER_TASK", "4"))
+# Worker processes are started with forkserver (or spawn), never fork: forking a threaded
+# server process can copy a held lock into the child and deadlock it
+START_METHOD = os.environ.get("EXTRACT_START_METHOD") or (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+class DocumentTooLarge(ValueError):
+    """The uploaded file is over MAX_FILE_BYTES."""
+
+
+def _check_file(file_path: str, max_bytes: int) -> None:
+    if not (file_path.endswith(".pdf") or file_path.endswith(".docx")):
+        raise ValueError("Unsupported file format. Only PDF and DOCX allowed.")
+    size = os.path.getsize(file_path)
+    if size > max_bytes:
+        raise DocumentTooLarge(f"File is {size} bytes, the limit is {max_bytes} bytes.")
+
+
+# --- Worker processes ---
+# One pool per server process, created on first use (so never before gunicorn forks)
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# The last PDF each thread opened (in the server and in the worker processes), so counting the
+# pages, reading them and the next page range don't parse the file again. Per thread, because a
+# PdfReader is not safe to share between threads.
+_reader_cache = threading.local()
+
+
+def _extraction_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context(START_METHOD))
+        return _pool
+
+
+def _cached_reader(file_path: str) -> "PyPDF2.PdfReader":
+    key = (file_path, os.path.getmtime(file_path))
+    if getattr(_reader_cache, "key", None) != key:
+        _reader_cache.key, _reader_cache.reader = key, PyPDF2.PdfReader(file_path)
+    return _reader_cache.reader
+
+
+def _extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extracts pages [start, stop) of a PDF. Top-level so worker processes can run it."""
+    reader = _cached_reader(file_path)
+    return [(reader.pages[i].extract_text() or "") + PAGE_BREAK for i in range(start, stop)]
+
+
+def _extract_parallel(file_path: str, pages_to_read: int, max_chars: int) -> Tuple[str, int]:
     """
-    Extracts text from PDF or Word (.docx) files.
-    Returns a single string with all the text.
+    Extracts the pages range by range on the shared pool, in page order, with at most
+    MAX_WORKERS ranges in flight. Stops submitting (and cancels what is queued) once
+    max_chars have been collected. Returns (text, pages read).
     """
-    text = ""
-    
+    pool = _extraction_pool()
+    ranges = deque((start, min(start + PAGES_PER_TASK, pages_to_read))
+                   for start in range(0, pages_to_read, PAGES_PER_TASK))
+    in_flight = deque()
+    parts: List[str] = []
+    collected = pages_read = 0
+    while (ranges or in_flight) and collected < max_chars:
+        while ranges and len(in_flight) < MAX_WORKERS:
+            in_flight.append(pool.submit(_extract_pdf_pages, file_path, *ranges.popleft()))
+        for page_text in in_flight.popleft().result():
+            if collected >= max_chars:
+                break
+            parts.append(page_text)
+            collected += len(page_text)
+            pages_read += 1
+    for future in in_flight:
+        future.cancel()
+    return "".join(parts)[:max_chars], pages_read
+
+
+def iter_text(file_path, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS,
+              max_bytes: int = MAX_FILE_BYTES) -> Iterator[str]:
+    """
+    Yields the text of a PDF page by page (or of a .docx paragraph by paragraph),
+    stopping early once 'max_pages' or 'max_chars' is reached.
+    Every PDF page ends with PAGE_BREAK (a form feed), every paragraph with "\n".
+    """
+    _check_file(file_path, max_bytes)
+    collected = 0
+
     if file_path.endswith(".pdf"):
-        with open(file_path, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-                
-    elif file_path.endswith(".docx"):
+        reader = _cached_reader(file_path)
+        for i in range(min(len(reader.pages), max_pages)):
+            page_text = (reader.pages[i].extract_text() or "") + PAGE_BREAK
+            yield page_text[: max_chars - collected]
+            collected += len(page_text)
+            if collected >= max_chars:
+                return
+
+    else:
         doc = docx.Document(file_path)
         for para in doc.paragraphs:
-            text += para.text + "\n"
-    
+            para_text = para.text + "\n"
+            yield para_text[: max_chars - collected]
+            collected += len(para_text)
+            if collected >= max_chars:
+                return
+
+
+def extract_document(file_path, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS,
+                     max_bytes: int = MAX_FILE_BYTES, parallel: Optional[bool] = None) -> Dict:
+    """
+    Extracts text from PDF or Word (.docx) files, within the limits above.
+    Returns {"text", "pages_read", "total_pages", "truncated"}
+    (page counts are None for .docx).
+    PDF pages end with PAGE_BREAK ("\f", like pdftotext) instead of "\n", so
+    cv_compactor.normalize_cv() can tell running headers and footers from the content.
+    Everything downstream treats it as whitespace: the prompts get the normalized CV,
+    and the cache keys and the minhash collapse whitespace.
+    Large PDFs are extracted in parallel, a few pages per task on a shared process pool.
+    """
+    _check_file(file_path, max_bytes)
+
+    if file_path.endswith(".docx"):
+        parts = list(iter_text(file_path, max_pages, max_chars, max_bytes))
+        text = "".join(parts)
+        return {"text": text, "pages_read": None, "total_pages": None, "truncated": len(text) >= max_chars}
+
+    total_pages = len(_cached_reader(file_path).pages)  # iter_text() reuses this reader
+    pages_to_read = min(total_pages, max_pages)
+
+    if parallel is None:
+        parallel = pages_to_read >= PARALLEL_PAGE_THRESHOLD and MAX_WORKERS > 1
+    if parallel:
+        text, pages_read = _extract_parallel(file_path, pages_to_read, max_chars)
     else:
-        raise ValueError("Unsupported file format. Only PDF and DOCX allowed.")
-    
-    return text
\ No newline at end of file
+        parts = list(iter_text(file_path, max_pages, max_chars, max_bytes))
+        text, pages_read = "".join(parts), len(parts)
+
+    return {
+        "text": text,
+        "pages_read": pages_read,
+        "total_pages": total_pages,
+        "truncated": pages_read < total_pages or len(text) >= max_chars,
+    }
+
+
+def extract_text(file_path, **limits):
+    """
+    Extracts text from PDF or Word (.docx) files.
+    Returns a single string with all the text (PDF pages separated by PAGE_BREAK).
+    """
+    return extract_document(file_path, **limits)["text"]
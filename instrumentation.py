@@ -0,0 +1,382 @@
+# instrumentation.py
+# Built-in metrics and structured logging (no extra dependencies).
+#   - Counter / Histogram / gauge callbacks, rendered in the Prometheus text format (/metrics)
+#   - span() and instrument_node() to time nodes and stages
+#   - ChainMetricsHandler, a LangChain callback that times prompt / LLM / parser
+#     separately and records token usage per call
+#   - get_logger(), JSON log lines instead of print()
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+import functools
+import inspect
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# --- 1. Structured logging ---
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # "json" or "text"
+
+_RESERVED_LOG_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; anything passed via extra={...} becomes a field."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_LOG_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_logging_configured = False
+_logging_lock = threading.Lock()
+
+
+def configure_logging() -> None:
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        if LOG_FORMAT == "json":
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        root = logging.getLogger("mvita")
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        _logging_configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(f"mvita.{name}")
+
+
+# --- 2. Metric types ---
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help_text = name, help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Quantiles (p50/p95/p99) are estimated from the buckets
+    by linear interpolation, the same way Prometheus' histogram_quantile() does.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help_text = name, help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0})
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            return self._quantile_locked(series, q) if series else None
+
+    def _quantile_locked(self, series: Dict[str, Any], q: float) -> Optional[float]:
+        if not series["count"]:
+            return None
+        rank = q * series["count"]
+        cumulative = 0
+        for i, count in enumerate(series["counts"]):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * ((rank - cumulative) / count)
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        quantile_lines = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {round(series['sum'], 6)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+                for q in QUANTILES:
+                    value = self._quantile_locked(series, q)
+                    quantile_lines.append(f"{self.name}_quantile{_format_labels(key, [('quantile', str(q))])} {round(value, 6)}")
+        if quantile_lines:
+            lines += [f"# HELP {self.name}_quantile Estimated quantiles of {self.name}",
+                      f"# TYPE {self.name}_quantile gauge"] + quantile_lines
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], Any]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def gauge_callback(self, name: str, help_text: str, fn: Callable[[], Any]) -> None:
+        """
+        'fn' returns a number, or a list of (labels_dict, number) for labelled gauges.
+        It is called on every scrape.
+        """
+        with self._lock:
+            self._gauges[name] = (help_text, fn)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            gauges = list(self._gauges.items())
+        lines: List[str] = []
+        for metric in metrics:
+            lines += metric.render()
+        for name, (help_text, fn) in gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                logging.getLogger("mvita.instrumentation").warning("gauge failed", extra={"gauge": name, "error": str(e)})
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            samples = value if isinstance(value, list) else [({}, value)]
+            for labels, sample in samples:
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {sample}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- 3. The metrics every module shares ---
+NODE_DURATION = registry.histogram("mvita_node_duration_seconds", "Duration of each workflow node")
+STAGE_DURATION = registry.histogram("mvita_stage_duration_seconds", "Duration of chain stages (prompt, llm, parser)")
+REQUEST_DURATION = registry.histogram("mvita_http_request_duration_seconds", "HTTP request latency per endpoint")
+REQUESTS = registry.counter("mvita_http_requests_total", "HTTP requests per endpoint and status")
+ERRORS = registry.counter("mvita_errors_total", "Errors by where they happened and exception type")
+TOKENS = registry.counter("mvita_llm_tokens_total", "LLM tokens used, by chain and direction")
+LLM_CALLS = registry.counter("mvita_llm_calls_total", "LLM calls per chain")
+# Input tokens the provider served from its prompt cache (cache="hit") vs. processed in full ("miss")
+INPUT_TOKENS = registry.counter("mvita_llm_input_tokens_total", "LLM input tokens by chain and provider prompt cache hit/miss")
+
+
+def record_error(where: str, error: BaseException) -> None:
+    ERRORS.inc(where=where, type=type(error).__name__)
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """Times the block into mvita_stage_duration_seconds; exceptions are counted and re-raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record_error(stage, e)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage=stage, **labels)
+
+
+def instrument_node(node: str):
+    """
+    Decorator for the "workstations". Times every call into mvita_node_duration_seconds
+    and counts results that carry an "error" key. Works for sync, async and generator nodes.
+    """
+    def observe(started: float, result: Any) -> None:
+        outcome = "error" if isinstance(result, dict) and "error" in result else "ok"
+        if outcome == "error":
+            ERRORS.inc(where=node, type="NodeError")
+        NODE_DURATION.observe(time.perf_counter() - started, node=node, outcome=outcome)
+
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    yield from fn(*args, **kwargs)
+                except Exception as e:
+                    record_error(node, e)
+                    NODE_DURATION.observe(time.perf_counter() - started, node=node, outcome="error")
+                    raise
+                observe(started, None)
+            return generator_wrapper
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                result = await fn(*args, **kwargs)
+                observe(started, result)
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = fn(*args, **kwargs)
+            observe(started, result)
+            return result
+        return wrapper
+
+    return decorator
+
+
+# --- 4. LangChain callback: per-stage timing and token usage ---
+class ChainMetricsHandler(BaseCallbackHandler):
+    """
+    Attach with chain.with_config(callbacks=[ChainMetricsHandler("questions")]).
+    Times the prompt, the LLM call and the parser of every run separately.
+    """
+
+    def __init__(self, chain: str):
+        self.chain = chain
+        self._starts: Dict[UUID, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stage_of(serialized: Optional[Dict[str, Any]], name: Optional[str], parent_run_id: Optional[UUID]) -> Optional[str]:
+        name = name or (serialized or {}).get("name") or ""
+        if "PromptTemplate" in name:
+            return "prompt"
+        if "Parser" in name:
+            return "parser"
+        if parent_run_id is None:
+            return "chain"
+        return None
+
+    def _start(self, run_id: UUID, stage: Optional[str]) -> None:
+        if stage:
+            with self._lock:
+                self._starts[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        stage, started_at = started
+        STAGE_DURATION.observe(time.perf_counter() - started_at, stage=stage, chain=self.chain)
+        if error is not None:
+            ERRORS.inc(where=f"{self.chain}.{stage}", type=type(error).__name__)
+
+    # A. Chains (the sequence itself, the prompt and the parser)
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, self._stage_of(serialized, kwargs.get("name"), parent_run_id))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # B. The model
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+        LLM_CALLS.inc(chain=self.chain)
+        input_tokens, output_tokens, cached_tokens = _token_usage(response)
+        if input_tokens:
+            TOKENS.inc(input_tokens, chain=self.chain, direction="input")
+            INPUT_TOKENS.inc(cached_tokens, chain=self.chain, cache="hit")
+            INPUT_TOKENS.inc(input_tokens - cached_tokens, chain=self.chain, cache="miss")
+        if output_tokens:
+            TOKENS.inc(output_tokens, chain=self.chain, direction="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+def _token_usage(response) -> Tuple[int, int, int]:
+    """
+    Reads (input, output, cached input) tokens from an LLMResult (usage_metadata first, then llm_output).
+    Cached input tokens are the part of the prompt the provider served from its prompt cache.
+    """
+    for generations in response.generations or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0), cached
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached
+
+
+def metrics_callbacks(chain: str) -> Dict[str, Any]:
+    """Config for chain.with_config(**metrics_callbacks("questions"))."""
+    return {"callbacks": [ChainMetricsHandler(chain)]}
@@ -0,0 +1,244 @@
+# job_queue.py
+# A small in-process background job queue.
+# Slow work (e.g. the Critic) is handed to a worker pool and the HTTP request
+# returns a job id straight away. The client then polls for the result.
+# Jobs run in the process that accepted them; with a JobStore their records are written
+# through to SQLite, so a poll that lands on another worker process still finds them.
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from instrumentation import get_logger, registry
+from job_store import CLAIM_TIMEOUT_SECONDS, JobStore
+
+logger = get_logger("job_queue")
+JOB_WAIT = registry.histogram("mvita_job_queue_wait_seconds", "Time jobs spend queued before a worker picks them up")
+JOB_RUN = registry.histogram("mvita_job_run_seconds", "Time jobs spend running")
+
+# --- 1. Config ---
+DEFAULT_MAX_WORKERS = int(os.environ.get("JOB_QUEUE_WORKERS", "4"))
+DEFAULT_MAX_PENDING = int(os.environ.get("JOB_QUEUE_MAX_PENDING", "64"))
+DEFAULT_RESULT_TTL_SECONDS = float(os.environ.get("JOB_QUEUE_RESULT_TTL_SECONDS", "3600"))
+
+# Job states, in the order a job moves through them
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when too many jobs are already waiting or running."""
+
+
+# --- 2. The queue ---
+class JobQueue:
+    """
+    Runs jobs on a thread pool and remembers their status for polling.
+    The number of unfinished jobs is bounded by 'max_pending';
+    finished jobs are kept for 'result_ttl_seconds' so clients can fetch them.
+    With a 'store', job records are shared with the other worker processes (see job_store.py).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        result_ttl_seconds: float = DEFAULT_RESULT_TTL_SECONDS,
+        store: Optional[JobStore] = None,
+    ):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl_seconds = result_ttl_seconds
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-job")
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)  # notified whenever a job finishes
+        self._counters = {"submitted": 0, "succeeded": 0, "failed": 0, "rejected": 0}
+        self._claims: Dict[str, str] = {}  # claim key -> job id, without a store
+        self._unsubmitted: Dict[str, float] = {}  # claimed job id -> claimed at, until submit() or release()
+
+    # A. Submitting work
+    def submit(self, fn: Callable[..., Any], *args, job_id: Optional[str] = None, **kwargs) -> str:
+        """
+        Queues fn(progress, *args, **kwargs) and returns the job id.
+        'progress' is a callable the job can use to report its current stage.
+        'job_id' is the id a claim() returned, if the job was claimed first.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._prune_locked()
+            if self._pending_locked() >= self.max_pending:
+                self._counters["rejected"] += 1
+                raise JobQueueFull(f"{self.name} queue is full ({self.max_pending} jobs pending)")
+            self._jobs[job_id] = new_job(job_id)
+            self._unsubmitted.pop(job_id, None)
+            self._counters["submitted"] += 1
+            job = dict(self._jobs[job_id])
+        if self.store is not None:
+            self.store.put(self.name, job)
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def claim(self, key: str) -> Tuple[str, bool]:
+        """
+        Makes sure only one job runs for 'key', across all worker processes when there is a store.
+        Returns (new job id, True): submit the job with submit(..., job_id=...) or release() the claim;
+        or (job id, False) for the job that is already queued, running or done for this key.
+        """
+        job = new_job(uuid.uuid4().hex)
+        if self.store is not None:
+            holder = self.store.claim(f"{self.name}:{key}", self.name, job)
+            return holder, holder == job["job_id"]
+        with self._lock:
+            holder = self._claims.get(key)
+            if holder in self._jobs and self._jobs[holder]["status"] != FAILED:
+                return holder, False
+            # Claimed but not submitted yet: the claimer is about to submit (or release) it
+            if holder in self._unsubmitted and time.time() - self._unsubmitted[holder] < CLAIM_TIMEOUT_SECONDS:
+                return holder, False
+            self._unsubmitted.pop(holder, None)
+            self._claims[key] = job["job_id"]
+            self._unsubmitted[job["job_id"]] = time.time()
+            return job["job_id"], True
+
+    def release(self, key: str, job_id: str) -> None:
+        """Gives up a claim that was never submitted."""
+        if self.store is not None:
+            self.store.release(f"{self.name}:{key}", job_id)
+        with self._lock:
+            self._unsubmitted.pop(job_id, None)
+            if self._claims.get(key) == job_id:
+                del self._claims[key]
+
+    # B. Polling
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return describe_job(job)
+        # Not one of ours: it may be running in another worker process
+        job = self.store.get(job_id, queue=self.name) if self.store is not None else None
+        return describe_job(job) if job is not None else None
+
+    def wait(self, job_ids: List[str], timeout: float) -> bool:
+        """
+        Blocks until none of 'job_ids' that run in this process is queued or running (no polling:
+        finishing jobs wake the waiters), or until 'timeout'. Returns False on timeout.
+        Jobs of other worker processes are not waited for.
+        """
+        deadline = time.monotonic() + timeout
+        with self._finished:
+            while any(job_id in self._jobs and self._jobs[job_id]["status"] in (QUEUED, RUNNING) for job_id in job_ids):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._finished.wait(remaining)
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job["status"] == QUEUED)
+            running = sum(1 for job in self._jobs.values() if job["status"] == RUNNING)
+            return {
+                **self._counters,
+                "queued": queued,
+                "running": running,
+                "max_pending": self.max_pending,
+                "max_workers": self.max_workers,
+            }
+
+    # C. Internals
+    def _run(self, job_id: str, fn: Callable[..., Any], args, kwargs) -> None:
+        started_at = time.time()
+        with self._lock:
+            JOB_WAIT.observe(started_at - self._jobs[job_id]["queued_at"], queue=self.name)
+        self._update(job_id, status=RUNNING, stage=RUNNING, started_at=started_at)
+
+        def progress(stage: str) -> None:
+            self._update(job_id, stage=stage)
+
+        try:
+            result = fn(progress, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"ERROR in {self.name} job {job_id}: {e}", extra={"queue": self.name, "job_id": job_id})
+            JOB_RUN.observe(time.time() - started_at, queue=self.name, outcome="failed")
+            self._update(job_id, status=FAILED, stage=FAILED, error=str(e), finished_at=time.time())
+            with self._lock:
+                self._counters["failed"] += 1
+                self._finished.notify_all()
+            return
+        self._update(job_id, status=SUCCEEDED, stage=SUCCEEDED, result=result, finished_at=time.time())
+        JOB_RUN.observe(time.time() - started_at, queue=self.name, outcome="succeeded")
+        with self._lock:
+            self._counters["succeeded"] += 1
+            self._finished.notify_all()
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+        if self.store is not None:
+            self.store.update(job_id, **fields)
+
+    def _pending_locked(self) -> int:
+        return sum(1 for job in self._jobs.values() if job["status"] in (QUEUED, RUNNING))
+
+    def _prune_locked(self) -> None:
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        # Claims whose job was claimed but not submitted yet are kept too, until they time out
+        claim_cutoff = time.time() - CLAIM_TIMEOUT_SECONDS
+        self._unsubmitted = {job_id: claimed_at for job_id, claimed_at in self._unsubmitted.items()
+                             if claimed_at >= claim_cutoff}
+        self._claims = {key: job_id for key, job_id in self._claims.items()
+                        if job_id in self._jobs or job_id in self._unsubmitted}
+
+
+# --- 3. Job records ---
+# Also used by asgi_server.py, which runs its Critic jobs on the event loop
+# but keeps the same records in the same JobStore, so either server answers a poll.
+def new_job(job_id: str) -> Dict[str, Any]:
+    return {
+        "job_id": job_id,
+        "status": QUEUED,
+        "stage": QUEUED,
+        "queued_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+
+
+def describe_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """What /api/jobs/<job_id> returns: status, stage, timing, and the result or error once finished."""
+    now = time.time()
+    started_at, finished_at = job["started_at"], job["finished_at"]
+    description = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "timing": {
+            "queued_seconds": round((started_at or now) - job["queued_at"], 3),
+            "run_seconds": round((finished_at or now) - started_at, 3) if started_at else None,
+            "total_seconds": round((finished_at or now) - job["queued_at"], 3),
+        },
+    }
+    if job["status"] == SUCCEEDED:
+        description["result"] = job["result"]
+    if job["status"] == FAILED:
+        description["error"] = job["error"]
+    return description
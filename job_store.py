@@ -0,0 +1,198 @@
+# job_store.py
+# Background job records shared by every worker process.
+# A JobQueue runs its jobs in the process that accepted them, but with several gunicorn
+# workers the poll (/api/jobs/<id>, /api/answers/<id>) usually lands on another process,
+# which used to answer 404. Every queue now writes its job records (status, stage,
+# timings, result, error) through to this store, and a poll for a job this process
+# doesn't know reads it from here.
+# claim() lets exactly one worker start the job for a key, e.g. the Critic for a
+# (session, transcript) at /api/finish: the others join the job that holds the claim.
+# Stored in SQLite (WAL) next to the reports (same file as report_store.py by default);
+# records expire JOB_STORE_TTL_SECONDS after their last update. JOB_STORE_PATH="" keeps
+# them in memory only.
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from instrumentation import get_logger
+from report_store import DEFAULT_PATH as REPORT_STORE_PATH
+
+logger = get_logger("job_store")
+
+# --- 1. Config ---
+DEFAULT_PATH = os.environ.get("JOB_STORE_PATH", REPORT_STORE_PATH)
+DEFAULT_TTL_SECONDS = float(os.environ.get("JOB_STORE_TTL_SECONDS", "3600"))
+# An unfinished job older than this no longer holds its claim (its worker probably died)
+CLAIM_TIMEOUT_SECONDS = float(os.environ.get("JOB_CLAIM_TIMEOUT_SECONDS", "900"))
+
+# Columns of a job record; "result" is kept as JSON
+FIELDS = ("job_id", "queue", "status", "stage", "queued_at", "started_at", "finished_at", "result", "error")
+
+
+# --- 2. The store ---
+class JobStore:
+    def __init__(self, db_path: Optional[str] = DEFAULT_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.db_path = db_path or None
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        # In memory there is one shared connection, used under _memory_lock
+        self._memory_conn = None if self.db_path else sqlite3.connect(":memory:", check_same_thread=False,
+                                                                        isolation_level=None)
+        self._memory_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    queue TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    queued_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_claims (
+                    claim_key TEXT PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    claimed_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if self._memory_conn is not None:
+            with self._memory_lock:
+                yield self._memory_conn
+            return
+        # One connection per thread; WAL lets readers and a writer work at the same time
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        yield conn
+
+    # A. Public API
+    def put(self, queue: str, job: Dict[str, Any]) -> None:
+        """Writes a whole job record (a new job)."""
+        now = time.time()
+        row = {**job, "queue": queue, "result": json.dumps(job.get("result"), ensure_ascii=False)}
+        with self._connection() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(FIELDS)}, expires_at) VALUES ({', '.join('?' * len(FIELDS))}, ?)",
+                (*(row.get(field) for field in FIELDS), now + self.ttl_seconds),
+            )
+            conn.execute("DELETE FROM jobs WHERE expires_at < ?", (now,))
+
+    def update(self, job_id: str, **fields) -> None:
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connection() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments}, expires_at = ? WHERE job_id = ?",
+                (*fields.values(), time.time() + self.ttl_seconds, job_id),
+            )
+
+    def get(self, job_id: str, queue: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The job record (as JobQueue keeps it), or None if unknown, expired or from another queue."""
+        with self._connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM jobs WHERE job_id = ? AND expires_at >= ?",
+                (job_id, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(FIELDS, row))
+        if queue is not None and job["queue"] != queue:
+            return None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim(self, key: str, queue: str, job: Dict[str, Any]) -> str:
+        """
+        Claims 'key' for the new (queued) job and returns its id, or returns the id of the job
+        that already holds the claim and is queued, running or succeeded. A failed, expired or
+        timed out holder loses the claim. Atomic across worker processes.
+        """
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT c.job_id, c.claimed_at, j.status FROM job_claims c "
+                    "LEFT JOIN jobs j ON j.job_id = c.job_id AND j.expires_at >= ? WHERE c.claim_key = ?",
+                    (now, key),
+                ).fetchone()
+                if row is not None:
+                    holder, claimed_at, status = row
+                    if status == "succeeded" or (status in ("queued", "running") and now - claimed_at < CLAIM_TIMEOUT_SECONDS):
+                        conn.execute("COMMIT")
+                        return holder
+                conn.execute("INSERT OR REPLACE INTO job_claims (claim_key, job_id, claimed_at) VALUES (?, ?, ?)",
+                             (key, job["job_id"], now))
+                conn.execute("DELETE FROM job_claims WHERE claimed_at < ?", (now - self.ttl_seconds,))
+                row = {**job, "queue": queue, "result": json.dumps(job.get("result"), ensure_ascii=False)}
+                conn.execute(
+                    f"INSERT OR REPLACE INTO jobs ({', '.join(FIELDS)}, expires_at) VALUES ({', '.join('?' * len(FIELDS))}, ?)",
+                    (*(row.get(field) for field in FIELDS), now + self.ttl_seconds),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return job["job_id"]
+
+    def release(self, key: str, job_id: str) -> None:
+        """Gives up a claim whose job was never started (e.g. the queue was full)."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM job_claims WHERE claim_key = ? AND job_id = ?", (key, job_id))
+            conn.execute("DELETE FROM jobs WHERE job_id = ? AND status = 'queued' AND started_at IS NULL", (job_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT queue, status, COUNT(*) FROM jobs WHERE expires_at >= ? GROUP BY queue, status", (time.time(),)
+            ).fetchall()
+        by_queue: Dict[str, Dict[str, int]] = {}
+        for queue, status, count in rows:
+            by_queue.setdefault(queue, {})[status] = count
+        return {"queues": by_queue, "ttl_seconds": self.ttl_seconds, "persistent": bool(self.db_path)}
+
+
+if __name__ == "__main__":
+    print("--- Testing job_store ---")
+    store = JobStore(db_path="", ttl_seconds=60)
+    store.put("critic", {"job_id": "job_1", "status": "queued", "stage": "queued", "queued_at": time.time(),
+                         "started_at": None, "finished_at": None, "result": None, "error": None})
+    store.update("job_1", status="succeeded", stage="succeeded", finished_at=time.time(),
+                 result={"final_review": {"decision": "PASS"}})
+    reader = threading.Thread(target=lambda: print("from another thread:", store.get("job_1")))
+    reader.start()
+    reader.join()
+    print("other queue:", store.get("job_1", queue="answer"))
+
+    def new_job(job_id: str) -> Dict[str, Any]:
+        return {"job_id": job_id, "status": "queued", "stage": "queued", "queued_at": time.time()}
+
+    print("claimed by job_2:", store.claim("session_1:abc", "critic", new_job("job_2")))
+    print("second worker joins:", store.claim("session_1:abc", "critic", new_job("job_3")))
+    store.update("job_2", status="failed", stage="failed", error="boom", finished_at=time.time())
+    print("after a failure, retry claims:", store.claim("session_1:abc", "critic", new_job("job_4")))
+    store.release("session_1:abc", "job_4")
+    print("after a release:", store.claim("session_1:abc", "critic", new_job("job_5")))
+    print(store.stats())
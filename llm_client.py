@@ -0,0 +1,311 @@
+# llm_client.py
+# The one place that builds chat models.
+# question_generator.py and critic.py used to create their own ChatOpenAI, each with its
+# own HTTP connection pool and no idea of the provider's limits. Now:
+#   - every model shares one keep-alive httpx pool (sync and async)
+#   - the same (model, temperature) is the same client object in every node
+#   - a client-side token bucket enforces the account's requests-per-minute and
+#     tokens-per-minute limits. A call over the limit waits its turn (up to
+#     LLM_LIMIT_MAX_WAIT_SECONDS) instead of being sent and bouncing with a 429.
+#     The buckets live in each process, so the account's limits are split evenly between
+#     the LLM_LIMIT_PROCESSES worker processes (gunicorn.conf.py sets it to its worker count).
+#
+# This module imports langchain_openai, so the nodes import it lazily (see get_question_chain()).
+import os
+import time
+import asyncio
+import threading
+from typing import Any, Dict, List, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from cv_compactor import count_tokens
+from instrumentation import get_logger, registry
+
+logger = get_logger("llm_client")
+
+# --- 1. Config ---
+MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", "40"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("LLM_KEEPALIVE_EXPIRY_SECONDS", "90"))
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+# Account-wide limits; each process enforces its share of them
+LIMIT_PROCESSES = max(1, int(os.environ.get("LLM_LIMIT_PROCESSES", "1")))
+RPM_LIMIT = float(os.environ.get("LLM_RPM_LIMIT", "500")) / LIMIT_PROCESSES        # 0 = unlimited
+TPM_LIMIT = float(os.environ.get("LLM_TPM_LIMIT", "200000")) / LIMIT_PROCESSES     # 0 = unlimited
+LIMIT_MAX_WAIT_SECONDS = float(os.environ.get("LLM_LIMIT_MAX_WAIT_SECONDS", "10"))
+EXPECTED_OUTPUT_TOKENS = int(os.environ.get("LLM_EXPECTED_OUTPUT_TOKENS", "800"))
+
+LIMITER_WAIT = registry.histogram("mvita_llm_limiter_wait_seconds", "Time LLM calls waited for the client-side rate limiter")
+LIMITER_REJECTED = registry.counter("mvita_llm_limiter_rejected_total", "LLM calls rejected because the limiter wait was too long")
+
+
+class LLMRateLimited(RuntimeError):
+    """Our own limiter would have to wait longer than LIMIT_MAX_WAIT_SECONDS."""
+
+    # Not a provider problem, so resilience.py must not open the circuit breaker for it
+    counts_as_provider_failure = False
+
+
+# --- 2. Rate limiter ---
+class TokenBucket:
+    """Refills 'per_minute' units per minute, holds at most one minute's worth. Not thread-safe on its own."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount: float) -> float:
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets checked together.
+    A caller that has to wait reserves its share up front (the bucket goes negative),
+    so waiters are served in arrival order and nobody starves.
+    """
+
+    def __init__(self, rpm: float = RPM_LIMIT, tpm: float = TPM_LIMIT, max_wait_seconds: float = LIMIT_MAX_WAIT_SECONDS):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._counters = {"admitted": 0, "delayed": 0, "rejected": 0}
+
+    def _clamped(self, tokens: int) -> float:
+        # A request estimated over the whole bucket could never be admitted; it waits for a full bucket instead
+        return min(tokens, self.tokens.capacity) if self.tokens is not None else tokens
+
+    def reserve(self, tokens: int) -> float:
+        """Reserves one request and 'tokens' tokens (at most a full bucket); returns how long the caller must sleep first."""
+        now = time.monotonic()
+        with self._lock:
+            buckets = [(b, n) for b, n in ((self.requests, 1), (self.tokens, self._clamped(tokens))) if b is not None]
+            for bucket, _ in buckets:
+                bucket.refill(now)
+            wait = max((bucket.wait_for(amount) for bucket, amount in buckets), default=0.0)
+            if wait > self.max_wait_seconds:
+                self._counters["rejected"] += 1
+                LIMITER_REJECTED.inc()
+                raise LLMRateLimited(f"LLM rate limit reached, the next slot is {wait:.1f}s away")
+            for bucket, amount in buckets:
+                bucket.level -= amount
+            self._counters["admitted"] += 1
+            if wait > 0:
+                self._counters["delayed"] += 1
+                self._waiting += 1
+        LIMITER_WAIT.observe(wait)
+        return wait
+
+    def done_waiting(self) -> None:
+        with self._lock:
+            self._waiting -= 1
+
+    def acquire(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self.done_waiting()
+
+    async def aacquire(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.done_waiting()
+
+    def headroom(self) -> float:
+        """The share of the buckets available right now (the lower of the two); 1.0 without limits."""
+        now = time.monotonic()
+        with self._lock:
+            shares = []
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+                    shares.append(bucket.level / bucket.capacity)
+            return min(shares, default=1.0)
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Gives back (or charges) the difference between the estimate and the real token usage."""
+        if self.tokens is not None and actual:
+            with self._lock:
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + self._clamped(estimated) - actual)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+            return {
+                **self._counters,
+                "waiting": self._waiting,
+                "requests_available": round(self.requests.level, 1) if self.requests else None,
+                "tokens_available": round(self.tokens.level) if self.tokens else None,
+                "rpm_limit": self.requests.capacity if self.requests else None,
+                "tpm_limit": self.tokens.capacity if self.tokens else None,
+                "limit_processes": LIMIT_PROCESSES,
+            }
+
+
+limiter = RateLimiter()
+registry.gauge_callback("mvita_llm_limiter_waiting", "LLM calls waiting for the client-side rate limiter",
+                        lambda: limiter.stats()["waiting"])
+
+
+# --- 3. Shared HTTP pools ---
+_http_lock = threading.Lock()
+_http_clients: Dict[str, Any] = {}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def http_clients(timeout_seconds: float) -> Tuple[httpx.Client, httpx.AsyncClient]:
+    # The async pool is only used from asgi_server.py's single event loop; pooled
+    # async connections can't be shared across loops (e.g. one asyncio.run() per request).
+    with _http_lock:
+        if not _http_clients:
+            timeout = httpx.Timeout(timeout_seconds, connect=CONNECT_TIMEOUT_SECONDS)
+            _http_clients["sync"] = httpx.Client(limits=_limits(), timeout=timeout)
+            _http_clients["async"] = httpx.AsyncClient(limits=_limits(), timeout=timeout)
+        return _http_clients["sync"], _http_clients["async"]
+
+
+# --- 4. The rate-limited model ---
+def _estimate_tokens(messages: List[Any], kwargs: Dict[str, Any]) -> int:
+    prompt_tokens = sum(count_tokens(str(getattr(m, "content", m))) for m in messages)
+    return prompt_tokens + int(kwargs.get("max_tokens") or EXPECTED_OUTPUT_TOKENS)
+
+
+def _actual_tokens(result) -> int:
+    usage = (getattr(result, "llm_output", None) or {}).get("token_usage") or {}
+    if usage.get("total_tokens"):
+        return usage["total_tokens"]
+    for generation in getattr(result, "generations", None) or []:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            return usage.get("total_tokens", 0)
+    return 0
+
+
+class _StreamUsage:
+    """
+    The real token usage of a streamed call: the provider's usage chunk (stream_usage=True),
+    or, if it sends none, the prompt plus the streamed text counted with our tokenizer.
+    """
+
+    def __init__(self, messages: List[Any]):
+        self._messages = messages
+        self._reported = 0
+        self._text: List[str] = []
+
+    def add(self, chunk) -> None:
+        message = getattr(chunk, "message", None)
+        usage = getattr(message, "usage_metadata", None)
+        if usage and usage.get("total_tokens"):
+            self._reported = usage["total_tokens"]
+        self._text.append(str(getattr(message, "content", "") or ""))
+
+    def total(self) -> int:
+        if self._reported:
+            return self._reported
+        prompt_tokens = sum(count_tokens(str(getattr(m, "content", m))) for m in self._messages)
+        return prompt_tokens + count_tokens("".join(self._text))
+
+
+class PooledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that waits for the shared rate limiter before every request."""
+
+    def rate_limit_headroom(self) -> float:
+        """Used by resilience.py to decide whether a sync hedge can be afforded."""
+        return limiter.headroom()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = _estimate_tokens(messages, kwargs)
+        limiter.acquire(estimated)
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        limiter.settle(estimated, _actual_tokens(result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = _estimate_tokens(messages, kwargs)
+        await limiter.aacquire(estimated)
+        result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        limiter.settle(estimated, _actual_tokens(result))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = _estimate_tokens(messages, kwargs)
+        limiter.acquire(estimated)
+        usage = _StreamUsage(messages)
+        for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            usage.add(chunk)
+            yield chunk
+        limiter.settle(estimated, usage.total())
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = _estimate_tokens(messages, kwargs)
+        await limiter.aacquire(estimated)
+        usage = _StreamUsage(messages)
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            usage.add(chunk)
+            yield chunk
+        limiter.settle(estimated, usage.total())
+
+
+_models_lock = threading.Lock()
+_models: Dict[Tuple[str, float], PooledChatOpenAI] = {}
+
+
+def get_chat_model(model_name: str, temperature: float = 0.3, timeout_seconds: float = 60.0) -> PooledChatOpenAI:
+    """The shared client for (model, temperature); built once, then reused by every node."""
+    with _models_lock:
+        key = (model_name, temperature)
+        if key not in _models:
+            sync_client, async_client = http_clients(timeout_seconds)
+            _models[key] = PooledChatOpenAI(
+                model=model_name, temperature=temperature, timeout=timeout_seconds,
+                http_client=sync_client, http_async_client=async_client,
+                stream_usage=True,  # streamed calls report their usage too, for limiter.settle()
+            )
+        return _models[key]
+
+
+if __name__ == "__main__":
+    from langchain_core.messages import HumanMessage
+    from fake_openai_server import serve_in_background
+
+    print("--- Testing llm_client ---")
+    server, base_url = serve_in_background(latency="constant:0.01")
+    os.environ["OPENAI_BASE_URL"], os.environ["OPENAI_API_KEY"] = base_url, "sk-fake"
+    model = get_chat_model("gpt-4o-mini")
+    print("same client for both nodes:", model is get_chat_model("gpt-4o-mini"))
+
+    limiter = RateLimiter(rpm=600, tpm=0, max_wait_seconds=0.35)  # 10 requests/s
+    limiter.requests.level = 0  # start empty to show the pacing
+    started = time.monotonic()
+    try:
+        for _ in range(5):
+            model.invoke([HumanMessage(content="Return general_questions")])
+    except LLMRateLimited as e:
+        print("rejected instead of queueing too long:", e)
+    print(f"calls at 10 requests/s took {time.monotonic() - started:.2f}s")
+    print(limiter.stats())
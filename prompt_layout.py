@@ -0,0 +1,140 @@
+# prompt_layout.py
+# Prompts laid out for the provider's prompt cache.
+# OpenAI (and most providers) reuse the work on a prompt prefix they have seen recently,
+# but only for a byte-identical prefix of 1024+ tokens. Our prompts used to start with
+# "you are now working in {country}" and the CV, so no two requests shared a prefix and
+# thousands of tokens of instructions and examples were processed from scratch every time.
+#
+# Every prompt is now two messages:
+#   - system: the static part (instructions, examples, format_instructions). It is rendered
+#     once per chain ("compiled") and is byte-identical for every request.
+#   - human:  the variable part (country guidance, job, CV, transcript), formatted per request.
+# check_prefix_stability() renders a prompt for two different requests and confirms the
+# static part really is shared; run `python prompt_layout.py` after editing a prompt.
+import os
+import json
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+
+# --- 1. Per-country guidance ---
+# The interview culture of a country goes into the variable part; the common countries are
+# compiled at import time, any other country is built once and then served from the lru_cache.
+COUNTRY_NORMS = {
+    "China": "humility, teamwork and respect",
+    "United Kingdom": "independent thinking, critical reasoning and personal initiative",
+    "United States": "ambition, leadership and cultural fit",
+    "Japan": "harmony, collective contribution, respect for hierarchy and long-term commitment",
+    "Singapore": "cultural harmony, inclusivity and teamwork",
+}
+COUNTRY_ALIASES = {
+    "prc": "China", "mainland china": "China",
+    "uk": "United Kingdom", "britain": "United Kingdom", "great britain": "United Kingdom", "england": "United Kingdom",
+    "us": "United States", "usa": "United States", "america": "United States",
+    "united states of america": "United States",
+}
+COUNTRY_GUIDANCE_CACHE_SIZE = int(os.environ.get("COUNTRY_GUIDANCE_CACHE_SIZE", "256"))
+
+
+def _guidance_block(country: str, norms: Optional[str] = None) -> str:
+    block = (
+        f"# Local interview culture\n"
+        f"You are now working in {country}. You are very aware of the culture norms and interview etiquette of "
+        f"{country}. While following the country's cultural norm yourself, you will also require the candidate to "
+        f"be able to fit in the cultural norm."
+    )
+    if norms:
+        block += f" Interviews in {country} typically emphasize {norms}."
+    return block
+
+
+_COMPILED_GUIDANCE = {name.casefold(): _guidance_block(name, norms) for name, norms in COUNTRY_NORMS.items()}
+
+
+# Everything country_guidance() can return, for cache versions (question_generator.CACHE_VERSION)
+GUIDANCE_VERSION_TEXT = "\n".join([*_COMPILED_GUIDANCE.values(), _guidance_block("{country}"),
+                                   json.dumps(COUNTRY_ALIASES, sort_keys=True)])
+
+
+@lru_cache(maxsize=COUNTRY_GUIDANCE_CACHE_SIZE)
+def country_guidance(country: str) -> str:
+    """The guidance block for a country ("USA", "uk ", "Japan"...); unknown countries get the generic block."""
+    name = " ".join((country or "").split())
+    canonical = COUNTRY_ALIASES.get(name.casefold(), name)
+    return _COMPILED_GUIDANCE.get(canonical.casefold()) or _guidance_block(name or "the candidate's country")
+
+
+# --- 2. Compiled prompts ---
+@lru_cache(maxsize=None)
+def compile_prompt(prefix: str, suffix: str, **static: str) -> ChatPromptTemplate:
+    """
+    Renders the static prefix once (with format_instructions and the like) into a system message
+    and keeps only the suffix as a template. The same arguments return the same compiled prompt,
+    so rebuilding a chain (use_llm(), a new worker) doesn't render the prefix again.
+    """
+    template = PromptTemplate.from_template(prefix)
+    missing = set(template.input_variables) - set(static)
+    if missing:
+        # A per-request placeholder in the prefix would make every request's prefix different
+        raise ValueError(f"The static prompt prefix uses per-request variables: {sorted(missing)}")
+    rendered = template.format(**{name: static[name] for name in template.input_variables})
+    return ChatPromptTemplate.from_messages([SystemMessage(content=rendered), ("human", suffix)])
+
+
+# --- 3. Prefix stability check ---
+def _render(prompt: ChatPromptTemplate, inputs: Dict[str, Any]) -> str:
+    return "\n".join(str(message.content) for message in prompt.format_messages(**inputs))
+
+
+def check_prefix_stability(prompt: ChatPromptTemplate, inputs_a: Dict[str, Any], inputs_b: Dict[str, Any]) -> Dict[str, Any]:
+    """Renders the prompt for two different requests; 'stable' means the whole static prefix is shared."""
+    text_a, text_b = _render(prompt, inputs_a), _render(prompt, inputs_b)
+    shared = 0
+    for a, b in zip(text_a, text_b):
+        if a != b:
+            break
+        shared += 1
+    prefix_chars = len(prompt.messages[0].content)
+    return {"prefix_chars": prefix_chars, "shared_chars": shared, "total_chars": len(text_a),
+            "stable": shared >= prefix_chars}
+
+
+if __name__ == "__main__":
+    import logging
+    from fake_llm import CANNED_REPORT
+    import critic
+    import question_generator
+
+    logging.getLogger("mvita").setLevel(logging.WARNING)  # critic_inputs() logs every call
+    print("--- Testing prompt_layout ---")
+    print(country_guidance("USA") == country_guidance("united states"), country_guidance(" uk"))
+    print(country_guidance("Brazil"))
+
+    requests = [
+        {"job_country": "Japan", "job_role": "Backend Engineer", "job_company": "Rakuten",
+         "cv_text": "Jane Doe\nBuilt payment APIs in Python.", "interview_transcript": "interviewer: Hi\ncandidate: Hello"},
+        {"job_country": "UK", "job_role": "Data Analyst", "job_company": "BBC",
+         "cv_text": "Sam Lee\nSQL dashboards for newsrooms.", "interview_transcript": "interviewer: Why us?\ncandidate: News."},
+    ]
+    segment = {"question": "Why this role?", "category": "general", "answer": "I like it."}
+    prompts = {f"questions:{name}": (prompt, [question_generator.question_inputs(r) for r in requests])
+               for name, prompt in question_generator.question_prompts().items()}
+    for name in critic.CHAIN_SPECS:
+        if name == "segment":
+            inputs = [critic.segment_inputs(r, segment) for r in requests]
+        elif name == "reduce":
+            inputs = [critic.reduce_inputs(r, [{"topic": "Teamwork", "score": 4}]) for r in requests]
+        else:
+            inputs = [critic.section_inputs(critic.critic_inputs(r), CANNED_REPORT) for r in requests]
+        prompts[f"critic:{name}"] = (critic.chain_prompt(name), inputs)
+
+    failed = []
+    for name, (prompt, (inputs_a, inputs_b)) in prompts.items():
+        result = check_prefix_stability(prompt, inputs_a, inputs_b)
+        print(f"{name:28} {result}")
+        if not result["stable"]:
+            failed.append(name)
+    print("prefix stable for every prompt" if not failed else f"PREFIX CHANGES PER REQUEST: {failed}")
+    print("compiled once:", critic.chain_prompt("answer") is critic.chain_prompt("answer"), critic.compile_prompt.cache_info())
@@ -0,0 +1,209 @@
+# question_cache.py
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from instrumentation import get_logger
+
+logger = get_logger("question_cache")
+
+# --- 1. Config (all optional, read from the environment) ---
+# QUESTION_CACHE_DIR is empty by default, which keeps the cache memory-only.
+DEFAULT_MAX_ENTRIES = int(os.environ.get("QUESTION_CACHE_MAX_ENTRIES", "512"))
+DEFAULT_TTL_SECONDS = float(os.environ.get("QUESTION_CACHE_TTL_SECONDS", str(24 * 3600)))
+DEFAULT_DISK_DIR = os.environ.get("QUESTION_CACHE_DIR") or None
+DEFAULT_MAX_DISK_ENTRIES = int(os.environ.get("QUESTION_CACHE_MAX_DISK_ENTRIES", "5000"))
+# Listing the directory costs a stat per file, so it isn't done on every put: the cache counts
+# the files it writes and prunes when the count passes the limit. Other processes write to the
+# same directory, so it also recounts every QUESTION_CACHE_RECOUNT_EVERY puts.
+DISK_RECOUNT_EVERY = int(os.environ.get("QUESTION_CACHE_RECOUNT_EVERY", "200"))
+# A prune goes down to this share of the limit, so the next one is a while away
+DISK_PRUNE_TO = 0.9
+
+
+def _normalize(value: Optional[str]) -> str:
+    """Collapse whitespace and case so cosmetic differences don't miss the cache."""
+    return " ".join((value or "").split()).casefold()
+
+
+def make_cache_key(cv_text: str, job_role: str, job_company: str, job_country: str, version: str = "") -> str:
+    """
+    Builds the content address of one (CV, job) combination.
+    'version' should change whenever the prompt or the model changes.
+    """
+    payload = json.dumps(
+        [version, _normalize(cv_text), _normalize(job_role), _normalize(job_company), _normalize(job_country)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# --- 2. The cache itself ---
+class QuestionCache:
+    """
+    A thread-safe LRU + TTL cache for generated question sets.
+    If 'disk_dir' is given, entries are also written there as JSON files,
+    so they survive a restart of the server.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        disk_dir: Optional[str] = DEFAULT_DISK_DIR,
+        max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "puts": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+        self._disk_count = 0
+        self._disk_puts = 0  # puts since the last recount
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_count = len(self._disk_files())
+
+    # A. Lookups
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+        # B. Fall back to the disk tier (outside the lock, it does I/O)
+        disk_entry = self._read_disk(key, now)
+        with self._lock:
+            if disk_entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._store_locked(key, disk_entry[0], disk_entry[1])
+        return copy.deepcopy(disk_entry[1])
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        created_at = time.time()
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._counters["puts"] += 1
+            self._store_locked(key, created_at, value)
+        self._write_disk(key, created_at, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            hits = self._counters["hits"] + self._counters["disk_hits"]
+            return {
+                **self._counters,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": bool(self.disk_dir),
+                "disk_entries": self._disk_count,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # C. Internals
+    def _store_locked(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[tuple]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - record.get("created_at", 0) > self.ttl_seconds:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with self._lock:
+                self._counters["expirations"] += 1
+            return None
+        return record["created_at"], record["value"]
+
+    def _write_disk(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # worker processes share the directory
+        try:
+            is_new = not os.path.exists(path)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"created_at": created_at, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)  # atomic, readers never see half a file
+        except OSError as e:
+            logger.warning(f"Could not write question cache entry to disk: {e}")
+            return
+        with self._lock:
+            self._disk_count += is_new
+            self._disk_puts += 1
+            recount = self._disk_count > self.max_disk_entries or self._disk_puts >= DISK_RECOUNT_EVERY
+            if recount:
+                self._disk_puts = 0
+        if recount:
+            self._prune_disk()
+
+    def _disk_files(self) -> List[str]:
+        return [os.path.join(self.disk_dir, n) for n in os.listdir(self.disk_dir) if n.endswith(".json")]
+
+    def _prune_disk(self) -> None:
+        """Recounts the files and, over the limit, removes the oldest down to DISK_PRUNE_TO of it."""
+        try:
+            files = self._disk_files()
+        except OSError as e:
+            logger.warning(f"Could not list the question cache directory: {e}")
+            return
+        if len(files) > self.max_disk_entries:
+            def mtime(path: str) -> float:
+                try:
+                    return os.path.getmtime(path)
+                except OSError:  # removed by another process meanwhile
+                    return 0.0
+
+            files.sort(key=mtime)
+            keep = int(self.max_disk_entries * DISK_PRUNE_TO)
+            for path in files[: len(files) - keep]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            files = files[len(files) - keep:]
+        with self._lock:
+            self._disk_count = len(files)
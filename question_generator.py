@@ -1,11 +1,28 @@
 import os
-from typing import List, Dict
+import math
+import asyncio
+import time
+import hashlib
+import threading
+from contextlib import nullcontext
+from typing import Awaitable, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
 
 # --- 1. Import LangChain and Pydantic ---
-from langchain_openai import ChatOpenAI
+# (langchain_openai is imported lazily in get_question_chain(), it is by far the slowest import)
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from pydantic import BaseModel, Field
+from langchain_core.runnables import RunnableLambda, RunnableParallel
+from pydantic import BaseModel, Field, create_model
+
+from admission import AdmissionRejected
+from structured_output import RepairingJsonOutputParser
+from prompt_layout import GUIDANCE_VERSION_TEXT, compile_prompt, country_guidance
+from resilience import LLM_DEADLINE_SECONDS, ResilientLLM, build_fallback_llm
+from question_cache import QuestionCache, make_cache_key
+from similar_index import SIMILAR_INDEX_ENABLED, SimilarQuestionIndex, minhash
+from cv_compactor import QUESTION_CV_TOKEN_BUDGET, compact_cv, count_tokens
+from instrumentation import get_logger, instrument_node, metrics_callbacks
+
+logger = get_logger("question_generator")
 
 # --- 2. Import the "conveyor belt" definition (State) ---
 # (This allows VS Code to autocomplete state fields)
@@ -30,12 +47,13 @@ class InterviewQuestions(BaseModel):
     # Note: Your new Prompt only requires 3 categories, so Pydantic only defines 3
     # This is good, more focused!
 
+QUESTION_CATEGORIES = list(InterviewQuestions.model_fields)
+
 # --- 4. Initialize your "Engine" ---
 # You need to add OpenAI api key
-os.environ["OPENAI_API_KEY"] = ""
+os.environ.setdefault("OPENAI_API_KEY", "")
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
-parser = JsonOutputParser(pydantic_object=InterviewQuestions)
+MODEL_NAME = "gpt-4o-mini"
 
 # --- 5. Create your "Super Prompt" ---
 # This is [YOUR] Prompt, I only made 2 small changes:
@@ -43,26 +61,19 @@ parser = JsonOutputParser(pydantic_object=InterviewQuestions)
 # 2. I removed your handwritten JSON instructions (# Instruction),
 #    because {format_instructions} automatically generates a [stricter] instruction,
 #    and having both will confuse the AI.
-PROMPT_TEMPLATE = """
-You are an expert HR who is an elite in the field of interviewing and shortlisting candidates. You have been working in multiple countries and you are now working in {country}. You are very aware of the culture norms and interview etiquette of the current country you are working in. While following the country's cultural norm yourself, you will also require the candidate to be able to fit in the cultural norm.
-
-# Situation
-You will now interview an candidate. They are applying for the following position:
----
-{job_role}
----
-The person is applying to the {job_company}.
+_PROMPT_HEAD = """
+You are an expert HR who is an elite in the field of interviewing and shortlisting candidates. You have been working in multiple countries. The country you are working in now, and its interview culture, are given with the candidate's details after these instructions. You are very aware of the culture norms and interview etiquette of the current country you are working in. While following the country's cultural norm yourself, you will also require the candidate to be able to fit in the cultural norm.
 
-Their CV is as follows:
----
-{cv}
----
-
-The candidate is applying to a company in {country}.
+"""
 
-# Task
+_PROMPT_TASK = """# Task
 Generate interview questions that reflects the job's professional requirements and the local interview culture. The questions should be split into three balanced categories:
-1. **General Interview Questions (30%)** - Focus on personality, teamwork, motivation, weaknesses, and career choice. 
+"""
+
+# One section per category; the single prompt lists all three, the fan-out pipeline
+# (QUESTION_PIPELINE=fanout, see 6d) sends each one in its own prompt.
+CATEGORY_SECTIONS = {
+    "general_questions": """1. **General Interview Questions (30%)** - Focus on personality, teamwork, motivation, weaknesses, and career choice. 
     These should subtly reflect local interview customs. 
     For example:
     - In Chinese companies, emphasize humility, teamwork, and respect.
@@ -73,7 +84,8 @@ Generate interview questions that reflects the job's professional requirements a
      These just serves as an example. You should utilise your trained knowledge of the local culture as much as possible. However, you should NEVER ask straightforward, explicit questions about candidate's ability . Instead, ask open-ended questions that would indirectly assess the candidate's fit in the country's working culture. For example, NEVER ASK "Do you know a Keigo culture of a Japan", but ask "Have you ever been in a dispute with someone in the past? How did you solve it?".
      Note that this should be only one factor of the common interview questions.
 
-2. **CV-Based Questions (40%)** - Focus on what candidates has written in their CV.
+""",
+    "cv_based_questions": """2. **CV-Based Questions (40%)** - Focus on what candidates has written in their CV.
     - Emphasize the candidate's skills, experience, and achievements. Assess the team-working ability of a candidate, passion the candidate has towards the job, and the candidate's ability to create complicated projects. Especially focus on how the candidate have constructed the project from scratch, the choice of their tech stacks and asking why have chose them, and which role did they take if it is a team project.
     - Reflect the job requirements and the company's values.
     - For example:
@@ -81,64 +93,545 @@ Generate interview questions that reflects the job's professional requirements a
        - In a marketing role, ask about the candidate's previous campaigns, customer service, and communication skills.
        - Example Question in the admission interview of a PhD: "I am the curious about the research about how dooes Mathematics differ between the East and the West. Could you explain more about it". Then allow the candidate to share their thoughts and do a mini-presentation.
 
-3. **Technical or Professional Questions (40%)** -  
+""",
+    "technical_questions": """3. **Technical or Professional Questions (40%)** -  
     - Questions directly related to the job's field (based on the Job Spec).  
     - Include both conceptual and applied/critical-thinking questions.  
     - For example: “How would you optimise this algorithm for large datasets?”, “Can you explain how machine learning models handle overfitting?” and "Can you explain the life hooks in Vue?". You can also consider some situational based questions, such as "As a product manager, you are responsible for leading a team of developers to build a new product. This product is a new e-commerce platform, targeting the Chinese students in the UK, selling Chinese goods. How might you approach the design of it?".
 
-You must not copy the questions from the job spec, nor the example questions. Your questions must take the example questions as a reference and adapt them to the job spec.
+""",
+}
+
+_PROMPT_TAIL = """You must not copy the questions from the job spec, nor the example questions. Your questions must take the example questions as a reference and adapt them to the job spec.
 
 # Instruction
 - You MUST return your output in the precise JSON format requested.
 - Each category should have **2-3 questions**.
-- Tailor tone and phrasing to fit the local cultural context ({country}).
+- Tailor tone and phrasing to fit the local cultural context (the country given below).
 - Ensure that the questions are *clear, realistic, and culturally appropriate* for a professional interview.
 
 {format_instructions}
 """
 
-prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-prompt = prompt.partial(format_instructions=parser.get_format_instructions())
+PROMPT_PREFIX = _PROMPT_HEAD + _PROMPT_TASK + "".join(CATEGORY_SECTIONS.values()) + _PROMPT_TAIL
+
+_CATEGORY_TASK = """# Task
+Generate interview questions that reflects the job's professional requirements and the local interview culture. Write the questions of ONE category only (the other categories are written separately):
+"""
+
+def category_prompt_prefix(category: str) -> str:
+    return _PROMPT_HEAD + _CATEGORY_TASK + CATEGORY_SECTIONS[category] + _PROMPT_TAIL
+
+# The per-request part comes last, so the long static prefix above (with the format
+# instructions) is byte-identical for every request and the provider can cache it (see prompt_layout.py)
+PROMPT_SUFFIX = """{country_guidance}
+
+# Situation
+You will now interview an candidate. They are applying for the following position:
+---
+{job_role}
+---
+The person is applying to the {job_company}.
+
+Their CV is as follows:
+---
+{cv}
+---
+
+The candidate is applying to a company in {country}.
+"""
+
+def _category_schema(category: str):
+    return create_model(
+        "".join(word.title() for word in category.split("_")),
+        **{category: (List[str], InterviewQuestions.model_fields[category])},
+    )
+
+def _format_instructions(schema) -> str:
+    return RepairingJsonOutputParser(pydantic_object=schema).get_format_instructions()
+
+def question_prompts() -> Dict[str, ChatPromptTemplate]:
+    """The compiled prompt of every chain: "all" (single pipeline) and one per category (fan-out)."""
+    prompts = {"all": compile_prompt(PROMPT_PREFIX, PROMPT_SUFFIX, format_instructions=_format_instructions(InterviewQuestions))}
+    for category in QUESTION_CATEGORIES:
+        prompts[category] = compile_prompt(
+            category_prompt_prefix(category), PROMPT_SUFFIX,
+            format_instructions=_format_instructions(_category_schema(category)),
+        )
+    return prompts
+
+# --- 6. "Link" them together (lazily) ---
+# Importing langchain_openai and building the client, prompt and parser takes over a second,
+# so the chain is built on first use rather than at import time (fast worker cold start).
+# warm_up() builds it ahead of time, e.g. from the gunicorn post_fork hook.
+_chain_lock = threading.Lock()
+_llm = None
+_question_generation_chain = None
+_cv_question_chain = None
+# The category written from the candidate's own CV: never reused for another CV (see 6c)
+CV_CATEGORY = "cv_based_questions"
+
+def _build_chain(llm):
+    if QUESTION_PIPELINE == "fanout":
+        return _build_fanout_chain(llm)
+    # Deadline, hedging and circuit breaker around the model, see resilience.py
+    model = ResilientLLM("questions", llm, fallback=build_fallback_llm(temperature=0.3))
+    # Broken JSON is repaired locally (or, last resort, fixed by a short LLM call), see structured_output.py
+    parser = RepairingJsonOutputParser(
+        pydantic_object=InterviewQuestions, required_fields=tuple(InterviewQuestions.model_fields), fix_llm=model,
+    )
+    prompt = compile_prompt(PROMPT_PREFIX, PROMPT_SUFFIX, format_instructions=parser.get_format_instructions())
+    return (prompt | model | parser).with_config(**metrics_callbacks("questions"))
+
+def _llm_locked():
+    global _llm
+    if _llm is None:
+        from llm_client import get_chat_model  # shared pool + rate limiter, see llm_client.py
+        _llm = get_chat_model(MODEL_NAME, 0.3, timeout_seconds=LLM_DEADLINE_SECONDS)
+    return _llm
+
+def get_question_chain():
+    """Returns the question generation chain, building it (once, thread-safely) on first use."""
+    global _question_generation_chain
+    chain = _question_generation_chain
+    if chain is not None:
+        return chain
+    with _chain_lock:
+        if _question_generation_chain is None:
+            _question_generation_chain = _build_chain(_llm_locked())
+        return _question_generation_chain
+
+def get_cv_question_chain():
+    """The chain that writes only the CV_CATEGORY (for a near-duplicate CV, see 6c), built on first use."""
+    global _cv_question_chain
+    chain = _cv_question_chain
+    if chain is not None:
+        return chain
+    with _chain_lock:
+        if _cv_question_chain is None:
+            _cv_question_chain = _build_category_chain(_llm_locked(), CV_CATEGORY)
+        return _cv_question_chain
+
+# --- 6a. Fan-out pipeline (QUESTION_PIPELINE=fanout) ---
+# The single prompt writes all three categories as one long answer, so /api/start waits
+# for the sum of them. In fan-out mode every category gets its own short prompt; the three
+# run concurrently (RunnableParallel: threads for invoke, asyncio for ainvoke) and are merged
+# back into InterviewQuestions, so the slowest category sets the latency.
+# A failed category is retried on its own (QUESTION_CATEGORY_ATTEMPTS), not the whole set.
+QUESTION_PIPELINE = os.environ.get("QUESTION_PIPELINE", "single")
+CATEGORY_ATTEMPTS = int(os.environ.get("QUESTION_CATEGORY_ATTEMPTS", "2"))
+
+def _build_category_chain(llm, category: str):
+    label = f"questions_{category}"
+    model = ResilientLLM(label, llm, fallback=build_fallback_llm(temperature=0.3))
+    parser = RepairingJsonOutputParser(pydantic_object=_category_schema(category), required_fields=(category,), fix_llm=model)
+    prompt = compile_prompt(category_prompt_prefix(category), PROMPT_SUFFIX,
+                            format_instructions=parser.get_format_instructions())
+    chain = (prompt | model | parser).with_config(**metrics_callbacks(label))
+    return chain.with_retry(stop_after_attempt=CATEGORY_ATTEMPTS) if CATEGORY_ATTEMPTS > 1 else chain
+
+def merge_categories(parts: Dict) -> Dict:
+    """{category: {category: [...]}} from the parallel step -> one InterviewQuestions dict."""
+    return InterviewQuestions.model_validate(
+        {category: parts[category][category] for category in QUESTION_CATEGORIES}
+    ).model_dump()
+
+def _build_fanout_chain(llm):
+    # The chain's .first (the parallel step) is what stream_questions() streams
+    parallel = RunnableParallel(**{category: _build_category_chain(llm, category) for category in QUESTION_CATEGORIES})
+    return parallel | RunnableLambda(merge_categories)
+
+def use_llm(new_llm) -> None:
+    """Swaps the chat model; the chain is rebuilt on next use (used by benchmark.py to plug in the fake LLM)."""
+    global _llm, _question_generation_chain, _cv_question_chain
+    with _chain_lock:
+        _llm, _question_generation_chain, _cv_question_chain = new_llm, None, None
+
+def warm_up() -> None:
+    """Builds the chain and loads the tokenizer now, so the first request doesn't pay for it."""
+    get_question_chain()
+    count_tokens("warm up")
+
+# --- 6b. Question cache ---
+# Same CV + same job = same questions, so repeat starts skip the LLM entirely.
+# The version changes whenever anything that shapes the prompt changes: the model, the
+# rendered prefixes (format instructions included), the suffix, the country guidance
+# and the CV token budget, so old entries are never served for a new prompt.
+def _prompt_version_text() -> str:
+    prompts = question_prompts()
+    names = ["all", CV_CATEGORY] if QUESTION_PIPELINE != "fanout" else QUESTION_CATEGORIES
+    return "\n".join([
+        *(prompts[name].messages[0].content for name in names),
+        PROMPT_SUFFIX,
+        GUIDANCE_VERSION_TEXT,
+        f"cv_token_budget={QUESTION_CV_TOKEN_BUDGET}",
+    ])
 
-# --- 6. "Link" them together ---
-question_generation_chain = prompt | llm | parser
+CACHE_VERSION = hashlib.sha256(f"{MODEL_NAME}\n{_prompt_version_text()}".encode("utf-8")).hexdigest()[:16]
+question_cache = QuestionCache()
+
+def question_cache_key(state: InterviewWorkflowState) -> str:
+    return make_cache_key(
+        state.get("cv_text"),
+        state.get("job_role"),
+        state.get("job_company"),
+        state.get("job_country"),
+        version=CACHE_VERSION,
+    )
+
+# --- 6c. Near-duplicate CVs (opt-in: SIMILAR_INDEX_ENABLED=1) ---
+# Template-derived CVs (same bootcamp, same projects) applying to the same job reuse the
+# questions of the closest earlier CV (see similar_index.py), but only the categories that
+# don't depend on the CV: the CV_CATEGORY could quote the other candidate's CV, so it is
+# always written for this CV, with the short single-category prompt. The index never
+# stores the CV_CATEGORY either.
+similar_index = SimilarQuestionIndex() if SIMILAR_INDEX_ENABLED else None
+
+def find_reusable_questions(state: InterviewWorkflowState, cache_key: str) -> Tuple[Optional[Dict], Dict]:
+    """
+    Exact cache first, then a near-duplicate CV for the same job.
+    Returns (questions or None, extra result fields):
+      - a cache hit is the whole set, with {"cached": True};
+      - a near-duplicate is the set without the CV_CATEGORY, with {"cached": False, "similar_match": 0.91};
+        pass it to generate_questions() as 'reused' to write the CV_CATEGORY for this CV.
+    On a miss the CV's MinHash signature is left on the state as 'cv_signature',
+    so remember_questions() doesn't compute it a second time.
+    """
+    cached_questions = question_cache.get(cache_key)
+    if cached_questions is not None:
+        logger.info("[Node]: Question cache hit, skipping the LLM")
+        return cached_questions, {"cached": True}
+    if similar_index is None:
+        return None, {}
+    state["cv_signature"] = minhash(state["cv_text"])
+    match = similar_index.lookup(
+        state["cv_text"], state.get("job_role"), state.get("job_company"), state.get("job_country"),
+        version=CACHE_VERSION, signature=state["cv_signature"],
+    )
+    if match is None:
+        return None, {}
+    questions, similarity = match
+    logger.info(f"[Node]: Reusing the CV-independent questions of a near-duplicate CV (similarity {similarity:.2f})")
+    reused = {category: questions[category] for category in QUESTION_CATEGORIES if category != CV_CATEGORY}
+    return reused, {"cached": False, "similar_match": round(similarity, 3)}
+
+def generate_questions(inputs: Dict, reused: Optional[Dict] = None) -> Dict:
+    """Runs the chain; with 'reused' (from a near-duplicate CV) only the CV_CATEGORY is written."""
+    if reused is None:
+        return get_question_chain().invoke(inputs)
+    return InterviewQuestions.model_validate({**reused, **get_cv_question_chain().invoke(inputs)}).model_dump()
+
+async def agenerate_questions(inputs: Dict, reused: Optional[Dict] = None) -> Dict:
+    if reused is None:
+        return await get_question_chain().ainvoke(inputs)
+    return InterviewQuestions.model_validate({**reused, **await get_cv_question_chain().ainvoke(inputs)}).model_dump()
+
+def remember_questions(state: InterviewWorkflowState, cache_key: str, questions: Dict) -> None:
+    question_cache.put(cache_key, questions)
+    if similar_index is not None:
+        similar_index.add(
+            state["cv_text"], state.get("job_role"), state.get("job_company"), state.get("job_country"),
+            {category: items for category, items in questions.items() if category != CV_CATEGORY},
+            version=CACHE_VERSION, signature=state.get("cv_signature"),
+        )
+
+def prepare_cv(state: InterviewWorkflowState) -> Tuple[Dict, Dict]:
+    """
+    Compacts the CV to the question prompt's token budget (see cv_compactor.py).
+    Returns the State with 'cv_compact' filled in, plus the fields the node
+    hands back so the session can keep the compacted CV for the Critic.
+    """
+    compaction = compact_cv(state["cv_text"], QUESTION_CV_TOKEN_BUDGET)
+    logger.info(
+        f"[Node]: CV compacted {compaction['original_tokens']} -> {compaction['compacted_tokens']} tokens",
+        extra={"cv_tokens_original": compaction["original_tokens"],
+               "cv_tokens_compacted": compaction["compacted_tokens"],
+               "cv_tokens_saved": compaction["tokens_saved"]},
+    )
+    cv_fields = {
+        "cv_compact": compaction["text"],
+        "cv_tokens": {
+            "original": compaction["original_tokens"],
+            "compacted": compaction["compacted_tokens"],
+            "saved": compaction["tokens_saved"],
+            "dropped_sections": compaction["dropped_sections"],
+        },
+    }
+    return {**state, "cv_compact": compaction["text"]}, cv_fields
+
+# What a node hands back for the CV when the questions came from the cache: the CV is only
+# compacted on a miss, and the Critic compacts the full CV itself when there is no cv_compact
+NOT_COMPACTED = {"cv_compact": None, "cv_tokens": None}
+
+def question_inputs(state: InterviewWorkflowState) -> Dict:
+    """Maps the "conveyor belt" (State) onto the placeholders of PROMPT_SUFFIX."""
+    return {
+        "cv": state.get("cv_compact") or state["cv_text"],
+        "country": state["job_country"],
+        "country_guidance": country_guidance(state["job_country"]),
+        "job_role": state["job_role"],
+        "job_company": state["job_company"]
+    }
 
 # --- 7. [Your Main Function] This is your "Workstation"! ---
-def generate_questions_node(state: InterviewWorkflowState) -> Dict:
+@instrument_node("question_generator")
+def generate_questions_node(state: InterviewWorkflowState,
+                            llm_slot: Callable[[], ContextManager] = nullcontext) -> Dict:
     """
     This is the 'Question Generator' node.
     It takes the state, runs the AI chain, and returns the questions.
+    'llm_slot' is entered around the LLM call only (not the cache lookups), e.g. an
+    admission ticket; an AdmissionRejected from it is raised to the caller.
     """
-    print("\n--- [Node]: Running Question Generator ---")
+    logger.info("[Node]: Running Question Generator")
     
     try:
-        # A. Extract all raw materials from the "conveyor belt" (State)
+        # A. Check the cache first (repeat uploads of the same CV + job, or a near-duplicate CV);
+        # the keys are built from the raw CV, so a hit doesn't pay for the compaction
+        state = dict(state)
+        cache_key = question_cache_key(state)
+        reused_questions, reuse_fields = find_reusable_questions(state, cache_key)
+        if reuse_fields.get("cached"):
+            return {"questions": reused_questions, **reuse_fields, **NOT_COMPACTED}
+
+        # B. Extract all raw materials from the "conveyor belt" (State)
         # [Fix] The 'inputs' key names here (cv, country, etc.)
-        # now [perfectly match] the placeholders in your PROMPT_TEMPLATE
-        inputs = {
-            "cv": state["cv_text"],
-            "country": state["job_country"],
-            "job_role": state["job_role"],
-            "job_company": state["job_company"]
-        }
+        # now [perfectly match] the placeholders in your PROMPT_SUFFIX
+        state, cv_fields = prepare_cv(state)
+        inputs = question_inputs(state)
         
-        print(f"Generating questions for role: {inputs['job_role']} at {inputs['job_company']}")
-        
-        # B. Run your "chain"
-        questions_dict = question_generation_chain.invoke(inputs)
+        logger.info(f"Generating questions for role: {inputs['job_role']} at {inputs['job_company']}")
+
+        # C. Run your "chain" (just the CV questions, if a near-duplicate CV gave the rest)
+        with llm_slot():
+            questions_dict = generate_questions(inputs, reused_questions)
         
         # 'questions_dict' is now a [clean] Python dictionary
         # (e.g.: {'general_questions': [...], ...})
-        print(f"--- [Node]: Generated {len(questions_dict.get('technical_questions', []))} tech questions ---")
+        logger.info(f"[Node]: Generated {len(questions_dict.get('technical_questions', []))} tech questions")
+        remember_questions(state, cache_key, questions_dict)
         
-        # C. Put your "finished product" back on the "conveyor belt"
-        return {"questions": questions_dict}
+        # D. Put your "finished product" back on the "conveyor belt"
+        return {"questions": questions_dict, "cached": False, **reuse_fields, **cv_fields}
     
+    except AdmissionRejected:
+        raise
     except Exception as e:
-        print(f"!! ERROR in Question Generator Node: {e} !!")
+        logger.error(f"ERROR in Question Generator Node: {e}")
         # Tell the "Orchestrator" you failed
         return {"error": f"Failed to generate questions: {e}"}
 
+# --- 7b. Async twin of the "Workstation" (used by asgi_server.py) ---
+async def _no_slot() -> ContextManager:
+    return nullcontext()
+
+
+@instrument_node("question_generator")
+async def agenerate_questions_node(state: InterviewWorkflowState,
+                                   llm_slot: Callable[[], Awaitable[ContextManager]] = _no_slot) -> Dict:
+    """
+    Same as generate_questions_node, but awaits the chain with 'ainvoke',
+    so the event loop can serve other interviews while the model is thinking.
+    The CPU and disk work (CV compaction, cache files, minhash) runs in a thread.
+    'llm_slot' is awaited for the context manager held around the LLM call,
+    e.g. AdmissionController.aacquire; an AdmissionRejected from it is raised to the caller.
+    """
+    logger.info("[Node]: Running Question Generator (async)")
+
+    try:
+        state = dict(state)
+        cache_key = question_cache_key(state)
+        reused_questions, reuse_fields = await asyncio.to_thread(find_reusable_questions, state, cache_key)
+        if reuse_fields.get("cached"):
+            return {"questions": reused_questions, **reuse_fields, **NOT_COMPACTED}
+
+        state, cv_fields = await asyncio.to_thread(prepare_cv, state)
+        inputs = question_inputs(state)
+        logger.info(f"Generating questions for role: {inputs['job_role']} at {inputs['job_company']}")
+
+        with await llm_slot():
+            questions_dict = await agenerate_questions(inputs, reused_questions)
+        logger.info(f"[Node]: Generated {len(questions_dict.get('technical_questions', []))} tech questions")
+        await asyncio.to_thread(remember_questions, state, cache_key, questions_dict)
+        return {"questions": questions_dict, "cached": False, **reuse_fields, **cv_fields}
+
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        logger.error(f"ERROR in Question Generator Node: {e}")
+        return {"error": f"Failed to generate questions: {e}"}
+
+# --- 7c. Streaming "Workstation" (used by /api/start/stream) ---
+
+@instrument_node("question_generator_stream")
+def stream_questions(state: InterviewWorkflowState,
+                     llm_slot: Callable[[], ContextManager] = nullcontext) -> Iterator[Dict]:
+    """
+    Streams the chain and yields each question as soon as it is complete:
+        {"event": "question", "category": ..., "index": ..., "question": ...}
+    and finally the whole validated object:
+        {"event": "done", "questions": {...}, "cached": bool, "cv_compact": ..., "cv_tokens": {...}}
+    (cv_compact and cv_tokens are None on a cache hit: the CV is only compacted on a miss)
+
+    JsonOutputParser gives us a growing, partially-parsed dict on every chunk.
+    The last item of the list being written may still be half a sentence,
+    so an item only counts as finished once the next item (or the next key) exists.
+    'llm_slot' is held while the model streams (not for a cache hit), as in generate_questions_node.
+    """
+    logger.info("[Node]: Running Question Generator (streaming)")
+    state = dict(state)
+    cache_key = question_cache_key(state)
+    reused_questions, reuse_fields = find_reusable_questions(state, cache_key)
+
+    def all_questions(questions: Dict) -> Iterator[Dict]:
+        for category in QUESTION_CATEGORIES:
+            for index, question in enumerate(questions.get(category, [])):
+                yield {"event": "question", "category": category, "index": index, "question": question}
+
+    if reuse_fields.get("cached"):
+        yield from all_questions(reused_questions)
+        yield {"event": "done", "questions": reused_questions, **reuse_fields, **NOT_COMPACTED}
+        return
+    state, cv_fields = prepare_cv(state)
+    if reused_questions is not None:
+        # A near-duplicate CV: its other categories go out now, the CV questions once written
+        yield from all_questions(reused_questions)
+        with llm_slot():
+            questions_dict = generate_questions(question_inputs(state), reused_questions)
+        yield from all_questions({CV_CATEGORY: questions_dict[CV_CATEGORY]})
+        remember_questions(state, cache_key, questions_dict)
+        yield {"event": "done", "questions": questions_dict, "cached": False, **reuse_fields, **cv_fields}
+        return
+
+    emitted = {category: 0 for category in QUESTION_CATEGORIES}
+
+    fanout = QUESTION_PIPELINE == "fanout"
+
+    def newly_finished(partial: Dict, final: bool) -> Iterator[Dict]:
+        keys = [key for key in partial if key in emitted]
+        for position, category in enumerate(keys):
+            items = partial.get(category)
+            if not isinstance(items, list):
+                continue
+            # In fan-out mode all categories are written at once, so none is closed before the end
+            closed = final or (not fanout and position < len(keys) - 1)
+            finished_count = len(items) if closed else max(len(items) - 1, 0)
+            while emitted[category] < finished_count:
+                index = emitted[category]
+                emitted[category] += 1
+                yield {"event": "question", "category": category, "index": index, "question": items[index]}
+
+    partial: Dict = {}
+    with llm_slot():
+        if fanout:
+            # Stream the parallel step; every chunk is {category: that category's partial dict}
+            for chunk in get_question_chain().first.stream(question_inputs(state)):
+                for category, category_partial in chunk.items():
+                    if isinstance(category_partial, dict) and category in category_partial:
+                        partial[category] = category_partial[category]
+                yield from newly_finished(partial, final=False)
+            partial = {category: partial.get(category, []) for category in QUESTION_CATEGORIES}
+        else:
+            for partial in get_question_chain().stream(question_inputs(state)):
+                if isinstance(partial, dict):
+                    yield from newly_finished(partial, final=False)
+
+    questions_dict = InterviewQuestions.model_validate(partial).model_dump()
+    yield from newly_finished(questions_dict, final=True)
+    remember_questions(state, cache_key, questions_dict)
+    logger.info(f"[Node]: Streamed {sum(emitted.values())} questions")
+    yield {"event": "done", "questions": questions_dict, "cached": False, **cv_fields}
+
+# --- 7d. Batch "Workstation" (cohort onboarding, used by /api/start/batch) ---
+BATCH_MAX_CONCURRENCY = int(os.environ.get("QUESTION_BATCH_MAX_CONCURRENCY", "8"))
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile, good enough for a throughput report."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def timed_question_generation(llm_slot: Callable[[], ContextManager] = nullcontext) -> RunnableLambda:
+    """One LLM call per (inputs, reused) item, inside its own 'llm_slot'; returns (questions, seconds in the call)."""
+    def _timed_generation(item: Tuple[Dict, Optional[Dict]]) -> Tuple[Dict, float]:
+        inputs, reused = item  # 'reused' as in generate_questions()
+        with llm_slot():
+            started = time.perf_counter()
+            questions_dict = generate_questions(inputs, reused)
+            return questions_dict, time.perf_counter() - started
+
+    return RunnableLambda(_timed_generation)
+
+@instrument_node("question_generator_batch")
+def generate_questions_batch(states: List[InterviewWorkflowState], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                             llm_slot: Callable[[], ContextManager] = nullcontext) -> Dict:
+    """
+    Generates questions for many (cv, role, company, country) inputs at once.
+    Identical inputs (same cache key) are generated only once, cached ones not at all,
+    and the rest go through the Runnable batch path with at most 'max_concurrency' calls in flight.
+    Every call enters its own 'llm_slot' (e.g. an admission ticket), so the slots, not
+    'max_concurrency', bound the load a batch puts on the provider.
+    Returns {"results": [one node-style result per input, same order], "report": {...}}.
+    """
+    logger.info(f"[Node]: Running Question Generator (batch of {len(states)})")
+    started = time.perf_counter()
+
+    # A. Find the unique inputs
+    states = [dict(state) for state in states]
+    keys = [question_cache_key(state) for state in states]
+    unique_keys = list(dict.fromkeys(keys))
+    first_state = {key: states[keys.index(key)] for key in unique_keys}
+
+    # B. Serve what we can from the cache (a near-duplicate CV leaves only its CV questions to write)
+    outcomes: Dict[str, Dict] = {}
+    reused: Dict[str, Tuple[Optional[Dict], Dict]] = {}
+    for key in unique_keys:
+        reused_questions, reuse_fields = find_reusable_questions(first_state[key], key)
+        if reuse_fields.get("cached"):
+            outcomes[key] = {"questions": reused_questions, **reuse_fields}
+        else:
+            reused[key] = (reused_questions, reuse_fields)
+    to_generate = [key for key in unique_keys if key not in outcomes]
+
+    # C. Compact the CVs of the rest (only those) and generate them concurrently
+    prepared = {key: prepare_cv(first_state[key]) for key in to_generate}
+    latencies: List[float] = []
+    if to_generate:
+        results = timed_question_generation(llm_slot).batch(
+            [(question_inputs(prepared[key][0]), reused[key][0]) for key in to_generate],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        for key, result in zip(to_generate, results):
+            if isinstance(result, Exception):
+                logger.error(f"ERROR in Question Generator batch item: {result}")
+                outcomes[key] = {"error": f"Failed to generate questions: {result}"}
+                continue
+            questions_dict, latency = result
+            latencies.append(latency)
+            remember_questions(prepared[key][0], key, questions_dict)
+            outcomes[key] = {"questions": questions_dict, "cached": False, **reused[key][1]}
+
+    # D. Fan the outcomes back out to every input, in order
+    results = [{**outcomes[key], **(prepared[key][1] if key in prepared else NOT_COMPACTED)} for key in keys]
+    wall_seconds = time.perf_counter() - started
+    report = {
+        "items": len(states),
+        "unique_items": len(unique_keys),
+        "cache_hits": len(unique_keys) - len(to_generate),
+        "generated": len(latencies),
+        "errors": sum(1 for result in results if "error" in result),
+        "max_concurrency": max_concurrency,
+        "wall_seconds": round(wall_seconds, 3),
+        "items_per_second": round(len(states) / wall_seconds, 2) if wall_seconds > 0 else None,
+        "latency_p50_seconds": round(_percentile(latencies, 50), 3),
+        "latency_p95_seconds": round(_percentile(latencies, 95), 3),
+    }
+    logger.info("[Node]: Batch done", extra=report)
+    return {"results": results, "report": report}
+
 # --- 8. (Critical) Test your file independently! ---
 if __name__ == "__main__":
     print("=== Running question_generator.py in standalone test mode ===")
@@ -0,0 +1,139 @@
+# report_store.py
+# Finished Critic reports, kept after the interview session is gone.
+# A report is keyed on (session id, hash of the transcript it was written from), so:
+#   - a retried /api/finish with the same transcript gets the stored report instead of
+#     a 404 (the first attempt already deleted the session) or a second Critic run
+#   - "view my report" later (/api/report/<session_id>) is a single indexed lookup
+# Stored in SQLite (WAL) so every worker process sees the same reports; entries
+# expire after REPORT_TTL_SECONDS. REPORT_STORE_PATH="" keeps them in memory only.
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from instrumentation import get_logger
+
+logger = get_logger("report_store")
+
+# --- 1. Config ---
+DEFAULT_PATH = os.environ.get("REPORT_STORE_PATH", "reports.db")
+DEFAULT_TTL_SECONDS = float(os.environ.get("REPORT_TTL_SECONDS", str(30 * 86400)))
+
+
+def transcript_hash(transcript: Any) -> str:
+    """Stable hash of a transcript (a string, or the list/dict form some clients send)."""
+    if not isinstance(transcript, str):
+        transcript = json.dumps(transcript, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(transcript.strip().encode("utf-8")).hexdigest()
+
+
+# --- 2. The store ---
+class ReportStore:
+    def __init__(self, db_path: Optional[str] = DEFAULT_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.db_path = db_path or None
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._counters = {"hits": 0, "misses": 0, "puts": 0}
+        self._counter_lock = threading.Lock()
+        # In memory there is one shared connection, used under _memory_lock
+        self._memory_conn = None if self.db_path else sqlite3.connect(":memory:", check_same_thread=False,
+                                                                        isolation_level=None)
+        self._memory_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS reports (
+                    session_id TEXT NOT NULL,
+                    transcript_hash TEXT NOT NULL,
+                    report TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, transcript_hash)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS reports_session_created ON reports (session_id, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS reports_expires_at ON reports (expires_at)")
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if self._memory_conn is not None:
+            with self._memory_lock:
+                yield self._memory_conn
+            return
+        # One connection per thread; WAL lets readers and a writer work at the same time
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        yield conn
+
+    # A. Public API
+    def get(self, session_id: str, transcript_digest: str) -> Optional[Any]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT report FROM reports WHERE session_id = ? AND transcript_hash = ? AND expires_at >= ?",
+                (session_id, transcript_digest, time.time()),
+            ).fetchone()
+        self._count("hits" if row else "misses")
+        return json.loads(row[0]) if row else None
+
+    def latest(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The newest report of a session: {"final_review", "created_at", "transcript_hash"}."""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT report, created_at, transcript_hash FROM reports WHERE session_id = ? AND expires_at >= ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (session_id, time.time()),
+            ).fetchone()
+        self._count("hits" if row else "misses")
+        if row is None:
+            return None
+        return {"final_review": json.loads(row[0]), "created_at": row[1], "transcript_hash": row[2]}
+
+    def put(self, session_id: str, transcript_digest: str, report: Any) -> None:
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO reports (session_id, transcript_hash, report, created_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session_id, transcript_digest, json.dumps(report, ensure_ascii=False), now, now + self.ttl_seconds),
+                )
+                conn.execute("DELETE FROM reports WHERE expires_at < ?", (now,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._count("puts")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connection() as conn:
+            size = conn.execute("SELECT COUNT(*) FROM reports WHERE expires_at >= ?", (time.time(),)).fetchone()[0]
+        with self._counter_lock:
+            return {**self._counters, "size": size, "ttl_seconds": self.ttl_seconds, "persistent": bool(self.db_path)}
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+
+
+if __name__ == "__main__":
+    print("--- Testing report_store ---")
+    store = ReportStore(db_path="", ttl_seconds=60)
+    digest = transcript_hash("interviewer: Hi\ncandidate: Hello")
+    print("before:", store.get("session_1", digest))
+    store.put("session_1", digest, {"performance_summary": "Good", "decision": "Hire"})
+    print("retry, same transcript:", store.get("session_1", transcript_hash("interviewer: Hi\ncandidate: Hello\n")))
+    print("other transcript:", store.get("session_1", transcript_hash("interviewer: Hi")))
+    reader = threading.Thread(target=lambda: print("latest, from another thread:", store.latest("session_1")))
+    reader.start()
+    reader.join()
+    print(store.stats())
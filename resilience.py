@@ -0,0 +1,361 @@
+# resilience.py
+# Deadlines, hedged requests and a circuit breaker around the chat model.
+# The chains become  prompt | ResilientLLM(model) | parser,  so every node gets:
+#   - a deadline per call (LLM_DEADLINE_SECONDS) instead of waiting on a hung request
+#   - hedging: if the model hasn't answered after ~p95 of its recent latency, the same
+#     request is sent once more and the first answer wins (the slower one is cancelled
+#     in async code). A sync loser can't be cancelled: its thread runs the request to the
+#     end (or the client timeout), using provider quota and rate limiter tokens. So the sync
+#     path only hedges while the model's rate limiter has LLM_HEDGE_MIN_HEADROOM to spare.
+#   - a circuit breaker: after LLM_BREAKER_FAILURES failures in a row, calls fail fast
+#     (or go to LLM_FALLBACK_MODEL) for LLM_BREAKER_RESET_SECONDS, then one trial call decides
+#
+# fake_openai_server.py can inject latency, hangs and errors to try it out (see the __main__ below).
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, Optional
+
+from langchain_core.runnables import Runnable
+
+from instrumentation import get_logger, registry
+
+logger = get_logger("resilience")
+
+# --- 1. Config ---
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "45"))
+HEDGING_ENABLED = os.environ.get("LLM_HEDGING", "1") == "1"
+HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_MIN_DELAY_SECONDS", "1.0"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Share of the rate limiter's buckets that must be free for a sync hedge (see llm_client.py)
+HEDGE_MIN_HEADROOM = float(os.environ.get("LLM_HEDGE_MIN_HEADROOM", "0.25"))
+BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+FALLBACK_MODEL_NAME = os.environ.get("LLM_FALLBACK_MODEL", "")  # empty = fail fast when the breaker is open
+MAX_THREADS = int(os.environ.get("LLM_MAX_THREADS", "64"))
+
+RESILIENCE_EVENTS = registry.counter(
+    "mvita_llm_resilience_events_total",
+    "Resilience events per chain (hedged, hedge_won, hedge_skipped, deadline, failure, fallback, rejected)",
+)
+
+_executor = ThreadPoolExecutor(max_workers=MAX_THREADS, thread_name_prefix="llm-call")
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """The model did not answer within the deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The provider is failing and there is no fallback model, so we fail fast."""
+
+
+# --- 2. Building blocks ---
+class LatencyTracker:
+    """Recent successful call latencies of one chain, used to pick the hedge delay."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """p95 of recent calls (at least HEDGE_MIN_DELAY_SECONDS), or None until there are enough samples."""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return max(HEDGE_MIN_DELAY_SECONDS, ordered[int(0.95 * (len(ordered) - 1))])
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state, self._trial_in_flight = self.HALF_OPEN, False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True  # exactly one trial call decides
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed again")
+            self.state, self._failures = self.CLOSED, 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                logger.warning(f"Circuit '{self.name}' opened after {self._failures} failures")
+                self.state, self._opened_at = self.OPEN, time.monotonic()
+
+    def record_ignored(self) -> None:
+        """The call failed for a reason that says nothing about the provider (e.g. our own rate limiter)."""
+        with self._lock:
+            self._trial_in_flight = False  # let the next call be the half-open trial instead
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """One breaker per provider/model, shared by every chain that uses it."""
+    with _breakers_lock:
+        return _breakers.setdefault(name, CircuitBreaker(name))
+
+
+_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 0.5, CircuitBreaker.OPEN: 1}
+registry.gauge_callback(
+    "mvita_llm_circuit_open", "1 while a circuit breaker is open, 0.5 half-open, 0 closed",
+    lambda: [({"breaker": name}, _STATE_VALUES[b.state]) for name, b in list(_breakers.items())],
+)
+
+
+def build_fallback_llm(temperature: float = 0.3):
+    """The model used while the breaker is open (LLM_FALLBACK_MODEL), or None."""
+    if not FALLBACK_MODEL_NAME:
+        return None
+    from llm_client import get_chat_model
+    return get_chat_model(FALLBACK_MODEL_NAME, temperature, timeout_seconds=LLM_DEADLINE_SECONDS)
+
+
+def _model_name(llm) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+# --- 3. The wrapper ---
+class ResilientLLM(Runnable):
+    """
+    Drop-in for the chat model inside a chain (prompt | ResilientLLM(llm) | parser).
+    'name' labels the metrics and owns the latency history; the breaker is per model.
+    """
+
+    def __init__(self, name: str, primary, fallback=None, deadline_seconds: float = LLM_DEADLINE_SECONDS,
+                 hedging: bool = HEDGING_ENABLED):
+        self.name = name
+        self.primary = primary
+        self.fallback = fallback
+        self.deadline_seconds = deadline_seconds
+        self.hedging = hedging
+        self.tracker = LatencyTracker()
+        self.breaker = get_breaker(_model_name(primary))
+
+    # A. Sync
+    def invoke(self, input: Any, config=None, **kwargs) -> Any:
+        if self.breaker.allow():
+            try:
+                result = self._call(self.primary, input, config, hedge=self.hedging)
+            except Exception as e:
+                self._on_failure(e)
+            else:
+                self.breaker.record_success()
+                return result
+        else:
+            self._on_rejected()
+        return self._call(self.fallback, input, config, hedge=False)
+
+    def _call(self, model, input: Any, config, hedge: bool) -> Any:
+        started = time.monotonic()
+        deadline = started + self.deadline_seconds
+        hedge_delay = self.tracker.hedge_delay() if hedge else None
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        first = self._submit(model, input, config)
+        attempts = {first: started}
+        errors = []
+
+        while attempts and time.monotonic() < deadline:
+            wake = min(deadline, hedge_at) if hedge_at is not None else deadline
+            done, _ = wait(list(attempts), timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt_started = attempts.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                self.tracker.observe(time.monotonic() - attempt_started)
+                for loser in attempts:
+                    loser.cancel()  # only stops it if it hasn't started; otherwise it runs to the end
+                if future is not first:
+                    RESILIENCE_EVENTS.inc(chain=self.name, event="hedge_won")
+                return result
+            if hedge_at is not None and time.monotonic() >= hedge_at and attempts:
+                hedge_at = None
+                if not self._can_hedge_sync(model):
+                    RESILIENCE_EVENTS.inc(chain=self.name, event="hedge_skipped")
+                    continue
+                RESILIENCE_EVENTS.inc(chain=self.name, event="hedged")
+                attempts[self._submit(model, input, config)] = time.monotonic()
+
+        if errors and not attempts:
+            raise errors[0]
+        RESILIENCE_EVENTS.inc(chain=self.name, event="deadline")
+        raise LLMDeadlineExceeded(f"{self.name}: no answer within {self.deadline_seconds:.0f}s")
+
+    @staticmethod
+    def _can_hedge_sync(model) -> bool:
+        """
+        The losing sync request can't be cancelled and keeps its rate limiter reservation,
+        so only hedge while the limiter is far from its limit. Models without a limiter
+        (no rate_limit_headroom(), e.g. fake_llm.py) always may.
+        """
+        headroom = getattr(model, "rate_limit_headroom", None)
+        return headroom is None or headroom() >= HEDGE_MIN_HEADROOM
+
+    @staticmethod
+    def _submit(model, input: Any, config):
+        context = contextvars.copy_context()  # keeps the callbacks/tracing context of the caller
+        return _executor.submit(context.run, model.invoke, input, config)
+
+    # B. Async (the loser of a hedge is really cancelled here)
+    async def ainvoke(self, input: Any, config=None, **kwargs) -> Any:
+        if self.breaker.allow():
+            try:
+                result = await self._acall(self.primary, input, config, hedge=self.hedging)
+            except Exception as e:
+                self._on_failure(e)
+            else:
+                self.breaker.record_success()
+                return result
+        else:
+            self._on_rejected()
+        return await self._acall(self.fallback, input, config, hedge=False)
+
+    async def _acall(self, model, input: Any, config, hedge: bool) -> Any:
+        started = time.monotonic()
+        deadline = started + self.deadline_seconds
+        hedge_delay = self.tracker.hedge_delay() if hedge else None
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        first = asyncio.ensure_future(model.ainvoke(input, config))
+        attempts = {first: started}
+        errors = []
+        try:
+            while attempts and time.monotonic() < deadline:
+                wake = min(deadline, hedge_at) if hedge_at is not None else deadline
+                done, _ = await asyncio.wait(list(attempts), timeout=max(0.0, wake - time.monotonic()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt_started = attempts.pop(task)
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        continue
+                    self.tracker.observe(time.monotonic() - attempt_started)
+                    if task is not first:
+                        RESILIENCE_EVENTS.inc(chain=self.name, event="hedge_won")
+                    return task.result()
+                if hedge_at is not None and time.monotonic() >= hedge_at and attempts:
+                    RESILIENCE_EVENTS.inc(chain=self.name, event="hedged")
+                    attempts[asyncio.ensure_future(model.ainvoke(input, config))] = time.monotonic()
+                    hedge_at = None
+        finally:
+            for task in attempts:
+                task.cancel()
+
+        if errors and not attempts:
+            raise errors[0]
+        RESILIENCE_EVENTS.inc(chain=self.name, event="deadline")
+        raise LLMDeadlineExceeded(f"{self.name}: no answer within {self.deadline_seconds:.0f}s")
+
+    # C. Streaming (no hedging: the first tokens are already on their way to the user)
+    def stream(self, input: Any, config=None, **kwargs) -> Iterator[Any]:
+        use_primary = self.breaker.allow()
+        if not use_primary:
+            self._on_rejected()
+        model = self.primary if use_primary else self.fallback
+        try:
+            yield from model.stream(input, config)
+        except Exception as e:
+            if use_primary:
+                self._record_failure(e)
+            raise
+        if use_primary:
+            self.breaker.record_success()
+
+    async def astream(self, input: Any, config=None, **kwargs):
+        use_primary = self.breaker.allow()
+        if not use_primary:
+            self._on_rejected()
+        model = self.primary if use_primary else self.fallback
+        try:
+            async for chunk in model.astream(input, config):
+                yield chunk
+        except Exception as e:
+            if use_primary:
+                self._record_failure(e)
+            raise
+        if use_primary:
+            self.breaker.record_success()
+
+    # D. Shared bookkeeping
+    def _on_failure(self, error: Exception) -> None:
+        """Primary failed: count it, then either re-raise or let the caller use the fallback."""
+        if not self._record_failure(error) or self.fallback is None:
+            raise error
+        logger.warning(f"{self.name}: primary model failed ({error}), using the fallback model")
+        RESILIENCE_EVENTS.inc(chain=self.name, event="fallback")
+
+    def _record_failure(self, error: Exception) -> bool:
+        """Feeds the breaker; errors flagged counts_as_provider_failure=False (llm_client.LLMRateLimited) don't count."""
+        if not getattr(error, "counts_as_provider_failure", True):
+            self.breaker.record_ignored()
+            return False
+        self.breaker.record_failure()
+        RESILIENCE_EVENTS.inc(chain=self.name, event="failure")
+        return True
+
+    def _on_rejected(self) -> None:
+        """Breaker open: fail fast, or let the caller use the fallback."""
+        if self.fallback is None:
+            RESILIENCE_EVENTS.inc(chain=self.name, event="rejected")
+            raise CircuitOpenError(f"{self.name}: the model provider is failing, try again shortly")
+        RESILIENCE_EVENTS.inc(chain=self.name, event="fallback")
+
+
+if __name__ == "__main__":
+    from langchain_openai import ChatOpenAI
+    from fake_openai_server import serve_in_background
+
+    print("--- Testing resilience against fake_openai_server ---")
+    server, base_url = serve_in_background(latency="constant:0.05", hang_rate=0.15, hang_seconds=3, seed=3)
+    backup, backup_url = serve_in_background(latency="constant:0.02")
+    primary = ChatOpenAI(model="primary-model", base_url=base_url, api_key="sk-fake", timeout=5, max_retries=0)
+    fallback = ChatOpenAI(model="backup-model", base_url=backup_url, api_key="sk-fake", timeout=5, max_retries=0)
+
+    HEDGE_MIN_DELAY_SECONDS, HEDGE_MIN_SAMPLES = 0.2, 5
+    llm = ResilientLLM("demo", primary, fallback=fallback, deadline_seconds=2)
+    latencies = []
+    for _ in range(40):
+        started = time.monotonic()
+        llm.invoke("Return general_questions")
+        latencies.append(time.monotonic() - started)
+    print(f"15% of calls hang for 3s; slowest of 40 calls with hedging: {max(latencies):.2f}s")
+
+    server.error_rate = 1.0  # provider outage
+    for _ in range(BREAKER_FAILURES + 2):
+        llm.invoke("Return general_questions")
+    print(f"breaker after the outage: {llm.breaker.state}, backup server calls: {backup.calls}")
+    print([line for line in registry.render().splitlines() if line.startswith("mvita_llm_resilience")])
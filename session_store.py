@@ -0,0 +1,285 @@
+# session_store.py
+# Where interview sessions live between /api/start and /api/finish.
+#
+# Two backends, picked with SESSION_STORE:
+#   memory  - a dict in this process (default, fine for `python flask_server.py`)
+#   sqlite  - a SQLite file in WAL mode, shared by every worker process
+#             (use this under gunicorn, otherwise /api/finish may land on a
+#              worker that never saw the session)
+# Both evict sessions after SESSION_TTL_SECONDS and cap the total count at
+# SESSION_MAX_SESSIONS, so abandoned interviews don't leak memory forever.
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# --- 1. Config ---
+DEFAULT_BACKEND = os.environ.get("SESSION_STORE", "memory")
+DEFAULT_DB_PATH = os.environ.get("SESSION_DB_PATH", "sessions.db")
+DEFAULT_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", str(6 * 3600)))
+DEFAULT_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "10000"))
+
+
+def new_session_id() -> str:
+    """Random, collision-free, and the same in every process (unlike hash())."""
+    return "session_" + uuid.uuid4().hex
+
+
+# --- 2. The interface ---
+class SessionStore:
+    """
+    Base class of the session backends.
+    Values are plain JSON-serialisable dicts.
+    """
+
+    def __init__(self, ttl_seconds: float, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._counters = {
+            "created": 0,
+            "deleted": 0,
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+        self._counter_lock = threading.Lock()
+
+    def create(self, data: Dict[str, Any]) -> str:
+        session_id = new_session_id()
+        self.put(session_id, data)
+        self._count("created")
+        return session_id
+
+    def put(self, session_id: str, data: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, session_id: str, mutate: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        """
+        Atomically applies 'mutate' to a stored session and saves it.
+        Returns the new value, or None if the session does not exist.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            self._counters[name] += amount
+
+    def _base_stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            return {
+                **self._counters,
+                "backend": self.backend,
+                "ttl_seconds": self.ttl_seconds,
+                "max_sessions": self.max_sessions,
+            }
+
+
+# --- 3. Backend 1: in-process memory ---
+class InMemorySessionStore(SessionStore):
+    backend = "memory"
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_sessions: int = DEFAULT_MAX_SESSIONS):
+        super().__init__(ttl_seconds, max_sessions)
+        # session_id -> (expires_at, json string); ordered oldest write first
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, session_id, data):
+        encoded = json.dumps(data)
+        with self._lock:
+            self._sessions[session_id] = (time.time() + self.ttl_seconds, encoded)
+            self._sessions.move_to_end(session_id)
+            self._evict_locked()
+
+    def get(self, session_id):
+        with self._lock:
+            value = self._live_locked(session_id)
+        self._count("hits" if value is not None else "misses")
+        return json.loads(value) if value is not None else None
+
+    def update(self, session_id, mutate):
+        with self._lock:
+            value = self._live_locked(session_id)
+            if value is None:
+                return None
+            data = json.loads(value)
+            mutate(data)
+            self._sessions[session_id] = (time.time() + self.ttl_seconds, json.dumps(data))
+            self._sessions.move_to_end(session_id)
+            return data
+
+    def delete(self, session_id):
+        with self._lock:
+            existed = self._sessions.pop(session_id, None) is not None
+        if existed:
+            self._count("deleted")
+        return existed
+
+    def stats(self):
+        with self._lock:
+            self._expire_locked()
+            size = len(self._sessions)
+            approx_bytes = sum(len(encoded) for _, encoded in self._sessions.values())
+        return {**self._base_stats(), "size": size, "approx_bytes": approx_bytes}
+
+    def _live_locked(self, session_id) -> Optional[str]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self._sessions[session_id]
+            self._count("expirations")
+            return None
+        return entry[1]
+
+    def _expire_locked(self) -> None:
+        now = time.time()
+        expired = [sid for sid, (expires_at, _) in self._sessions.items() if expires_at < now]
+        for sid in expired:
+            del self._sessions[sid]
+        if expired:
+            self._count("expirations", len(expired))
+
+    def _evict_locked(self) -> None:
+        if len(self._sessions) <= self.max_sessions:
+            return
+        self._expire_locked()
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._count("evictions")
+
+
+# --- 4. Backend 2: SQLite (shared by all worker processes) ---
+class SQLiteSessionStore(SessionStore):
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+    ):
+        super().__init__(ttl_seconds, max_sessions)
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers and a writer work at the same time
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, session_id, data):
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(data), now, now + self.ttl_seconds),
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, session_id):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE session_id = ? AND expires_at >= ?",
+            (session_id, time.time()),
+        ).fetchone()
+        self._count("hits" if row else "misses")
+        return json.loads(row[0]) if row else None
+
+    def update(self, session_id, mutate):
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")  # take the write lock before reading
+        try:
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND expires_at >= ?",
+                (session_id, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            data = json.loads(row[0])
+            mutate(data)
+            conn.execute(
+                "UPDATE sessions SET data = ?, updated_at = ?, expires_at = ? WHERE session_id = ?",
+                (json.dumps(data), now, now + self.ttl_seconds, session_id),
+            )
+            conn.execute("COMMIT")
+            return data
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, session_id):
+        deleted = self._connection().execute(
+            "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+        ).rowcount > 0
+        if deleted:
+            self._count("deleted")
+        return deleted
+
+    def stats(self):
+        size, approx_bytes = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions WHERE expires_at >= ?",
+            (time.time(),),
+        ).fetchone()
+        return {**self._base_stats(), "size": size, "approx_bytes": approx_bytes, "db_path": self.db_path}
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+        if expired:
+            self._count("expirations", expired)
+        overflow = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM sessions WHERE session_id IN "
+                "(SELECT session_id FROM sessions ORDER BY updated_at LIMIT ?)",
+                (overflow,),
+            )
+            self._count("evictions", overflow)
+
+
+# --- 5. Factory ---
+def make_session_store(backend: str = DEFAULT_BACKEND) -> SessionStore:
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend!r} (use 'memory' or 'sqlite')")
@@ -0,0 +1,65 @@
+# shared_state.py
+# The stores and helpers both servers use: flask_server.py and asgi_server.py.
+# Kept out of flask_server.py so the ASGI app doesn't import Flask, the job queues and
+# the admission controller just to reach the session and report stores.
+# The stores are blocking (SQLite), so asgi_server.py calls them with asyncio.to_thread().
+import os
+import time
+from typing import Dict
+
+from question_generator import warm_up as warm_up_questions
+from critic import warm_up as warm_up_critic
+from session_store import make_session_store
+from report_store import ReportStore
+from instrumentation import get_logger
+
+logger = get_logger("shared_state")
+
+# Sessions between /api/start and /api/finish (see session_store.py;
+# gunicorn.conf.py switches to SESSION_STORE=sqlite when running several worker processes)
+session_store = make_session_store()
+
+# Finished reports, keyed on session id + transcript hash (see report_store.py)
+report_store = ReportStore()
+
+# The LLM chains are built lazily on first use. Preforking servers call warm_up()
+# in every worker after the fork (see gunicorn.conf.py); WARM_UP_ON_START=1 does the
+# same for the dev server and asgi_server.py.
+WARM_UP_ON_START = os.environ.get("WARM_UP_ON_START", "0") == "1"
+
+
+def warm_up() -> None:
+    """Builds the question and Critic chains now, so the first request doesn't pay for it."""
+    started = time.perf_counter()
+    warm_up_questions()
+    warm_up_critic()
+    logger.info(f"Warm-up done in {time.perf_counter() - started:.2f}s")
+
+
+def save_session(state: Dict, questions: Dict, cv_compact: str = None) -> str:
+    """
+    Stores a freshly started interview and returns its session id.
+    'cv_compact' is the token-trimmed CV, kept so the Critic doesn't redo the work.
+    """
+    return session_store.create({
+        "cv_text": state["cv_text"],
+        "cv_compact": cv_compact,
+        "job_role": state["job_role"],
+        "job_company": state["job_company"],
+        "job_country": state["job_country"],
+        "questions": questions
+    })
+
+
+def critic_state_from_session(session_data: Dict, transcript) -> Dict:
+    """Prepares the "conveyor belt" (State) for the Critic from a stored session."""
+    return {
+        "cv_text": session_data["cv_text"],
+        "cv_compact": session_data.get("cv_compact"),
+        "job_role": session_data["job_role"],
+        "job_company": session_data["job_company"],
+        "job_country": session_data["job_country"],
+        "questions": session_data["questions"],
+        "answer_evaluations": session_data.get("answer_evaluations", []),
+        "interview_transcript": transcript
+    }
@@ -10,12 +10,21 @@ class InterviewWorkflowState(TypedDict):
     job_company: str
     job_country: str
 
+    # Token-trimmed CV (from cv_compactor.py), reused by every prompt after /api/start
+    cv_compact: str
+
+    # MinHash signature of the CV (see similar_index.py), computed once per /api/start
+    cv_signature: List[int]
+
     # Intermediate data (from Question Generator)
     questions: Dict[str, List[str]]
     
     # Intermediate data (from Anam/Frontend)
     interview_transcript: List[Dict[str, str]]
 
+    # Per-answer scores collected during the interview (from /api/answer)
+    answer_evaluations: List[Dict[str, Any]]
+
     # Final output (from Critic)
     final_review: Dict[str, Any] # This is a Dict, not a str
     error: str
\ No newline at end of file
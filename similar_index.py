@@ -0,0 +1,270 @@
+# similar_index.py
+# Finds earlier question sets for *nearly* identical CVs.
+# Many CVs come from the same bootcamp template (same projects, same wording) and are
+# sent to the same roles; the exact-match question cache misses them because one line differs.
+#
+# Every CV is turned into a MinHash signature over its word 3-grams. Signatures are
+# split into LSH bands, so finding candidates is a few dictionary lookups instead of a
+# scan. A candidate is only reused if the job (role, company, country) is the same and
+# the estimated Jaccard similarity of the CVs is at least 'threshold'.
+#
+# The index is persisted as an append-only JSON-lines file and replayed on start.
+# Several worker processes append to the same file; appends and compaction take an
+# exclusive lock on "<path>.lock", and compaction re-reads the file first, so entries
+# other workers appended are kept.
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl  # POSIX only; elsewhere the file is only guarded within this process
+except ImportError:
+    fcntl = None
+
+from instrumentation import get_logger
+
+logger = get_logger("similar_index")
+
+# --- 1. Config ---
+# Off unless SIMILAR_INDEX_ENABLED=1. In memory only, unless SIMILAR_INDEX_PATH names the file
+# to persist it in (nothing is written to the working directory by default).
+SIMILAR_INDEX_ENABLED = os.environ.get("SIMILAR_INDEX_ENABLED", "0") == "1"
+DEFAULT_THRESHOLD = float(os.environ.get("SIMILAR_CV_THRESHOLD", "0.85"))
+DEFAULT_PATH = os.environ.get("SIMILAR_INDEX_PATH") or None
+DEFAULT_MAX_ENTRIES = int(os.environ.get("SIMILAR_INDEX_MAX_ENTRIES", "20000"))
+
+NUM_PERM = 128
+BANDS = 32  # 32 bands x 4 rows: pairs above ~0.5 similarity almost always share a band
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1)  # fixed seed: signatures must stay comparable across restarts
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+
+# --- 2. MinHash ---
+def _normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").split()).casefold()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    words = re.findall(r"[a-z0-9+#.]+", (text or "").casefold())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str) -> List[int]:
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+        for s in shingles(text)
+    ]
+    if not hashes:
+        return [_MAX_HASH] * NUM_PERM
+    return [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def job_key(job_role: str, job_company: str, job_country: str, version: str = "") -> str:
+    return json.dumps([version, _normalize(job_role), _normalize(job_company), _normalize(job_country)])
+
+
+# --- 3. The index ---
+class SimilarQuestionIndex:
+    """
+    Thread-safe MinHash/LSH index of (CV, job) -> question set.
+    lookup() returns (questions, similarity) for the closest earlier CV with the same job.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        path: Optional[str] = DEFAULT_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.path = path
+        self.max_entries = max_entries
+        self.rows = NUM_PERM // BANDS
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple, set] = {}
+        self._lock = threading.Lock()
+        self._log_lines = 0
+        self._counters = {"lookups": 0, "hits": 0, "adds": 0, "evictions": 0}
+        if self.path:
+            self._load()
+
+    # A. Public API
+    def lookup(self, cv_text: str, job_role: str, job_company: str, job_country: str,
+               version: str = "", signature: Optional[List[int]] = None) -> Optional[Tuple[Dict, float]]:
+        """'signature' is minhash(cv_text) if the caller already has it (it is reused for add())."""
+        job = job_key(job_role, job_company, job_country, version)
+        signature = signature or minhash(cv_text)
+        with self._lock:
+            self._counters["lookups"] += 1
+            candidates = set()
+            for band in self._bands(job, signature):
+                candidates |= self._buckets.get(band, set())
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                score = estimate_similarity(signature, self._entries[entry_id]["signature"])
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None or best_score < self.threshold:
+                return None
+            self._counters["hits"] += 1
+            return json.loads(json.dumps(self._entries[best_id]["questions"])), best_score
+
+    def add(self, cv_text: str, job_role: str, job_company: str, job_country: str,
+            questions: Dict, version: str = "", signature: Optional[List[int]] = None) -> None:
+        entry = {
+            "id": hashlib.sha256(f"{job_key(job_role, job_company, job_country, version)}\n{_normalize(cv_text)}"
+                                 .encode("utf-8")).hexdigest()[:24],
+            "job": job_key(job_role, job_company, job_country, version),
+            "signature": signature or minhash(cv_text),
+            "questions": questions,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._counters["adds"] += 1
+            self._insert_locked(entry)
+        self._append(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "size": len(self._entries),
+                "threshold": self.threshold,
+                "persistent": bool(self.path),
+                "hit_ratio": round(self._counters["hits"] / self._counters["lookups"], 4)
+                if self._counters["lookups"] else 0.0,
+            }
+
+    # B. Internals
+    def _bands(self, job: str, signature: List[int]):
+        for band in range(BANDS):
+            yield (job, band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+
+    def _insert_locked(self, entry: Dict[str, Any]) -> None:
+        if entry["id"] in self._entries:
+            self._remove_locked(entry["id"])
+        self._entries[entry["id"]] = entry
+        for band in self._bands(entry["job"], entry["signature"]):
+            self._buckets.setdefault(band, set()).add(entry["id"])
+        while len(self._entries) > self.max_entries:
+            self._remove_locked(next(iter(self._entries)))
+            self._counters["evictions"] += 1
+
+    def _remove_locked(self, entry_id: str) -> None:
+        entry = self._entries.pop(entry_id)
+        for band in self._bands(entry["job"], entry["signature"]):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _read_log(self) -> Iterator[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # a half-written last line after a crash
+        except FileNotFoundError:
+            return
+
+    def _load(self) -> None:
+        try:
+            for entry in self._read_log():
+                self._insert_locked(entry)
+                self._log_lines += 1
+        except OSError as e:
+            logger.warning(f"Could not load the similar-CV index: {e}")
+            return
+        logger.info(f"Loaded {len(self._entries)} entries into the similar-CV index")
+        if self._log_lines > 2 * max(len(self._entries), 1):
+            self._compact()
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Exclusive across the worker processes sharing the file (and, with _lock, across threads)."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        try:
+            with self._lock, self._file_lock():
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._log_lines += 1
+                needs_compaction = self._log_lines > 2 * self.max_entries
+            if needs_compaction:
+                self._compact()
+        except OSError as e:
+            logger.warning(f"Could not write to the similar-CV index: {e}")
+
+    def _compact(self) -> None:
+        """
+        Rewrites the log with only the live entries (evicted and replaced ones are dropped).
+        The file is re-read under the lock first: other workers may have appended entries
+        this process never saw, and those must survive (they are added to our index too).
+        """
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with self._lock, self._file_lock():
+                latest: Dict[str, Dict[str, Any]] = {}
+                for entry in [*self._read_log(), *self._entries.values()]:
+                    if entry["id"] not in latest or entry["created_at"] >= latest[entry["id"]]["created_at"]:
+                        latest[entry["id"]] = entry
+                live = sorted(latest.values(), key=lambda entry: entry["created_at"])[-self.max_entries:]
+                self._entries.clear()
+                self._buckets.clear()
+                for entry in live:
+                    self._insert_locked(entry)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for entry in self._entries.values():
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.path)
+                self._log_lines = len(self._entries)
+        except OSError as e:
+            logger.warning(f"Could not compact the similar-CV index: {e}")
+
+
+if __name__ == "__main__":
+    print("--- Testing similar_index ---")
+    index = SimilarQuestionIndex(threshold=0.8, path=None)
+    cv = ("Jane Doe. Bootcamp graduate. Projects: built a Flask + Vue.js booking platform with PostgreSQL, "
+          "deployed on Docker; built a LangChain agent that generates interview questions. "
+          "Skills: Python, Flask, Vue.js, SQL, Docker, Git. Education: BSc Computer Science.")
+    questions = {"general_questions": ["g"], "cv_based_questions": ["c"], "technical_questions": ["t"]}
+    index.add(cv, "Backend Engineer", "Acme", "UK", questions)
+
+    near_duplicate = cv.replace("Jane Doe", "John Smith")
+    different = "Senior accountant with ten years of audit experience in retail banking and IFRS reporting."
+    print("near duplicate:", index.lookup(near_duplicate, "Backend Engineer", "Acme", "UK"))
+    print("other job:     ", index.lookup(near_duplicate, "Data Analyst", "Acme", "UK"))
+    print("different CV:  ", index.lookup(different, "Backend Engineer", "Acme", "UK"))
+    print(index.stats())
@@ -0,0 +1,349 @@
+# structured_output.py
+# A more forgiving JsonOutputParser for the LLM chains.
+# A slightly broken answer from the model (code fences, prose around the JSON,
+# trailing commas, Python-style quotes/literals, a truncated list, "Performance Summary"
+# instead of "performance_summary") used to raise and fail the whole request.
+# RepairingJsonOutputParser tries, in order:
+#   1. the normal JSON parse
+#   2. a local repair (no LLM call, microseconds)
+#   3. a short "fix this JSON" prompt to the model (much cheaper than re-running the node)
+# The result is always validated against the pydantic model; missing optional
+# fields are filled with empty values. Every outcome is counted in /metrics.
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, get_args, get_origin
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
+from langchain_core.utils.json import parse_partial_json
+from pydantic import ValidationError
+
+from instrumentation import get_logger, registry
+
+logger = get_logger("structured_output")
+
+STRUCTURED_OUTPUT = registry.counter(
+    "mvita_structured_output_total",
+    "Structured LLM outputs by schema and outcome (parsed, repaired, llm_fixed, failed)",
+)
+
+FIX_PROMPT_TEMPLATE = """The text below was supposed to be a single JSON object, but it is invalid: {error}
+
+Return ONLY the corrected JSON object. Keep every value exactly as it is, only fix the structure
+and the key names. No explanations, no code fences.
+
+{format_instructions}
+
+Text to fix:
+---
+{output}
+---
+"""
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+
+
+# --- 1. Local repair ---
+def _scan(text: str) -> Tuple[Optional[int], bool]:
+    """
+    Finds where the first JSON value in 'text' ends.
+    Returns (end index or None if the text is truncated, whether it stopped inside a string).
+    """
+    depth, in_string, escaped = 0, False, False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return i, False
+    return None, in_string
+
+
+def _drop_unfinished_item(data: Any) -> None:
+    """After a cut-off answer, the last string of the last list is half a sentence, so drop it."""
+    while True:
+        if isinstance(data, dict) and data:
+            last = data[next(reversed(data))]
+        elif isinstance(data, list) and data:
+            last = data[-1]
+            if isinstance(last, str):
+                data.pop()
+                return
+        else:
+            return
+        if not isinstance(last, (dict, list)):
+            return
+        data = last
+
+
+def _json_span(text: str) -> Tuple[str, Optional[int], bool]:
+    """Strips code fences and leading prose; returns (text from the first bracket, _scan() of it)."""
+    text = (text or "").strip()
+    fence = _FENCE.search(text)
+    if fence:
+        text = fence.group(1).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("no JSON object in the output")
+    text = text[min(starts):]
+    return (text, *_scan(text))
+
+
+def _read_string(text: str, start: int) -> Tuple[str, int, bool]:
+    """
+    Reads the string starting at text[start] (a " or ' quote).
+    Returns (its JSON form, the index after it, whether it was closed).
+    A ' only closes a single-quoted string when a , : } ] (or the end) follows it,
+    so apostrophes ('it's') stay inside the string.
+    """
+    quote, i, chars = text[start], start + 1, []
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and i + 1 < len(text):
+            following = text[i + 1]
+            if following == "u" and _HEX4.fullmatch(text[i + 2:i + 6]):
+                chars.append(text[i:i + 6])  # kept as an escape (surrogate pairs stay intact)
+                i += 6
+                continue
+            chars.append(json.dumps(_ESCAPES.get(following, "\\" + following))[1:-1])
+            i += 2
+            continue
+        if char == quote:
+            rest = text[i + 1:].lstrip()
+            if quote == '"' or not rest or rest[0] in ",:}]":
+                return '"' + "".join(chars) + '"', i + 1, True
+        chars.append(json.dumps(char, ensure_ascii=False)[1:-1])
+        i += 1
+    return '"' + "".join(chars), i, False
+
+
+def _normalize(text: str) -> Tuple[str, bool, bool]:
+    """
+    Rewrites the first JSON-ish value of 'text' as JSON, token by token, so the repairs never
+    touch the inside of a string: single-quoted strings become double-quoted, True/False/None
+    become true/false/null and trailing commas are dropped. Prose after the value is dropped.
+    Returns (JSON text, whether the value was complete, whether it was cut inside a string).
+    """
+    out: List[str] = []
+    depth, i = 0, 0
+    while i < len(text):
+        char = text[i]
+        if char in "\"'":
+            token, i, closed = _read_string(text, i)
+            out.append(token)
+            if not closed:
+                return "".join(out), False, True
+            continue
+        if char.isalpha() or char == "_":
+            word = re.match(r"\w+", text[i:]).group(0)
+            out.append(_PY_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        if char in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()  # a trailing comma
+        out.append(char)
+        i += 1
+        if char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return "".join(out), True, False
+    return "".join(out), False, False
+
+
+def is_truncated(text: str) -> bool:
+    try:
+        return _json_span(text)[1] is None
+    except ValueError:
+        return False
+
+
+def repair_json(text: str) -> Any:
+    """Best-effort parse of almost-JSON text. Raises ValueError if nothing works."""
+    text, complete, cut_in_string = _normalize(_json_span(text)[0])
+    try:
+        return json.loads(text, strict=False)  # strict=False: raw newlines inside strings
+    except ValueError:
+        pass
+    if not complete:
+        data = parse_partial_json(text, strict=False)  # closes open strings, lists and objects
+        if data is not None:
+            if cut_in_string:
+                _drop_unfinished_item(data)
+            return data
+    raise ValueError("could not repair the JSON")
+
+
+# --- 2. Making the data fit the schema ---
+def _key(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(name).casefold())
+
+
+def _empty(annotation: Any) -> Any:
+    origin = get_origin(annotation)
+    if origin is list:
+        return []
+    if origin is dict:
+        return {}
+    if annotation is int:
+        return 0
+    return ""
+
+
+def _coerce(value: Any, annotation: Any) -> Any:
+    """Nudges values towards the annotation: numbers to strings, a lone string to a list, etc."""
+    origin, args = get_origin(annotation), get_args(annotation)
+    if annotation is str:
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return value if isinstance(value, str) else str(value)
+    if origin is list and args:
+        items = value if isinstance(value, list) else [value]
+        return [_coerce(item, args[0]) for item in items if item is not None]
+    if origin is dict and len(args) == 2 and isinstance(value, dict):
+        return {str(k): _coerce(v, args[1]) for k, v in value.items()}
+    return value
+
+
+def conform(data: Any, pydantic_object, required_fields: Tuple[str, ...] = ()) -> Tuple[Dict, bool]:
+    """
+    Maps 'data' onto the model: fixes key names, unwraps {"ModelName": {...}},
+    coerces values, fills missing optional fields and validates.
+    Returns (clean dict, whether anything had to change). Raises ValueError if it can't fit.
+    """
+    fields = pydantic_object.model_fields
+    lookup = {_key(name): name for name in fields}
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+    if not any(_key(k) in lookup for k in data):
+        nested = [v for v in data.values() if isinstance(v, dict)]
+        if len(nested) == 1:
+            data = nested[0]
+
+    conformed: Dict[str, Any] = {}
+    for key, value in data.items():
+        name = lookup.get(_key(key))
+        if name is not None:
+            conformed[name] = _coerce(value, fields[name].annotation)
+
+    missing = [name for name in required_fields if conformed.get(name) in (None, "", [], {})]
+    if missing:
+        raise ValueError(f"missing required fields: {missing}")
+    for name, field in fields.items():
+        if name not in conformed:
+            conformed[name] = _empty(field.annotation)
+
+    try:
+        clean = pydantic_object.model_validate(conformed).model_dump()
+    except ValidationError as e:
+        raise ValueError(str(e)) from e
+    return clean, clean != data
+
+
+# --- 3. The parser ---
+class RepairingJsonOutputParser(JsonOutputParser):
+    """
+    JsonOutputParser that repairs, validates and (as a last resort) asks 'fix_llm'
+    to fix the JSON. Streaming (partial) parsing behaves exactly like JsonOutputParser.
+    'required_fields' must be present and non-empty; every other field is optional.
+    """
+
+    required_fields: Tuple[str, ...] = ()
+    fix_llm: Optional[Any] = None
+
+    @property
+    def schema_name(self) -> str:
+        return getattr(self.pydantic_object, "__name__", "json")
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False) -> Any:
+        if partial or self.pydantic_object is None:
+            return super().parse_result(result, partial=partial)
+
+        text = result[0].text
+        try:
+            data, outcome = super().parse_result(result), "parsed"
+        except OutputParserException:
+            data, outcome = None, "repaired"
+        if data is not None and is_truncated(text):
+            data, outcome = None, "repaired"  # the plain parser keeps the half-written last item
+        try:
+            if data is None:
+                data = repair_json(text)
+            clean, changed = conform(data, self.pydantic_object, self.required_fields)
+        except ValueError as e:
+            return self._fix_with_llm(text, e)
+
+        outcome = "repaired" if changed else outcome
+        if outcome == "repaired":
+            logger.info(f"Repaired {self.schema_name} output locally", extra={"schema": self.schema_name})
+        STRUCTURED_OUTPUT.inc(schema=self.schema_name, outcome=outcome)
+        return clean
+
+    def _fix_with_llm(self, text: str, error: Exception) -> Dict:
+        logger.warning(f"{self.schema_name} output could not be repaired locally: {error}",
+                       extra={"schema": self.schema_name})
+        if self.fix_llm is None:
+            return self._fail(text, error)
+        try:
+            message = self.fix_llm.invoke(FIX_PROMPT_TEMPLATE.format(
+                error=error, format_instructions=self.get_format_instructions(), output=text,
+            ))
+            fixed_text = getattr(message, "content", message)
+            clean, _ = conform(repair_json(fixed_text), self.pydantic_object, self.required_fields)
+        except Exception as e:
+            return self._fail(text, e)
+        STRUCTURED_OUTPUT.inc(schema=self.schema_name, outcome="llm_fixed")
+        return clean
+
+    def _fail(self, text: str, error: Exception):
+        STRUCTURED_OUTPUT.inc(schema=self.schema_name, outcome="failed")
+        raise OutputParserException(f"Invalid {self.schema_name} output: {error}", llm_output=text)
+
+
+if __name__ == "__main__":
+    from pydantic import BaseModel, Field
+
+    class Example(BaseModel):
+        summary: str = Field(description="summary")
+        items: List[str] = Field(description="items")
+        scores: Dict[str, Dict[str, str]] = Field(description="scores")
+
+    print("--- Testing structured_output ---")
+    parser = RepairingJsonOutputParser(pydantic_object=Example, required_fields=("summary",))
+    samples = [
+        '{"summary": "ok", "items": ["a", "b"], "scores": {}}',
+        'Sure! ```json\n{"Summary": "ok", "items": ["a", "b",],}\n``` Hope this helps.',
+        "{'summary': 'ok', 'items': ['a'], 'scores': {'Teamwork': {'Rating': 4}}, 'extra': None}",
+        '{"summary": "cut off", "items": ["complete item", "half an ite',
+        '{"Example": {"summary": "wrapped", "items": "just one"}}',
+        # the repairs must leave string contents alone
+        '{"summary": "Said True, then [a, b,] and None", "items": ["it\'s fine", "\'quoted\'"],}',
+        "{'summary': 'The candidate's answers were clear', 'items': ['didn't quantify', 'O\\'Brien'], 'scores': {}}",
+    ]
+    for sample in samples:
+        print(parser.parse(sample))
+    try:
+        parser.parse('{"items": ["no summary"]}')
+    except OutputParserException as e:
+        print("failed as expected:", e)
+    print(registry.render())
@@ -0,0 +1,32 @@
+# Tests run offline: the LLM is fake_llm.FakeInterviewLLM, and nothing is written to the
+# working directory (stores in memory, caches and the similar-CV index off disk).
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-tests")  # ChatOpenAI refuses to build without one
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("SIMILAR_INDEX_PATH", "")
+os.environ.setdefault("REPORT_STORE_PATH", "")
+os.environ.setdefault("JOB_STORE_PATH", "")
+os.environ.setdefault("QUESTION_CACHE_DIR", "")
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Plugs fake_llm.FakeInterviewLLM into both chains, with an empty memory-only question cache."""
+    import critic
+    import question_generator
+    from fake_llm import FakeInterviewLLM
+    from question_cache import QuestionCache
+
+    llm = FakeInterviewLLM(latency="constant:0")
+    monkeypatch.setattr(question_generator, "question_cache", QuestionCache(disk_dir=None))
+    question_generator.use_llm(llm)
+    critic.use_llm(llm)
+    yield llm
+    question_generator.use_llm(None)
+    critic.use_llm(None)
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, Lane
+
+
+def make_controller(slots=1, start_queue=2, start_budget=5.0):
+    lanes = [Lane("finish", 0, slots, 16, 5.0, 1.0), Lane("start", 2, slots, start_queue, start_budget, 1.0)]
+    return AdmissionController(slots=slots, lanes=lanes, enabled=True)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_a_freed_slot_goes_to_the_highest_priority_waiter():
+    controller = make_controller()
+    order = []
+
+    def request(lane):
+        with controller.acquire(lane, shed=False):
+            order.append(lane)
+
+    held = controller.acquire("start")
+    waiters = [threading.Thread(target=request, args=("start",))]
+    waiters[0].start()
+    wait_until(lambda: controller.stats()["lanes"]["start"]["queued"] == 1)
+    waiters.append(threading.Thread(target=request, args=("finish",)))
+    waiters[1].start()
+    wait_until(lambda: controller.stats()["lanes"]["finish"]["queued"] == 1)
+    held.release()
+    for waiter in waiters:
+        waiter.join(2)
+    assert order == ["finish", "start"]  # the finish arrived later but goes first
+
+
+def test_full_queue_is_shed_with_429_and_a_retry_after():
+    controller = make_controller(start_queue=1)
+    held = controller.acquire("start")
+    waiter = threading.Thread(target=lambda: controller.acquire("start").release())
+    waiter.start()
+    wait_until(lambda: controller.stats()["lanes"]["start"]["queued"] == 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("start")
+    assert rejected.value.status == 429 and rejected.value.reason == "queue_full"
+    assert rejected.value.retry_after >= 1
+    held.release()
+    waiter.join(2)
+    assert controller.stats()["lanes"]["start"]["shed_queue_full"] == 1
+
+
+def test_over_budget_wait_is_shed_with_503_but_background_work_just_waits():
+    controller = make_controller(start_budget=0.5)  # one slot and a 1s service time: over budget
+    held = controller.acquire("finish")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("start")
+    assert rejected.value.status == 503 and rejected.value.reason == "wait_budget"
+
+    granted = []
+    waiter = threading.Thread(target=lambda: granted.append(controller.acquire("start", shed=False)))
+    waiter.start()
+    time.sleep(0.05)
+    assert granted == []
+    held.release()
+    waiter.join(2)
+    granted[0].release()
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_release_is_idempotent():
+    controller = make_controller()
+    ticket = controller.acquire("start")
+    ticket.release()
+    ticket.release()
+    assert controller.stats()["in_flight"] == 0
+    assert controller.stats()["lanes"]["start"]["in_flight"] == 0
+
+
+def test_disabled_controller_admits_everything():
+    controller = AdmissionController(slots=1, lanes=[Lane("start", 2, 1, 0, 0.0, 1.0)], enabled=False)
+    tickets = [controller.acquire("start") for _ in range(5)]
+    controller.check("start")
+    for ticket in tickets:
+        ticket.release()
+
+
+def test_async_acquire_waits_on_the_loop_and_hands_slots_on():
+    controller = make_controller()
+
+    async def scenario():
+        held = await controller.aacquire("start")
+        waiting = asyncio.ensure_future(controller.aacquire("finish", shed=False))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        held.release()
+        ticket = await asyncio.wait_for(waiting, 1)
+        ticket.release()
+
+        # A waiter that is cancelled leaves the queue
+        held = await controller.aacquire("start")
+        cancelled = asyncio.ensure_future(controller.aacquire("start"))
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        held.release()
+
+    asyncio.run(scenario())
+    stats = controller.stats()
+    assert stats["in_flight"] == 0
+    assert stats["lanes"]["start"]["queued"] == 0
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from job_queue import FAILED, SUCCEEDED, JobQueue, JobQueueFull
+from job_store import JobStore
+
+
+def finish(queue, job_id):
+    assert queue.wait([job_id], timeout=2)
+    return queue.get(job_id)
+
+
+def test_job_reports_its_result_stage_and_timing():
+    queue = JobQueue("test", max_workers=1)
+
+    def job(progress, x):
+        progress("halfway")
+        return {"double": 2 * x}
+
+    job_id = queue.submit(job, 21)
+    job = finish(queue, job_id)
+    assert job["status"] == SUCCEEDED and job["result"] == {"double": 42}
+    assert job["timing"]["run_seconds"] is not None
+    assert queue.get("unknown") is None
+
+
+def test_failed_job_reports_its_error():
+    queue = JobQueue("test", max_workers=1)
+
+    def job(progress):
+        raise RuntimeError("boom")
+
+    job = finish(queue, queue.submit(job))
+    assert job["status"] == FAILED and job["error"] == "boom"
+    assert queue.stats()["failed"] == 1
+
+
+def test_full_queue_rejects_new_jobs():
+    queue = JobQueue("test", max_workers=1, max_pending=1)
+    release = threading.Event()
+    job_id = queue.submit(lambda progress: release.wait(2))
+    with pytest.raises(JobQueueFull):
+        queue.submit(lambda progress: None)
+    release.set()
+    finish(queue, job_id)
+    queue.submit(lambda progress: None)  # room again
+
+
+def test_wait_times_out_while_a_job_runs():
+    queue = JobQueue("test", max_workers=1)
+    release = threading.Event()
+    job_id = queue.submit(lambda progress: release.wait(2))
+    assert not queue.wait([job_id], timeout=0.05)
+    release.set()
+    assert queue.wait([job_id], timeout=2)
+
+
+@pytest.mark.parametrize("store", [None, "store"])
+def test_one_job_per_claim_key(store):
+    queue = JobQueue("test", max_workers=1, store=JobStore(db_path="") if store else None)
+    job_id, claimed = queue.claim("session:abc")
+    assert claimed
+    # Claimed but not submitted yet: a duplicate joins it
+    assert queue.claim("session:abc") == (job_id, False)
+    queue.submit(lambda progress: None)  # submit() prunes; the claim must survive until it is submitted or released
+    assert queue.claim("session:abc") == (job_id, False)
+
+    queue.submit(lambda progress: "report", job_id=job_id)
+    assert finish(queue, job_id)["result"] == "report"
+    assert queue.claim("session:abc") == (job_id, False)  # done: retries get the same job
+
+
+@pytest.mark.parametrize("store", [None, "store"])
+def test_released_or_failed_claims_can_be_claimed_again(store):
+    queue = JobQueue("test", max_workers=1, store=JobStore(db_path="") if store else None)
+    job_id, _ = queue.claim("key")
+    queue.release("key", job_id)
+    retry_id, claimed = queue.claim("key")
+    assert claimed and retry_id != job_id
+
+    def job(progress):
+        raise RuntimeError("boom")
+
+    queue.submit(job, job_id=retry_id)
+    finish(queue, retry_id)
+    next_id, claimed = queue.claim("key")
+    assert claimed and next_id != retry_id
+
+
+def test_queues_sharing_a_store_see_each_others_jobs_and_claims(tmp_path):
+    # Two worker processes = two queues on one SQLite file
+    path = str(tmp_path / "jobs.db")
+    worker_a, worker_b = JobQueue("critic", store=JobStore(path)), JobQueue("critic", store=JobStore(path))
+    job_id, claimed = worker_a.claim("session:abc")
+    assert claimed
+    assert worker_b.claim("session:abc") == (job_id, False)
+
+    worker_a.submit(lambda progress: {"final_review": "ok"}, job_id=job_id)
+    worker_a.wait([job_id], timeout=2)
+    assert worker_b.get(job_id)["result"] == {"final_review": "ok"}
+    assert JobQueue("answer", store=JobStore(path)).get(job_id) is None  # other queues don't see it
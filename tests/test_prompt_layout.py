@@ -0,0 +1,46 @@
+import pytest
+
+import critic
+import question_generator
+from fake_llm import CANNED_REPORT
+from prompt_layout import check_prefix_stability
+
+REQUESTS = [
+    {"job_country": "Japan", "job_role": "Backend Engineer", "job_company": "Rakuten",
+     "cv_text": "Jane Doe\nBuilt payment APIs in Python.", "interview_transcript": "interviewer: Hi\ncandidate: Hello"},
+    {"job_country": "Brazil", "job_role": "Data Analyst", "job_company": "Nubank",
+     "cv_text": "Sam Lee\nSQL dashboards for newsrooms.", "interview_transcript": "interviewer: Why us?\ncandidate: News."},
+]
+# Values that only exist in one request; none of them may reach the static prefix
+PER_REQUEST_VALUES = ["Rakuten", "Nubank", "Backend Engineer", "Data Analyst", "Jane Doe", "Sam Lee",
+                      "payment APIs", "newsrooms", "Brazil", "Why us?"]
+SEGMENT = {"question": "Why this role?", "category": "general", "answer": "I like it."}
+
+
+def _critic_inputs(name, request):
+    if name == "segment":
+        return critic.segment_inputs(request, SEGMENT)
+    if name == "reduce":
+        return critic.reduce_inputs(request, [{"topic": "Teamwork", "score": 4}])
+    return critic.section_inputs(critic.critic_inputs(request), CANNED_REPORT)
+
+
+PROMPTS = [(f"questions:{name}", lambda name=name: question_generator.question_prompts()[name],
+            question_generator.question_inputs) for name in question_generator.question_prompts()]
+PROMPTS += [(f"critic:{name}", lambda name=name: critic.chain_prompt(name),
+             lambda request, name=name: _critic_inputs(name, request)) for name in critic.CHAIN_SPECS]
+
+
+@pytest.mark.parametrize("name, get_prompt, make_inputs", PROMPTS, ids=[name for name, _, _ in PROMPTS])
+def test_static_prefix_is_identical_for_different_requests(name, get_prompt, make_inputs):
+    prompt = get_prompt()
+    rendered = [prompt.format_messages(**make_inputs(request)) for request in REQUESTS]
+    prefixes = [messages[0].content for messages in rendered]
+
+    assert prefixes[0] == prefixes[1]
+    assert prefixes[0] == prompt.messages[0].content
+    for value in PER_REQUEST_VALUES:
+        assert value not in prefixes[0], f"{value!r} leaked into the static prefix of {name}"
+    # ...while the variable part really does differ per request
+    assert rendered[0][1].content != rendered[1][1].content
+    assert check_prefix_stability(prompt, make_inputs(REQUESTS[0]), make_inputs(REQUESTS[1]))["stable"]
@@ -0,0 +1,66 @@
+import time
+
+import question_generator
+from question_cache import QuestionCache, make_cache_key
+
+QUESTIONS = {"general_questions": ["Why us?"], "cv_based_questions": ["Tell me about X."], "technical_questions": ["SQL?"]}
+STATE = {"cv_text": "Jane Doe\nBuilt payment APIs in Python.", "job_role": "Backend Engineer",
+         "job_company": "Rakuten", "job_country": "Japan"}
+
+
+def test_key_ignores_case_and_whitespace_but_not_content_or_version():
+    key = make_cache_key("Jane  Doe\nPython", "Backend Engineer", "Rakuten", "Japan", version="v1")
+    assert key == make_cache_key("jane doe python ", " backend   engineer", "RAKUTEN", "japan", version="v1")
+    assert key != make_cache_key("Jane Doe\nJava", "Backend Engineer", "Rakuten", "Japan", version="v1")
+    assert key != make_cache_key("Jane  Doe\nPython", "Backend Engineer", "Rakuten", "Japan", version="v2")
+
+
+def test_hit_returns_a_copy():
+    cache = QuestionCache(disk_dir=None)
+    cache.put("k", QUESTIONS)
+    cache.get("k")["general_questions"].append("mutated")
+    assert cache.get("k") == QUESTIONS
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QuestionCache(max_entries=2, disk_dir=None)
+    cache.put("a", QUESTIONS)
+    cache.put("b", QUESTIONS)
+    cache.get("a")  # "b" is now the oldest
+    cache.put("c", QUESTIONS)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    cache = QuestionCache(ttl_seconds=10, disk_dir=None)
+    cache.put("k", QUESTIONS)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    QuestionCache(disk_dir=str(tmp_path)).put("k", QUESTIONS)
+    restarted = QuestionCache(disk_dir=str(tmp_path))
+    assert restarted.get("k") == QUESTIONS
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_repeat_start_is_served_from_the_cache_without_compacting_the_cv(fake_llm, monkeypatch):
+    first = question_generator.generate_questions_node(dict(STATE))
+    assert first["cached"] is False and first["questions"]["technical_questions"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("a cache hit must not reach the LLM or the CV compactor")
+
+    monkeypatch.setattr(question_generator, "generate_questions", fail)
+    monkeypatch.setattr(question_generator, "prepare_cv", fail)
+    second = question_generator.generate_questions_node({**STATE, "job_company": " rakuten "})
+    assert second["cached"] is True
+    assert second["questions"] == first["questions"]
+    assert second["cv_compact"] is None and second["cv_tokens"] is None
@@ -0,0 +1,91 @@
+import itertools
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientLLM
+
+_names = itertools.count()
+
+
+class StubModel:
+    """A chat model stand-in that fails its first 'failures' calls; breakers are per model_name."""
+
+    def __init__(self, failures=0, answer="ok"):
+        self.model_name = f"stub-{next(_names)}"
+        self.failures, self.answer, self.calls = failures, answer, 0
+
+    def invoke(self, input, config=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("provider down")
+        return self.answer
+
+
+def test_breaker_opens_after_the_threshold_and_lets_one_trial_through(monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 31)
+    assert breaker.allow()  # the half-open trial
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # only one at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_failed_trial_reopens_and_an_ignored_one_frees_the_trial(monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 31)
+    assert breaker.allow()
+    breaker.record_ignored()  # e.g. our own rate limiter said no: not the provider's fault
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_fails_fast_without_a_fallback():
+    primary = StubModel(failures=100)
+    llm = ResilientLLM("test", primary, hedging=False)
+    llm.breaker.failure_threshold = 2
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            llm.invoke("hi")
+    with pytest.raises(CircuitOpenError):
+        llm.invoke("hi")
+    assert primary.calls == 2
+
+
+def test_failures_go_to_the_fallback_model():
+    primary, fallback = StubModel(failures=100), StubModel(answer="from fallback")
+    llm = ResilientLLM("test", primary, fallback=fallback, hedging=False)
+    llm.breaker.failure_threshold = 1
+    assert llm.invoke("hi") == "from fallback"  # the failed call itself
+    assert llm.invoke("hi") == "from fallback"  # breaker open: the primary isn't even tried
+    assert primary.calls == 1 and fallback.calls == 2
+
+
+def test_slow_primary_hits_the_deadline():
+    class Slow(StubModel):
+        def invoke(self, input, config=None):
+            time.sleep(0.5)
+            return "late"
+
+    llm = ResilientLLM("test", Slow(), deadline_seconds=0.1, hedging=False)
+    with pytest.raises(TimeoutError):
+        llm.invoke("hi")
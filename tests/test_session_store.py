@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from session_store import InMemorySessionStore, SQLiteSessionStore, make_session_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return InMemorySessionStore(**kwargs)
+        return SQLiteSessionStore(db_path=str(tmp_path / "sessions.db"), **kwargs)
+    return make
+
+
+def test_create_get_delete(make_store):
+    store = make_store()
+    session_id = store.create({"cv_text": "Jane", "questions": {"general_questions": ["Why us?"]}})
+    assert session_id.startswith("session_")
+    assert store.get(session_id)["questions"] == {"general_questions": ["Why us?"]}
+    assert store.delete(session_id)
+    assert not store.delete(session_id)
+    assert store.get(session_id) is None
+    stats = store.stats()
+    assert (stats["created"], stats["deleted"], stats["hits"], stats["misses"]) == (1, 1, 1, 1)
+
+
+def test_update_applies_the_change_and_skips_missing_sessions(make_store):
+    store = make_store()
+    session_id = store.create({"answer_evaluations": []})
+    updated = store.update(session_id, lambda data: data["answer_evaluations"].append({"score": 4}))
+    assert updated == {"answer_evaluations": [{"score": 4}]}
+    assert store.get(session_id) == updated
+    assert store.update("session_missing", lambda data: data.clear()) is None
+
+
+def test_sessions_expire_after_the_ttl(make_store, monkeypatch):
+    store = make_store(ttl_seconds=60)
+    session_id = store.create({"cv_text": "Jane"})
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert store.get(session_id) is None
+    assert store.stats()["size"] == 0
+
+
+def test_oldest_sessions_are_evicted_over_the_cap(make_store, monkeypatch):
+    store = make_store(max_sessions=2)
+    clock = iter(range(1_000_000, 1_000_100))
+    monkeypatch.setattr(time, "time", lambda: next(clock))  # distinct write times, also for SQLite
+    first, second, third = (store.create({"n": n}) for n in range(3))
+    assert store.get(first) is None
+    assert store.get(second) == {"n": 1} and store.get(third) == {"n": 2}
+    assert store.stats()["evictions"] == 1
+
+
+def test_factory_rejects_unknown_backends():
+    assert make_session_store("memory").backend == "memory"
+    with pytest.raises(ValueError):
+        make_session_store("redis")
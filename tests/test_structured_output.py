@@ -0,0 +1,73 @@
+from typing import Dict, List
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+from pydantic import BaseModel, Field
+
+from structured_output import RepairingJsonOutputParser, conform, is_truncated, repair_json
+
+
+class Example(BaseModel):
+    summary: str = Field(description="summary")
+    items: List[str] = Field(description="items")
+    scores: Dict[str, Dict[str, str]] = Field(description="scores")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('Sure! ```json\n{"summary": "ok", "items": ["a", "b",],}\n``` Hope this helps.',
+     {"summary": "ok", "items": ["a", "b"]}),
+    ("{'summary': 'ok', 'flag': True, 'extra': None}", {"summary": "ok", "flag": True, "extra": None}),
+    ('{"summary": "line one\nline two"}', {"summary": "line one\nline two"}),
+    # repairs must leave string contents alone
+    ('{"summary": "Said True, then [a, b,] and None",}', {"summary": "Said True, then [a, b,] and None"}),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+
+def test_truncated_output_drops_the_half_written_item():
+    text = '{"summary": "cut off", "items": ["complete item", "half an ite'
+    assert is_truncated(text)
+    assert repair_json(text) == {"summary": "cut off", "items": ["complete item"]}
+
+
+def test_repair_json_gives_up_on_text_without_json():
+    with pytest.raises(ValueError):
+        repair_json("I'm sorry, I can't help with that.")
+
+
+def test_conform_fixes_key_names_wrapping_and_types():
+    clean, changed = conform({"Example": {"Summary": 7, "items": "just one"}}, Example, ("summary",))
+    assert clean == {"summary": "7", "items": ["just one"], "scores": {}}
+    assert changed
+    assert conform({"summary": "ok", "items": [], "scores": {}}, Example) == ({"summary": "ok", "items": [], "scores": {}}, False)
+
+
+def test_conform_rejects_missing_required_fields():
+    with pytest.raises(ValueError, match="summary"):
+        conform({"items": ["no summary"]}, Example, ("summary",))
+
+
+class FixingLLM:
+    def __init__(self, answer):
+        self.answer, self.prompts = answer, []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return self.answer
+
+
+def test_parser_asks_the_fix_llm_only_when_local_repair_fails():
+    fixer = FixingLLM('{"summary": "fixed", "items": ["a"]}')
+    parser = RepairingJsonOutputParser(pydantic_object=Example, required_fields=("summary",), fix_llm=fixer)
+
+    assert parser.parse('{"summary": "ok", "items": ["a",],}')["summary"] == "ok"
+    assert fixer.prompts == []
+    assert parser.parse('{"items": ["no summary"]}')["summary"] == "fixed"
+    assert len(fixer.prompts) == 1 and "no summary" in fixer.prompts[0]
+
+
+def test_parser_raises_when_nothing_can_fix_the_output():
+    parser = RepairingJsonOutputParser(pydantic_object=Example, required_fields=("summary",))
+    with pytest.raises(OutputParserException):
+        parser.parse('{"items": ["no summary"]}')
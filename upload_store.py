@@ -0,0 +1,384 @@
+# upload_store.py
+# Where /api/upload keeps the files it receives.
+# It used to be a flat dump in uploads/ plus one line per upload in uploads/metadata.txt:
+# finding a file meant scanning the text file, and every re-upload of the same CV
+# was saved and parsed again.
+#
+# Now:
+#   - files are stored once, named by the SHA-256 of their content:
+#       uploads/blobs/ab/ab12...ef.pdf
+#       uploads/blobs/ab/ab12...ef.extract.json   <- cached helpers.extract_document() output
+#   - every upload (who, which role/company, when) is a row in a SQLite table with
+#     indexes, so find() doesn't scan anything
+#   - a re-upload of a known file skips both the write and the parsing
+#   - blobs nobody uploaded within UPLOAD_RETENTION_DAYS are deleted, and the least
+#     recently used ones go first once the store is over UPLOAD_MAX_BYTES
+import os
+import json
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from helpers import MAX_CHARS, MAX_FILE_BYTES, MAX_PAGES, PAGE_BREAK, DocumentTooLarge, extract_document
+from instrumentation import get_logger, registry
+
+logger = get_logger("upload_store")
+
+# --- 1. Config ---
+DEFAULT_ROOT = os.environ.get("UPLOAD_DIR", "uploads")
+DEFAULT_RETENTION_SECONDS = float(os.environ.get("UPLOAD_RETENTION_DAYS", "30")) * 86400
+DEFAULT_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+EVICT_INTERVAL_SECONDS = float(os.environ.get("UPLOAD_EVICT_INTERVAL_SECONDS", "600"))
+# Size-based eviction leaves blobs used this recently alone: their save() may still be extracting them
+IN_FLIGHT_GRACE_SECONDS = float(os.environ.get("UPLOAD_IN_FLIGHT_GRACE_SECONDS", "300"))
+
+UPLOADS = registry.counter("mvita_uploads_total", "Uploaded documents by outcome (stored, deduplicated)")
+EXTRACTIONS = registry.counter("mvita_upload_extractions_total", "Text extractions by source (parsed, cached)")
+
+_CHUNK = 1024 * 1024
+
+
+# --- 2. The store ---
+class UploadStore:
+    """
+    Content-addressed files + a SQLite index of uploads. Safe to share between threads
+    and worker processes (one connection per thread, WAL, atomic file renames).
+    """
+
+    def __init__(
+        self,
+        root: str = DEFAULT_ROOT,
+        db_path: Optional[str] = None,
+        retention_seconds: float = DEFAULT_RETENTION_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.db_path = db_path or os.path.join(root, "uploads.db")
+        self.retention_seconds = retention_seconds
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._evict_lock = threading.Lock()
+        self._last_eviction = 0.0
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    ext TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS blobs_last_used_at ON blobs (last_used_at);
+                CREATE TABLE IF NOT EXISTS uploads (
+                    upload_id TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL REFERENCES blobs (sha256),
+                    user TEXT NOT NULL,
+                    job_role TEXT NOT NULL,
+                    job_company TEXT NOT NULL,
+                    original_name TEXT NOT NULL,
+                    uploaded_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS uploads_sha256 ON uploads (sha256);
+                CREATE INDEX IF NOT EXISTS uploads_user ON uploads (user, uploaded_at);
+                CREATE INDEX IF NOT EXISTS uploads_job ON uploads (job_role, job_company, uploaded_at);
+                CREATE INDEX IF NOT EXISTS uploads_uploaded_at ON uploads (uploaded_at);
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # A. Public API
+    def save(self, stream: BinaryIO, original_name: str, user: str = "anonymous", job_role: str = "",
+             job_company: str = "") -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Stores an uploaded file and returns (upload record, extraction).
+        The record has "deduplicated" / "extraction_cached" telling what could be skipped.
+        Raises DocumentTooLarge / ValueError like helpers.extract_document().
+        """
+        ext = os.path.splitext(original_name)[1].lower()
+        if ext not in (".pdf", ".docx"):
+            raise ValueError("Unsupported file format. Only PDF and DOCX allowed.")
+
+        # A1. Hash while copying to a temp file (the content isn't known until it's all read)
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}{ext}")
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in iter(lambda: stream.read(_CHUNK), b""):
+                    size += len(chunk)
+                    if size > MAX_FILE_BYTES:
+                        raise DocumentTooLarge(f"File is over the limit of {MAX_FILE_BYTES} bytes.")
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            blob_path = self.blob_path(sha256, ext)
+
+            # A2. Index it. The check for a known blob, its touch and the upload row go in one
+            # transaction; evict() deletes a blob's rows and files in one too, so a blob can't
+            # disappear between "it exists" and "this upload points at it"
+            now = time.time()
+            record = {
+                "upload_id": uuid.uuid4().hex,
+                "sha256": sha256,
+                "user": user,
+                "job_role": job_role,
+                "job_company": job_company,
+                "original_name": original_name,
+                "uploaded_at": now,
+            }
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            placed = False
+            try:
+                known = conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+                deduplicated = known is not None and os.path.exists(blob_path)
+                if not deduplicated:
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    os.replace(tmp_path, blob_path)
+                    placed = True
+                conn.execute(
+                    "INSERT INTO blobs (sha256, ext, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (sha256) DO UPDATE SET last_used_at = excluded.last_used_at",
+                    (sha256, ext, size, now, now),
+                )
+                conn.execute(
+                    "INSERT INTO uploads (upload_id, sha256, user, job_role, job_company, original_name, uploaded_at) "
+                    "VALUES (:upload_id, :sha256, :user, :job_role, :job_company, :original_name, :uploaded_at)",
+                    record,
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                if placed:
+                    self._remove_files(sha256, ext)
+                raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        # A3. Parse only if no earlier upload did (with the same limits)
+        try:
+            extraction, extraction_cached = self._extraction(sha256, ext)
+        except Exception:
+            self._forget(record["upload_id"], sha256, ext)  # don't keep uploads (or files) we can't read
+            raise
+
+        UPLOADS.inc(outcome="deduplicated" if deduplicated else "stored")
+        self.maybe_evict(now)
+        return {**record, "filename": os.path.basename(blob_path), "deduplicated": deduplicated,
+                "extraction_cached": extraction_cached}, extraction
+
+    def find(self, user: Optional[str] = None, job_role: Optional[str] = None, job_company: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Uploads matching every given filter, newest first."""
+        clauses, params = [], []
+        for column, value in (("user", user), ("job_role", job_role), ("job_company", job_company)):
+            if value is not None:
+                clauses.append(f"u.{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("u.uploaded_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("u.uploaded_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT u.*, b.ext, b.size FROM uploads u JOIN blobs b ON b.sha256 = u.sha256 {where} "
+            "ORDER BY u.uploaded_at DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def blob_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], f"{sha256}{ext}")
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connection()
+        blobs, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        uploads = conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+        return {
+            "uploads": uploads,
+            "blobs": blobs,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "retention_seconds": self.retention_seconds,
+            "dedup_ratio": round(1 - blobs / uploads, 4) if uploads else 0.0,
+        }
+
+    # B. Retention
+    def maybe_evict(self, now: Optional[float] = None) -> None:
+        now = now or time.time()
+        if now - self._last_eviction < EVICT_INTERVAL_SECONDS or not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_eviction = now
+            self.evict(now)
+        except Exception as e:
+            logger.warning(f"Upload eviction failed: {e}")
+        finally:
+            self._evict_lock.release()
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """Deletes expired blobs, then the least recently used ones while over max_bytes. Returns how many."""
+        now = now or time.time()
+        conn = self._connection()
+        cutoff = now - self.retention_seconds
+        victims = conn.execute(
+            "SELECT sha256, ext, last_used_at FROM blobs WHERE last_used_at < ?", (cutoff,)
+        ).fetchall()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs WHERE last_used_at >= ?", (cutoff,)).fetchone()[0]
+        if total > self.max_bytes:
+            # Blobs touched in the last IN_FLIGHT_GRACE_SECONDS may still be extracted by their save()
+            for row in conn.execute("SELECT sha256, ext, last_used_at, size FROM blobs "
+                                    "WHERE last_used_at >= ? AND last_used_at < ? ORDER BY last_used_at",
+                                    (cutoff, now - IN_FLIGHT_GRACE_SECONDS)):
+                if total <= self.max_bytes:
+                    break
+                victims.append(row)
+                total -= row["size"]
+
+        evicted = 0
+        for row in victims:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Only if nobody uploaded it since we looked (save() touches it in its own transaction);
+                # the files go in the same transaction, so no save() can re-add the blob meanwhile
+                deleted = conn.execute("DELETE FROM blobs WHERE sha256 = ? AND last_used_at = ?",
+                                       (row["sha256"], row["last_used_at"])).rowcount
+                if deleted:
+                    conn.execute("DELETE FROM uploads WHERE sha256 = ?", (row["sha256"],))
+                    self._remove_files(row["sha256"], row["ext"])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            evicted += deleted
+        if evicted:
+            logger.info(f"Evicted {evicted} uploaded files")
+        return evicted
+
+    # C. Internals
+    def _extraction(self, sha256: str, ext: str) -> Tuple[Dict[str, Any], bool]:
+        blob_path = self.blob_path(sha256, ext)
+        cache_path = os.path.join(os.path.dirname(blob_path), f"{sha256}.extract.json")
+        # Extractions cached with other limits, or before PDF pages ended with PAGE_BREAK, are parsed again
+        limits = [MAX_PAGES, MAX_CHARS, PAGE_BREAK]
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("limits") == limits:
+                EXTRACTIONS.inc(source="cached")
+                return cached["extraction"], True
+        except (OSError, ValueError):
+            pass
+
+        extraction = extract_document(blob_path)
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"limits": limits, "extraction": extraction}, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache the extracted text of {sha256}: {e}")
+        EXTRACTIONS.inc(source="parsed")
+        return extraction, False
+
+    def _forget(self, upload_id: str, sha256: str, ext: str) -> None:
+        """Drops an upload, and its blob (rows and files) if no other upload uses it."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+            deleted = conn.execute(
+                "DELETE FROM blobs WHERE sha256 = ? AND NOT EXISTS (SELECT 1 FROM uploads WHERE sha256 = ?)",
+                (sha256, sha256),
+            ).rowcount
+            if deleted:
+                self._remove_files(sha256, ext)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _remove_files(self, sha256: str, ext: str) -> None:
+        blob_path = self.blob_path(sha256, ext)
+        for path in (blob_path, os.path.join(os.path.dirname(blob_path), f"{sha256}.extract.json")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def import_legacy(self, metadata_path: Optional[str] = None) -> int:
+        """Copies the files listed in the old uploads/metadata.txt into the store. Returns how many."""
+        metadata_path = metadata_path or os.path.join(self.root, "metadata.txt")
+        imported = 0
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = [part.strip() for part in line.split(" | ")]
+                if len(parts) != 5:
+                    continue
+                uploaded_at, user, job_role, job_company, stored_name = parts
+                path = os.path.join(self.root, stored_name)
+                if not os.path.exists(path):
+                    continue
+                try:
+                    with open(path, "rb") as blob:
+                        record, _ = self.save(blob, stored_name, user, job_role, job_company)
+                except Exception as e:
+                    logger.warning(f"Could not import {stored_name}: {e}")
+                    continue
+                try:  # keep the original upload time
+                    self._connection().execute("UPDATE uploads SET uploaded_at = ? WHERE upload_id = ?",
+                                               (datetime.fromisoformat(uploaded_at).timestamp(), record["upload_id"]))
+                except ValueError:
+                    pass
+                imported += 1
+        return imported
+
+
+if __name__ == "__main__":
+    import io
+    import sys
+    import tempfile
+    import docx
+
+    if sys.argv[1:] == ["--import-legacy"]:
+        print(f"Imported {UploadStore().import_legacy()} files from uploads/metadata.txt")
+        sys.exit(0)
+
+    print("--- Testing upload_store ---")
+    with tempfile.TemporaryDirectory() as root:
+        document = docx.Document()
+        document.add_paragraph("Jane Doe - Backend Engineer. Python, Flask, SQL.")
+        buffer = io.BytesIO()
+        document.save(buffer)
+        data = buffer.getvalue()
+
+        store = UploadStore(root=root, retention_seconds=3600)
+        first, extraction = store.save(io.BytesIO(data), "cv.docx", "jane", "Backend Engineer", "Acme")
+        again, _ = store.save(io.BytesIO(data), "cv (1).docx", "jane", "Data Engineer", "Acme")
+        print("text:", extraction["text"].strip())
+        print("first: deduplicated", first["deduplicated"], "| cached", first["extraction_cached"])
+        print("again: deduplicated", again["deduplicated"], "| cached", again["extraction_cached"])
+        print("jane's uploads:", [u["job_role"] for u in store.find(user="jane")])
+        print("Acme data roles:", len(store.find(job_role="Data Engineer", job_company="Acme")))
+        print(store.stats())
+        print("evicted after retention:", store.evict(now=time.time() + 7200), store.stats()["blobs"])